@@ -35,6 +35,7 @@ def create_abricate_task(gene, prefix, database, threads, job_type,
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (threads, QUEUE),
+        inputs=[gene],
         script="""
 export PATH={abricate}:$PATH
 abricate {gene} --threads {threads} \\
@@ -83,12 +84,12 @@ def create_abricate_tasks(gene, prefix, database, threads,
     return tasks, abricates, option
 
 
-def run_abricate(gene, prefix, threads, job_type, concurrent, refresh,
-                work_dir="", out_dir="", database="card;vfdb"):
-
-    work_dir = mkdir(work_dir)
-    out_dir = mkdir(out_dir)
-    gene = check_path(gene)
+def create_abricate_dag(gene, prefix, threads, job_type, work_dir, out_dir,
+                        database="card;vfdb"):
+    """
+    create the DAG of abricate, the gene file is not checked
+    :return: dag, options
+    """
     options = {
         "software": OrderedDict(),
         "database": OrderedDict()
@@ -108,6 +109,26 @@ def run_abricate(gene, prefix, threads, job_type, concurrent, refresh,
     for i in tasks:
         dag.add_task(i)
 
+    return dag, options
+
+
+def run_abricate(gene, prefix, threads, job_type, concurrent, refresh,
+                work_dir="", out_dir="", database="card;vfdb"):
+
+    work_dir = mkdir(work_dir)
+    out_dir = mkdir(out_dir)
+    gene = check_path(gene)
+
+    dag, options = create_abricate_dag(
+        gene=gene,
+        prefix=prefix,
+        threads=threads,
+        job_type=job_type,
+        work_dir=work_dir,
+        out_dir=out_dir,
+        database=database
+    )
+
     do_dag(dag, concurrent_tasks=concurrent, refresh_time=refresh)
 
     return options
@@ -125,8 +146,8 @@ def advanal_hlep_args(parser):
         help="Maximum number of jobs concurrent  (default: 10)")
     parser.add_argument("--refresh", metavar="INT", type=int, default=30,
         help="Refresh time of log in seconds  (default: 30)")
-    parser.add_argument("--job_type", choices=["sge", "local"], default="local",
-        help="Jobs run on [sge, local]  (default: local)")
+    parser.add_argument("--job_type", choices=["sge", "slurm", "local"], default="local",
+        help="Jobs run on [sge, slurm, local]  (default: local)")
     parser.add_argument("--work_dir", metavar="DIR", default=".",
         help="Work directory (default: current directory)")
     parser.add_argument("--out_dir", metavar="DIR", default=".",
@@ -11,13 +11,14 @@ import shutil
 
 from pmgap.config import *
 from pmgap.common import mkdir, check_path, check_paths, rm #read_config
-from pmgap.ngs_qc import run_ngs_qc
-from pmgap.assemble import run_assembly
-from pmgap.get_mito import run_get_mito
-from pmgap.annotate import run_annotation
-from pmgap.abricate import run_abricate
-from pmgap.backup import backup
-from pmgap.parser import add_all_args
+from thirdparty.dagflow import DAG, Task, do_dag
+from pmgap.ngs_qc import run_ngs_qc, create_ngs_qc_dag
+from pmgap.assemble import run_assembly, create_assembly_dag
+from pmgap.get_mito import run_get_mito, create_get_mito_dag
+from pmgap.annotate import run_annotation, create_annotation_dag
+from pmgap.abricate import run_abricate, create_abricate_dag
+from pmgap.backup import backup, write_readme, create_md5sum_task
+from pmgap.parser import add_all_args, set_workflow
 
 LOG = logging.getLogger(__name__)
 
@@ -27,7 +28,7 @@ __email__ = "invicoun@foxmail.com"
 __all__ = []
 
 
-def run_report(prefix, project, id, platform, author, reviewer, out_dir, work_dir):
+def write_report(prefix, project, id, platform, author, reviewer, out_dir, work_dir):
 
     shell = """
 {script}/report_ngs.py {work_dir}/report_config.cfg \\
@@ -79,19 +80,213 @@ cell_num=1
     fs.close()
     fc.close()
 
+    return run
+
+
+def run_report(prefix, project, id, platform, author, reviewer, out_dir, work_dir):
+
+    run = write_report(prefix, project, id, platform, author, reviewer, out_dir, work_dir)
     os.system("sh %s" % run)
 
 
+def create_report_task(prefix, project, id, platform, author, reviewer, out_dir, work_dir):
+
+    run = write_report(prefix, project, id, platform, author, reviewer, out_dir, work_dir)
+
+    task = Task(
+        id="report",
+        work_dir=work_dir,
+        type="local",
+        option="-pe smp 1",
+        script="""
+sh {run}
+""".format(run=run)
+    )
+
+    return task
+
+
+def add_stage(dag, stage, *upstream):
+    """
+    add the tasks of stage DAG to dag, the first tasks of stage depend on upstream
+    :param dag: the combined DAG
+    :param stage: DAG of a stage
+    :param upstream: tasks producing the input files of stage
+    :return: tasks of stage
+    """
+    tasks = list(stage.tasks.values())
+
+    for task in tasks:
+        if not task.depends:
+            task.set_upstream(*upstream)
+
+    dag.add_task(*tasks)
+
+    return tasks
+
+
+def create_all_dag(prefix, taxon, platform, reads1, reads2, sequencer, reads,
+                   database, project, projectid, job_type, work_dir, out_dir,
+                   trim=3, thread=4, gc=20, base="all", score=0, gcode=11):
+    """
+    create one DAG for all steps, the tasks are linked by the files they use,
+    so the independent tasks (eg: blast of reads, depth, abricate) run along
+    with the assembly and annotation
+    :return: dag, options
+    """
+    work_dict = {
+        "data": "01_Data",
+        "asm": "02_Assembly",
+        "ann": "03_Annotation",
+    }
+
+    result_dir = mkdir(os.path.join(out_dir, "result"))
+
+    for k, v in work_dict.items():
+        mkdir(os.path.join(work_dir, v))
+        mkdir(os.path.join(result_dir, v))
+
+    options = {
+        "software": OrderedDict(),
+        "database": OrderedDict()
+    }
+
+    dag = DAG("pmgap")
+
+    qc_dag, clean1, clean2, option = create_ngs_qc_dag(
+        reads1=reads1,
+        reads2=reads2,
+        prefix=prefix,
+        trim=trim,
+        thread=thread,
+        job_type=job_type,
+        work_dir=os.path.join(work_dir, work_dict["data"]),
+        out_dir=os.path.join(result_dir, work_dict["data"])
+    )
+    add_stage(dag, qc_dag)
+    options["software"].update(option["software"])
+    read_tasks = [dag.tasks["ngs_qc"]]
+
+    if taxon in ["mitochondrion", "plastid", "viruses"] and database:
+        if taxon in ["viruses"]:
+            gc = 0
+        database = check_path(database)
+        LOG.info("database:%s" % database)
+
+        if reads:
+            reads = check_path(reads)
+
+        mito_dag, clean1, clean2, reads, option = create_get_mito_dag(
+            prefix=prefix,
+            database=database,
+            platform=platform,
+            read1=clean1,
+            read2=clean2,
+            sequencer=sequencer,
+            reads=reads,
+            job_type=job_type,
+            work_dir=os.path.join(work_dir, work_dict["asm"]),
+            out_dir=os.path.join(result_dir, work_dict["asm"]),
+            thread=thread,
+            gc=gc,
+            base=base,
+            score=score
+        )
+        dag.add_task(*mito_dag.tasks.values())
+        dag.tasks["get_ngs"].set_upstream(*read_tasks)
+        options["software"].update(option["software"])
+        read_tasks = list(mito_dag.tasks.values())
+
+    asm_dag, genome, option = create_assembly_dag(
+        prefix=prefix,
+        read1=clean1,
+        read2=clean2,
+        reads=reads,
+        thread=thread,
+        job_type=job_type,
+        work_dir=os.path.join(work_dir, work_dict["asm"]),
+        out_dir=os.path.join(result_dir, work_dict["asm"])
+    )
+    add_stage(dag, asm_dag, *read_tasks)
+    options["software"].update(option["software"])
+
+    ann_dag, gff, protein, gene, option = create_annotation_dag(
+        genome=genome,
+        prefix=prefix,
+        locus_tag="",
+        kingdom=taxon,
+        organism="Unknow",
+        strain=prefix,
+        template="",
+        gcode=gcode,
+        threads=thread,
+        evalue=1e-05,
+        coverage=30,
+        job_type=job_type,
+        work_dir=os.path.join(work_dir, work_dict["ann"]),
+        out_dir=os.path.join(result_dir, work_dict["ann"])
+    )
+    add_stage(dag, ann_dag, dag.tasks["circular"])
+
+    if "plasmid" in taxon:
+        abricate_dag, option = create_abricate_dag(
+            gene=gene,
+            prefix=prefix,
+            threads=thread,
+            job_type=job_type,
+            work_dir=mkdir(os.path.join(work_dir, "04_Abricate")),
+            out_dir=mkdir(os.path.join(result_dir, "04_Abricate")),
+            database="card;vfdb"
+        )
+        add_stage(dag, abricate_dag, dag.tasks["merge_annotation"])
+
+    with open(os.path.join(result_dir, "pmgap.json"), "w") as fh:
+        json.dump(options, fh, indent=2)
+
+    report_task = create_report_task(
+        prefix=prefix,
+        project=project,
+        id=projectid,
+        platform=platform,
+        author="百易汇能",
+        reviewer="百易汇能",
+        out_dir=out_dir,
+        work_dir=work_dir)
+    report_task.set_upstream(dag.tasks["ngs_qc"], dag.tasks["depth"], dag.tasks["merge_annotation"])
+
+    # the md5 of results is the last one
+    write_readme(result_dir, prefix)
+    md5sum_task = create_md5sum_task(prefix, projectid, "local", work_dir, out_dir)
+    md5sum_task.set_upstream(report_task, *dag.tasks.values())
+
+    dag.add_task(report_task, md5sum_task)
+
+    return dag, options
+
+
 def run_all(prefix, taxon, platform, reads1, reads2, sequencer, reads,
             database, project, projectid, job_type, work_dir, out_dir,
             concurrent=10, refresh=15, trim=3, thread=4, gc=20,
-            base="all", score=0, gcode=11):
+            base="all", score=0, gcode=11, single_dag=False):
 
     work_dir = mkdir(work_dir)
     out_dir = mkdir(out_dir)
     reads1 = check_paths(reads1)
     reads2 = check_paths(reads2) 
 
+    if single_dag:
+        LOG.info("run all steps in one DAG")
+        dag, options = create_all_dag(
+            prefix=prefix, taxon=taxon, platform=platform,
+            reads1=reads1, reads2=reads2, sequencer=sequencer, reads=reads,
+            database=database, project=project, projectid=projectid,
+            job_type=job_type, work_dir=work_dir, out_dir=out_dir,
+            trim=trim, thread=thread, gc=gc, base=base, score=score, gcode=gcode
+        )
+        do_dag(dag, concurrent_tasks=concurrent, refresh_time=refresh)
+
+        return 0
+
     work_dict = {
         "data": "01_Data",
         "asm": "02_Assembly",
@@ -222,6 +417,7 @@ def run_all(prefix, taxon, platform, reads1, reads2, sequencer, reads,
 
 def _all(args):
 
+    set_workflow(args)
     run_all(prefix=args.prefix,
             taxon=args.taxon,
             platform=args.platform,
@@ -243,6 +439,8 @@ def _all(args):
             base=args.base,
             score=args.score,
             gcode=args.gcode,
+            # the steps are predicted in one DAG
+            single_dag=args.single_dag or args.dry_run,
     )
 
 
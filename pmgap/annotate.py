@@ -13,11 +13,11 @@ import argparse
 import logging
 import json
 
-from thirdparty.dagflow import Task, DAG, do_dag
+from thirdparty.dagflow import Task, PythonTask, DAG, do_dag
 from pmgap import __author__, __email__, __version__
 from pmgap.config import *
 from pmgap.common import mkdir, check_paths, get_version
-from pmgap.parser import add_annotation_args
+from pmgap.parser import add_annotation_args, set_workflow
 from pmgap.run_CDS import create_cds_annotation_dag
 
 
@@ -45,6 +45,8 @@ def create_prodigal_task(genome, prefix, work_dir=".", out_dir=".",
         work_dir=work_dir,
         type=job_type,
         option="-pe smp 1 %s" % QUEUE,
+        inputs=[genome],
+        tools=option,
         script="""
 export PATH={prodigal}:$PATH
 prodigal -f gff -g {gcode} -p {p} -i {genome} -o {prefix}.prodigal.gff3
@@ -122,6 +124,7 @@ def create_genemarks_task(genome, kingdom, prefix, work_dir=".", out_dir=".",
         work_dir=work_dir,
         type=job_type,
         option="-pe smp 1 %s" % QUEUE,
+        inputs=[genome],
         script="""
 export PATH={genemarks}:{python}:$PATH
 #cp {genemarks}/gm_key_64 ~/.gm_key
@@ -145,45 +148,28 @@ python {script}/get_gene.py --gff {prefix}.merge.gff3 --genome {genome} \\
     return task, protein, gff3
 
 
-def run_annotation(genome, prefix, locus_tag="NPGAP", organism="", strain="", template="",
-                   kingdom="Bacteria", gcode=11, threads=1, evalue=1e-06, coverage=30,
-                   job_type="local", refresh=30, concurrent=10, work_dir=".", out_dir="."):
-    if not locus_tag:
-        locus_tag = prefix
-    LOG.info("ANNOTATE-1: gene predict\n")
-    dag = DAG("gene_predict")
-
-    genome = check_paths(genome)
-    work_dict = {
-        "stru": "Structure",
-        "func": "Function",
-    }
-    work_dir = mkdir(work_dir)
-    out_dir = mkdir(out_dir)
-
-    for k, v in work_dict.items():
-        mkdir(os.path.join(work_dir, v))
-        if "Structure" in v:
-            continue
-        mkdir(os.path.join(out_dir, v))
-
+def create_gene_predict_task(genome, prefix, kingdom, gcode, locus_tag,
+                             job_type, work_dir, out_dir):
+    """
+    create the task of gene prediction, prodigal for bacteria and genemarks for viruses
+    :return: task, options, protein, gff3
+    """
     options = {
         "software": OrderedDict(),
         "database": OrderedDict()
     }
 
     if kingdom != "viruses" and kingdom != "viral":
-        prodigal_task, option, protein, gff3 = create_prodigal_task(
+        task, option, protein, gff3 = create_prodigal_task(
             genome=genome,
             prefix=prefix,
             gcode=gcode,
             locus_tag=locus_tag,
             job_type=job_type,
-            work_dir=os.path.join(work_dir, work_dict["stru"]),
+            work_dir=work_dir,
             out_dir=out_dir
         )
         options["software"].update(option)
-        dag.add_task(prodigal_task)
     else:
         #vgas_task, protein, gff3 = create_vgas_task(
         #    genome=genome,
@@ -191,25 +177,124 @@ def run_annotation(genome, prefix, locus_tag="NPGAP", organism="", strain="", te
         #    gcode=gcode,
         #    locus_tag=locus_tag,
         #    job_type=job_type,
-        #    work_dir=os.path.join(work_dir, work_dict["stru"]),
+        #    work_dir=work_dir,
         #    out_dir=out_dir
         #)
-        #dag.add_task(vgas_task)
-        genemarks_task, protein, gff3 = create_genemarks_task(
+        task, protein, gff3 = create_genemarks_task(
             genome=genome,
             kingdom=kingdom,
             prefix=prefix,
-            work_dir=os.path.join(work_dir, work_dict["stru"]),
+            work_dir=work_dir,
             out_dir=out_dir,
             job_type=job_type,
             gcode=gcode,
             locus_tag=locus_tag
         )
-        dag.add_task(genemarks_task)
 
-    do_dag(dag, refresh_time=refresh, concurrent_tasks=concurrent)
+    return task, options, protein, gff3
+
+
+def create_merge_python_tasks(genome, gff3, prefix, organism, strain, gcode,
+                              cds, work_dir, out_dir):
+    """
+    create the python tasks of merge_annotation, they run in the worker pool
+    of local runs, see thirdparty.dagflow.PythonTask
+    :param cds: the directory of function annotations
+    :return: [update_annotation, merge_stat_anno, gff2tbl, process_assembly, get_gene, ...]
+    """
+    work_dir = os.path.abspath(work_dir)
+    out_dir = os.path.abspath(out_dir)
+    genome = os.path.abspath(genome)
+    gff3 = os.path.abspath(gff3)
+    annotations = [os.path.join(cds, "%s.%s.tsv" % (prefix, i))
+                   for i in ["refseq", "SwissProt", "KEGG", "COG", "TIGRFAMs", "Pfam", "GO"]]
+    genomic_gff = os.path.join(work_dir, "%s.genomic.gff3" % prefix)
+
+    update = PythonTask(
+        id="update_annotation",
+        function=os.path.join(SCRIPTS, "update_annotation.py") + ":update_annotation",
+        args=[gff3] + annotations + [prefix],
+        work_dir=work_dir,
+        stdout=genomic_gff
+    )
+
+    merge_anno = PythonTask(
+        id="merge_stat_anno",
+        function=os.path.join(SCRIPTS, "merge_stat_anno.py") + ":merge_anno",
+        args=[gff3] + annotations,
+        work_dir=work_dir,
+        stdout=os.path.join(work_dir, "%s.merge.annotate.xls" % prefix)
+    )
+
+    tbl = PythonTask(
+        id="gff2tbl",
+        function=os.path.join(SCRIPTS, "gff2tbl_bac.py") + ":gff2tbl",
+        args=[genomic_gff],
+        work_dir=work_dir,
+        stdout=os.path.join(work_dir, "%s.genomic.tbl" % prefix)
+    )
+
+    assembly = PythonTask(
+        id="process_assembly",
+        function=os.path.join(SCRIPTS, "process_assembly.py") + ":process_assembly",
+        args=[genome, None, 500, organism or None, strain or None, gcode],
+        work_dir=work_dir,
+        stdout=os.path.join(work_dir, "%s.genomic.fasta" % prefix)
+    )
+
+    # the proteins and the CDS are read in one pass
+    gene = PythonTask(
+        id="get_gene",
+        function=os.path.join(SCRIPTS, "get_gene.py") + ":get_gene",
+        args=[genomic_gff, genome, ["CDS"], gcode],
+        kwargs={
+            "protein": os.path.join(out_dir, "%s.protein.fasta" % prefix),
+            "cds": os.path.join(out_dir, "%s.RNA.fasta" % prefix)
+        },
+        work_dir=out_dir
+    )
+
+    cds_stat = PythonTask(
+        id="cds_stat",
+        function=os.path.join(SCRIPTS, "cds_stat.py") + ":cds_stat",
+        args=[os.path.join(out_dir, "%s.RNA.fasta" % prefix), prefix, gcode, 0],
+        work_dir=out_dir
+    )
+
+    gene_stat = PythonTask(
+        id="gene_stat",
+        function=os.path.join(SCRIPTS, "gene_stat.py") + ":gene_stat",
+        args=[genomic_gff, genome],
+        work_dir=out_dir,
+        stdout=os.path.join(out_dir, "%s.structure_summary.tsv" % prefix)
+    )
+
+    for task in [tbl, gene, gene_stat]:
+        task.set_upstream(update)
+    cds_stat.set_upstream(gene)
+
+    return [update, merge_anno, tbl, assembly, gene, cds_stat, gene_stat]
+
+
+def create_gene_annotate_dag(genome, protein, gff3, prefix, organism="", strain="",
+                             template="", kingdom="Bacteria", gcode=11, threads=1,
+                             evalue=1e-06, coverage=30, job_type="local",
+                             work_dir=".", out_dir=".", split=True):
+    """
+    create the DAG of protein function annotation and the merge of annotations
+    :param split: split the proteins before annotation, the proteins must exist
+    :return: dag, merge task, options
+    """
+    work_dict = {
+        "stru": "Structure",
+        "func": "Function",
+    }
+
+    options = {
+        "software": OrderedDict(),
+        "database": OrderedDict()
+    }
 
-    LOG.info("ANNOTATE-2: gene annotate\n")
     dag = DAG("gene_annotate")
 
     cds_dag, option = create_cds_annotation_dag(
@@ -221,7 +306,8 @@ def run_annotation(genome, prefix, locus_tag="NPGAP", organism="", strain="", te
         threads=threads,
         job_type=job_type,
         work_dir=os.path.join(work_dir, work_dict["func"]),
-        out_dir=os.path.join(out_dir, work_dict["func"])
+        out_dir=os.path.join(out_dir, work_dict["func"]),
+        split=split
     )
 
     options["software"].update(option["software"])
@@ -241,12 +327,54 @@ def run_annotation(genome, prefix, locus_tag="NPGAP", organism="", strain="", te
         "option": "default"
     }
 
-    merge = Task(
-        id="merge_annotation",
-        work_dir=work_dir,
-        type=job_type,
-        option="-pe smp 1 %s" % QUEUE,
-        script="""
+    cds = os.path.join(out_dir, work_dict["func"])
+
+    # local runs call the python helpers in the warm worker pool
+    if job_type == "local":
+        helpers = create_merge_python_tasks(
+            genome=genome,
+            gff3=gff3,
+            prefix=prefix,
+            organism=organism,
+            strain=strain,
+            gcode=gcode,
+            cds=cds,
+            work_dir=work_dir,
+            out_dir=out_dir
+        )
+        for task in helpers[:2]:
+            task.set_upstream(*cds_dag.tasks.values())
+
+        merge = Task(
+            id="merge_annotation",
+            work_dir=work_dir,
+            type=job_type,
+            option="-pe smp 1 %s" % QUEUE,
+            inputs=[genome, gff3],
+            tools={"tbl2asn": options["software"]["tbl2asn"]},
+            script="""
+export PATH={tbl2asn}:$PATH
+tbl2asn -i {prefix}.genomic.fasta -V b -s T {args2}
+
+mv {prefix}.genomic.gbf {prefix}.genomic.gb
+cp {prefix}.merge.annotate.xls {prefix}.genomic.gff3 {prefix}.genomic.gb {prefix}.genomic.sqn {prefix}.function_summary.tsv {out}
+""".format(tbl2asn=TBL2ASN_BIN,
+            prefix=prefix,
+            args2=tmp2,
+            out=out_dir,
+           )
+        )
+        merge.set_upstream(*helpers)
+        dag.add_task(*helpers)
+    else:
+        merge = Task(
+            id="merge_annotation",
+            work_dir=work_dir,
+            type=job_type,
+            option="-pe smp 1 %s" % QUEUE,
+            inputs=[genome, gff3],
+            tools={"tbl2asn": options["software"]["tbl2asn"]},
+            script="""
 export PATH={tbl2asn}:{python}:$PATH
 python {script}/update_annotation.py {gff3} --refseq {cds}/{prefix}.refseq.tsv \\
   --swissprot {cds}/{prefix}.SwissProt.tsv --COG {cds}/{prefix}.COG.tsv \\
@@ -266,29 +394,168 @@ mv {prefix}.genomic.gbf {prefix}.genomic.gb
 cp {prefix}.merge.annotate.xls {prefix}.genomic.gff3 {prefix}.genomic.gb {prefix}.genomic.sqn {prefix}.function_summary.tsv {out}
 cd {out}
 
-python {script}/get_gene.py --gff {prefix}.genomic.gff3 --genome {genome} --type CDS --translate --gcode {gcode} > {prefix}.protein.fasta
-python {script}/get_gene.py --gff {prefix}.genomic.gff3 --genome {genome} --type CDS > {prefix}.RNA.fasta
+python {script}/get_gene.py --gff {prefix}.genomic.gff3 --genome {genome} --type CDS --gcode {gcode} \\
+  --protein {prefix}.protein.fasta --cds {prefix}.RNA.fasta
 python {script}/cds_stat.py {prefix}.RNA.fasta --name {prefix} --min_length 0 --gcode {gcode}
 python {script}/gene_stat.py --gff {prefix}.genomic.gff3 --fasta {genome} > {prefix}.structure_summary.tsv
 
 """.format(tbl2asn=TBL2ASN_BIN,
-            python=PYTHON_BIN,
-            script=SCRIPTS,
-            prefix=prefix,
-            genome=genome,
-            gff3=gff3,
-            gcode=gcode,
-            args=str(tmp),
-            args2=tmp2,
-            out=out_dir,
-            cds=os.path.join(out_dir, work_dict["func"]),
-           )
-    )
+                python=PYTHON_BIN,
+                script=SCRIPTS,
+                prefix=prefix,
+                genome=genome,
+                gff3=gff3,
+                gcode=gcode,
+                args=str(tmp),
+                args2=tmp2,
+                out=out_dir,
+                cds=os.path.join(out_dir, work_dict["func"]),
+               )
+        )
 
     merge.set_upstream(*cds_dag.tasks.values())
     dag.add_task(*cds_dag.tasks.values())
     dag.add_task(merge)
 
+    return dag, merge, options
+
+
+def create_annotation_dag(genome, prefix, locus_tag="NPGAP", organism="", strain="",
+                          template="", kingdom="Bacteria", gcode=11, threads=1,
+                          evalue=1e-06, coverage=30, job_type="local", work_dir=".", out_dir="."):
+    """
+    create the DAG of gene prediction and annotation in one, the genome is not checked
+    and the proteins are annotated without splitting
+    :return: dag, gff, protein, gene, options
+    """
+    if not locus_tag:
+        locus_tag = prefix
+
+    work_dict = {
+        "stru": "Structure",
+        "func": "Function",
+    }
+
+    for k, v in work_dict.items():
+        mkdir(os.path.join(work_dir, v))
+        if "Structure" in v:
+            continue
+        mkdir(os.path.join(out_dir, v))
+
+    options = {
+        "software": OrderedDict(),
+        "database": OrderedDict()
+    }
+
+    dag = DAG("annotate")
+    predict_task, option, protein, gff3 = create_gene_predict_task(
+        genome=genome,
+        prefix=prefix,
+        kingdom=kingdom,
+        gcode=gcode,
+        locus_tag=locus_tag,
+        job_type=job_type,
+        work_dir=os.path.join(work_dir, work_dict["stru"]),
+        out_dir=out_dir
+    )
+    options["software"].update(option["software"])
+    dag.add_task(predict_task)
+
+    annotate_dag, merge, option = create_gene_annotate_dag(
+        genome=genome,
+        protein=protein,
+        gff3=gff3,
+        prefix=prefix,
+        organism=organism,
+        strain=strain,
+        template=template,
+        kingdom=kingdom,
+        gcode=gcode,
+        threads=threads,
+        evalue=evalue,
+        coverage=coverage,
+        job_type=job_type,
+        work_dir=work_dir,
+        out_dir=out_dir,
+        split=False
+    )
+    options["software"].update(option["software"])
+    options["database"].update(option["database"])
+
+    for task in annotate_dag.tasks.values():
+        if not task.depends:
+            task.set_upstream(predict_task)
+    dag.add_task(*annotate_dag.tasks.values())
+
+    with open(os.path.join(out_dir, "annotate.json"), "w") as fh:
+        json.dump(options, fh, indent=2)
+
+    return dag, os.path.join(out_dir, "%s.genomic.gff3" % prefix), os.path.join(out_dir, "%s.protein.fasta" % prefix), os.path.join(out_dir, "%s.RNA.fasta" % prefix), options
+
+
+def run_annotation(genome, prefix, locus_tag="NPGAP", organism="", strain="", template="",
+                   kingdom="Bacteria", gcode=11, threads=1, evalue=1e-06, coverage=30,
+                   job_type="local", refresh=30, concurrent=10, work_dir=".", out_dir="."):
+    if not locus_tag:
+        locus_tag = prefix
+    LOG.info("ANNOTATE-1: gene predict\n")
+    dag = DAG("gene_predict")
+
+    genome = check_paths(genome)
+    work_dict = {
+        "stru": "Structure",
+        "func": "Function",
+    }
+    work_dir = mkdir(work_dir)
+    out_dir = mkdir(out_dir)
+
+    for k, v in work_dict.items():
+        mkdir(os.path.join(work_dir, v))
+        if "Structure" in v:
+            continue
+        mkdir(os.path.join(out_dir, v))
+
+    options = {
+        "software": OrderedDict(),
+        "database": OrderedDict()
+    }
+
+    predict_task, option, protein, gff3 = create_gene_predict_task(
+        genome=genome,
+        prefix=prefix,
+        kingdom=kingdom,
+        gcode=gcode,
+        locus_tag=locus_tag,
+        job_type=job_type,
+        work_dir=os.path.join(work_dir, work_dict["stru"]),
+        out_dir=out_dir
+    )
+    options["software"].update(option["software"])
+    dag.add_task(predict_task)
+
+    do_dag(dag, refresh_time=refresh, concurrent_tasks=concurrent)
+
+    LOG.info("ANNOTATE-2: gene annotate\n")
+    dag, merge, option = create_gene_annotate_dag(
+        genome=genome,
+        protein=protein,
+        gff3=gff3,
+        prefix=prefix,
+        organism=organism,
+        strain=strain,
+        template=template,
+        kingdom=kingdom,
+        gcode=gcode,
+        threads=threads,
+        evalue=evalue,
+        coverage=coverage,
+        job_type=job_type,
+        work_dir=work_dir,
+        out_dir=out_dir
+    )
+    options["software"].update(option["software"])
+    options["database"].update(option["database"])
+
     with open(os.path.join(out_dir, "annotate.json"), "w") as fh:
         json.dump(options, fh, indent=2)
 
@@ -299,6 +566,7 @@ python {script}/gene_stat.py --gff {prefix}.genomic.gff3 --fasta {genome} > {pre
 
 def annotate(args):
 
+    set_workflow(args)
     run_annotation(
         genome=args.genome,
         prefix=args.prefix,
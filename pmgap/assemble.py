@@ -8,7 +8,7 @@ import logging
 
 from thirdparty.dagflow import DAG, Task, do_dag
 from pmgap.config import *
-from pmgap.parser import add_assemble_args
+from pmgap.parser import add_assemble_args, set_workflow
 from pmgap.common import check_path, mkdir, get_version
 
 LOG = logging.getLogger(__name__)
@@ -22,8 +22,10 @@ __all__ = []
 def create_unicycler_task(prefix, read1, read2, reads, job_type, work_dir, out_dir,
                          minlen=500, thread=4):
 
+    inputs = [read1, read2]
     temp = ""
     if reads:
+        inputs.append(reads)
         reads = "--long %s" % reads
         temp = "--long %s"
     option = {}
@@ -45,13 +47,15 @@ def create_unicycler_task(prefix, read1, read2, reads, job_type, work_dir, out_d
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (thread, QUEUE),
+        inputs=inputs,
+        tools=option,
+        temp=[prefix],
         script="""
 export PATH={unicycler}:$PATH
 unicycler -1 {read1} -2 {read2} \\
   {reads} --keep 3 --mode normal -o {prefix} -t {thread}
 python {script}/add_circular_edge.py {prefix}/assembly.fasta --minlen {minlen} >{prefix}.contigs.fasta
 mv {prefix}/assembly.gfa {prefix}.assembly.gfa
-#rm -rf {prefix}
 """.format(unicycler=UNICYCLER_BIN,
             script=SCRIPTS,
             prefix=prefix,
@@ -119,9 +123,15 @@ def create_gc_depth_task(genome, prefix, read1, read2, job_type,
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (thread, QUEUE),
+        inputs=[read1, read2],
+        tools=option,
+        temp=["%s.depth" % prefix],
+        # the bam and depth of each base are left in the scratch
+        stage="link",
+        outputs=["%s.%s" % (prefix, i) for i in ["length_gc.xls", "depth.png", "depth.pdf"]],
         script="""
 export PATH={samtools}:{minimap2}:{python}:$PATH
-if [ ! -e bam_done ]; then
+if [ ! -e bam_done ] || [ ! -e {prefix}.depth ]; then
     minimap2 -t {thread} -ax sr {genome} {read1} {read2} |samtools view -bS |samtools sort -o {prefix}.sort.bam
     samtools depth -aa {prefix}.sort.bam > {prefix}.depth
     touch bam_done
@@ -147,13 +157,12 @@ cp {prefix}.length_gc.xls {prefix}.depth.png {prefix}.depth.pdf {out_dir}
     return task, option, os.path.join(work_dir, "%s.gc_depth.png" % prefix)
 
 
-def run_assembly(prefix, read1, read2, reads, thread, job_type,
-                 concurrent, refresh, work_dir, out_dir):
-
-    read1 = check_path(read1)
-    read2 = check_path(read2)
-    work_dir = mkdir(work_dir)
-    out_dir = mkdir(out_dir)
+def create_assembly_dag(prefix, read1, read2, reads, thread, job_type,
+                        work_dir, out_dir):
+    """
+    create the DAG of genome assembly, the reads are not checked
+    :return: dag, genome, options
+    """
     options = {
         "software": OrderedDict(),
         "database": OrderedDict()
@@ -192,6 +201,28 @@ def run_assembly(prefix, read1, read2, reads, thread, job_type,
     dag.add_task(circlator_task)
     dag.add_task(gc_depth_task)
 
+    return dag, genome, options
+
+
+def run_assembly(prefix, read1, read2, reads, thread, job_type,
+                 concurrent, refresh, work_dir, out_dir):
+
+    read1 = check_path(read1)
+    read2 = check_path(read2)
+    work_dir = mkdir(work_dir)
+    out_dir = mkdir(out_dir)
+
+    dag, genome, options = create_assembly_dag(
+        prefix=prefix,
+        read1=read1,
+        read2=read2,
+        reads=reads,
+        thread=thread,
+        job_type=job_type,
+        work_dir=work_dir,
+        out_dir=out_dir
+    )
+
     do_dag(dag, concurrent_tasks=concurrent, refresh_time=refresh)
 
     return genome, options
@@ -199,6 +230,7 @@ def run_assembly(prefix, read1, read2, reads, thread, job_type,
 
 def assemble(args):
 
+    set_workflow(args)
     genome, options = run_assembly(
         prefix=args.prefix,
         read1=args.read1,
@@ -92,6 +92,7 @@ cd {outdir}/result/
             outdir=out_dir
         )
     )
+    task.weight = 0.5
 
     return task
 
@@ -14,7 +14,7 @@ try:
 except:
     from configparser import ConfigParser
 
-from thirdparty.seqkit.FastaReader import open_fasta
+from thirdparty.seqkit.FastaReader import read_fasta
 
 
 LOG = logging.getLogger(__name__)
@@ -266,7 +266,7 @@ def get_genome_size(genome):
     """
     r = 0
 
-    for seq in open_fasta(genome):
+    for seq in read_fasta(genome):
         r += len(seq)
 
     return r / 1000000.0
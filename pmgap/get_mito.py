@@ -9,7 +9,7 @@ import argparse
 from pmgap.config import *
 from thirdparty.dagflow import DAG, Task, do_dag
 from pmgap.common import check_path, mkdir, get_version
-from pmgap.parser import add_get_mito_args
+from pmgap.parser import add_get_mito_args, set_workflow
 
 LOG = logging.getLogger(__name__)
 
@@ -32,6 +32,9 @@ def get_ngs_reads_task(prefix, database, platform, read1, read2, job_type,
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (thread, QUEUE),
+        inputs=[database, read1, read2],
+        tools=option,
+        temp=["%s.ngs.paf" % prefix],
         script="""
 export PATH={minimap2}:$PATH
 minimap2 -t {thread} -x sr {database} {read1} {read2} >{prefix}.ngs.paf
@@ -66,6 +69,8 @@ def get_tgs_reads_task(prefix, database, reads, job_type, work_dir, out_dir,
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (thread, QUEUE),
+        inputs=[database, reads],
+        temp=["%s.tgs.paf" % prefix],
         script="""
 export PATH={minimap2}:$PATH
 minimap2 -t {thread} {x} {database} {reads} >{prefix}.tgs.paf
@@ -90,16 +95,12 @@ mv {prefix}.choose_r1.fq {prefix}.choose.fq
     return task, os.path.join(work_dir, '%s.choose.fq' % prefix)
 
 
-def run_get_mito(prefix, database, platform, read1, read2, sequencer, reads,
-                 job_type, work_dir, out_dir, concurrent, refresh,
-                 thread=4, gc=20, base="all", score=0):
-
-    read1 = check_path(read1)
-    read2 = check_path(read2)
-    work_dir = mkdir(work_dir)
-    out_dir = mkdir(out_dir)
-    database = check_path(database)
-
+def create_get_mito_dag(prefix, database, platform, read1, read2, sequencer, reads,
+                        job_type, work_dir, out_dir, thread=4, gc=20, base="all", score=0):
+    """
+    create the DAG to get the reads of organelle, the reads are not checked
+    :return: dag, mito_r1, mito_r2, mito_reads, options
+    """
     work_dict = {
         "ngs": "00_get_ngs",
         "tgs": "01_get_tgs"
@@ -132,7 +133,6 @@ def run_get_mito(prefix, database, platform, read1, read2, sequencer, reads,
     options["software"] = option
 
     if reads:
-        reads = check_path(reads)
         tgs_task, mito_reads = get_tgs_reads_task(
             prefix,
             database,
@@ -150,6 +150,39 @@ def run_get_mito(prefix, database, platform, read1, read2, sequencer, reads,
     else:
         mito_reads = ""
 
+    return dag, mito_r1, mito_r2, mito_reads, options
+
+
+def run_get_mito(prefix, database, platform, read1, read2, sequencer, reads,
+                 job_type, work_dir, out_dir, concurrent, refresh,
+                 thread=4, gc=20, base="all", score=0):
+
+    read1 = check_path(read1)
+    read2 = check_path(read2)
+    work_dir = mkdir(work_dir)
+    out_dir = mkdir(out_dir)
+    database = check_path(database)
+
+    if reads:
+        reads = check_path(reads)
+
+    dag, mito_r1, mito_r2, mito_reads, options = create_get_mito_dag(
+        prefix=prefix,
+        database=database,
+        platform=platform,
+        read1=read1,
+        read2=read2,
+        sequencer=sequencer,
+        reads=reads,
+        job_type=job_type,
+        work_dir=work_dir,
+        out_dir=out_dir,
+        thread=thread,
+        gc=gc,
+        base=base,
+        score=score
+    )
+
     do_dag(dag, concurrent, refresh)
 
     return mito_r1, mito_r2, mito_reads, options
@@ -157,6 +190,7 @@ def run_get_mito(prefix, database, platform, read1, read2, sequencer, reads,
 
 def get_mito(args):
 
+    set_workflow(args)
     mito_r1, mito_r2, mito_reads, options = run_get_mito(
         prefix=args.prefix,
         database=args.database,
@@ -9,7 +9,7 @@ import argparse
 
 from collections import OrderedDict
 from pmgap.config import *
-from pmgap.parser import add_ngs_qc_args
+from pmgap.parser import add_ngs_qc_args, set_workflow
 from thirdparty.dagflow import DAG, Task, ParallelTask, do_dag
 from pmgap.common import check_paths, mkdir, read_tsv, get_version
 
@@ -49,11 +49,18 @@ ln -s {read2} {prefix}.raw.r2.fastq{suffix}
         work_dir=work_dir,
         type=job_type,
         option="-pe smp 1 %s" % QUEUE,
+        inputs=reads1 + reads2,
+        # the reads merged are removed after the quality control
+        temp=["%s.raw.r1.fastq%s" % (prefix, suffix), "%s.raw.r2.fastq%s" % (prefix, suffix)],
         script="""
 {run}
 """.format(run=run)
     )
 
+    # the links of one lane take no time, the task is fused into the next one with --fuse
+    if len(reads1) <= 1:
+        task.weight = 0.01
+
     raw_r1 = os.path.join(work_dir, "%s.raw.r1.fastq%s" % (prefix, suffix))
     raw_r2 = os.path.join(work_dir, "%s.raw.r2.fastq%s" % (prefix, suffix))
 
@@ -78,6 +85,9 @@ def quality_control_task(read1, read2, prefix, trim, thread,
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (thread, QUEUE),
+        inputs=[read1, read2],
+        tools=option,
+        stage="link",
         script="""
 export PATH={python}:{fastp}:{fastqc}:$PATH
 fastp -i {read1} -I {read2} \
@@ -118,6 +128,8 @@ def blast_read_task(prefix, read1, thread, job_type, work_dir, out_dir):
         work_dir=work_dir,
         type=job_type,
         option="-pe smp %s %s" % (thread, QUEUE),
+        inputs=[read1],
+        tools=option,
         script="""
 export PATH={blast}:{python}:$PATH
 python {scripts}/fq2fa.py {read1} -n 10000 >{prefix}.clean.r1.fa
@@ -145,14 +157,12 @@ cp {prefix}.species_annotation.txt {prefix}.top10_species.tsv {out_dir}
     return task, option
 
 
-def run_ngs_qc(reads1, reads2, prefix, trim, thread, job_type,
-               concurrent, refresh, work_dir, out_dir):
-
-    work_dir = mkdir(work_dir)
-    out_dir = mkdir(out_dir)
-    reads1 = check_paths(reads1)
-    reads2 = check_paths(reads2)
-
+def create_ngs_qc_dag(reads1, reads2, prefix, trim, thread, job_type,
+                      work_dir, out_dir):
+    """
+    create the DAG of data quality control, the reads are not checked
+    :return: dag, clean1, clean2, options
+    """
     options = {
         "software": OrderedDict(),
         "database": OrderedDict()
@@ -195,6 +205,28 @@ def run_ngs_qc(reads1, reads2, prefix, trim, thread, job_type,
     )
     dag.add_task(blast_task)
     options["software"].update(option)
+
+    return dag, clean1, clean2, options
+
+
+def run_ngs_qc(reads1, reads2, prefix, trim, thread, job_type,
+               concurrent, refresh, work_dir, out_dir):
+
+    work_dir = mkdir(work_dir)
+    out_dir = mkdir(out_dir)
+    reads1 = check_paths(reads1)
+    reads2 = check_paths(reads2)
+
+    dag, clean1, clean2, options = create_ngs_qc_dag(
+        reads1=reads1,
+        reads2=reads2,
+        prefix=prefix,
+        trim=trim,
+        thread=thread,
+        job_type=job_type,
+        work_dir=work_dir,
+        out_dir=out_dir
+    )
     do_dag(dag, concurrent, refresh)
 
     stat_qc = os.path.join(work_dir, "%s.qc.xls" % prefix)
@@ -207,6 +239,7 @@ def run_ngs_qc(reads1, reads2, prefix, trim, thread, job_type,
 
 def ngs_qc(args):
 
+    set_workflow(args)
     clean1, clean2, stat_qc, quality, content, gc, options = run_ngs_qc(
         reads1=args.reads1,
         reads2=args.reads2,
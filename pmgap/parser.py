@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from pmgap.config import GENETIC_CODES
+import os
+
+from pmgap.config import GENETIC_CODES, PYTHON_BIN
+from thirdparty.dagflow import set_defaults
+from thirdparty.dagflow.dag import str2bytes
 
 __all__ = ["add_ngs_qc_args", "add_get_mito_args", "add_assemble_args",
-           "add_annotation_args", "add_all_args",
+           "add_annotation_args", "add_all_args", "set_workflow",
            ]
 
 
@@ -19,8 +23,38 @@ def add_workflow_args(parser):
         help="Maximum number of jobs concurrent  (default: 10)")
     workflow_group.add_argument("--refresh", metavar="INT", type=int, default=30,
         help="Refresh time of log in seconds  (default: 30)")
-    workflow_group.add_argument("--job_type", choices=["sge", "local"], default="local",
-        help="Jobs run on [sge, local]  (default: local)")
+    workflow_group.add_argument("--job_type", choices=["sge", "slurm", "local"], default="local",
+        help="Jobs run on [sge, slurm, local]  (default: local)")
+    workflow_group.add_argument("--cpus", metavar="INT", type=int, default=0,
+        help="CPUs used by local jobs, counted by their threads (default: all cpus)")
+    workflow_group.add_argument("--memory", metavar="STR", type=str, default="",
+        help="Memory used by local jobs, eg: 64G (default: no limit)")
+    workflow_group.add_argument("--resume", action="store_true",
+        help="Keep cluster jobs running on exit and reattach them on restart")
+    workflow_group.add_argument("--array", action="store_true",
+        help="Submit the chunks of parallel sge jobs as one array job")
+    workflow_group.add_argument("--poll_cache", metavar="FILE", type=str, default="",
+        help="Share the qstat result with other pmgap processes by FILE")
+    workflow_group.add_argument("--retries", metavar="INT", type=int, default=0,
+        help="Retry failed jobs INT times with exponential backoff (default: 0)")
+    workflow_group.add_argument("--retry_memory", metavar="FLOAT", type=float, default=1,
+        help="Multiply the memory requested by failed jobs by FLOAT on retry (default: 1)")
+    workflow_group.add_argument("--server", metavar="FILE", type=str, default="",
+        help="Share cpus and memory with other runs by the local server on socket FILE")
+    workflow_group.add_argument("--fuse", metavar="INT", type=int, default=0,
+        help="Run the chains of jobs shorter than INT seconds as one job, eg: 30 (default: 0, disabled)")
+    workflow_group.add_argument("--keep_intermediates", action="store_true",
+        help="Keep the intermediate files of jobs, they are removed when no job needs them")
+    workflow_group.add_argument("--stage", action="store_true",
+        help="Run the I/O heavy jobs in $TMPDIR of nodes and move their outputs back")
+    workflow_group.add_argument("--history", metavar="FILE", type=str, default="",
+        help="Keep the run time and memory of jobs in FILE shared by runs (default: the status file of the run with --resume)")
+    workflow_group.add_argument("--profile", action="store_true",
+        help="Write the timeline and critical path of jobs next to the status file of the run")
+    workflow_group.add_argument("--log_size", metavar="STR", type=str, default="256M",
+        help="Rotate the logs of local jobs over STR, eg: 1G, 0 for no limit (default: 256M)")
+    workflow_group.add_argument("--log_backups", metavar="INT", type=int, default=1,
+        help="Keep INT gzipped logs rotated of each local job (default: 1)")
     workflow_group.add_argument("--work_dir", metavar="DIR", default="NPGAP.work",
         help="Work directory (default: current directory)")
     workflow_group.add_argument("--out_dir", metavar="DIR", default="NPGAP.out",
@@ -29,6 +63,44 @@ def add_workflow_args(parser):
     return parser
 
 
+def set_workflow(args):
+    """
+    pass the workflow arguments to dagflow
+    :param args: args from add_workflow_args
+    :return:
+    """
+    memory = None
+    if getattr(args, "memory", ""):
+        memory = str2bytes(args.memory)
+
+    # the python workers need the packages of the scripts, eg: Bio
+    python = os.path.join(PYTHON_BIN, "python")
+    if not os.path.isfile(python):
+        python = ""
+
+    set_defaults(
+        cpus=getattr(args, "cpus", 0) or None,
+        memory=memory,
+        resume=getattr(args, "resume", False),
+        array=getattr(args, "array", False),
+        poll_cache=getattr(args, "poll_cache", ""),
+        retries=getattr(args, "retries", 0),
+        escalate_memory=getattr(args, "retry_memory", 1),
+        server=getattr(args, "server", ""),
+        python=python,
+        fuse=getattr(args, "fuse", 0),
+        keep_intermediates=getattr(args, "keep_intermediates", False),
+        stage=getattr(args, "stage", False),
+        history=getattr(args, "history", ""),
+        profile=getattr(args, "profile", False),
+        log_size=str2bytes(getattr(args, "log_size", "256M") or "0"),
+        log_backups=getattr(args, "log_backups", 1),
+        dry_run=getattr(args, "dry_run", False),
+    )
+
+    return args
+
+
 
 def add_ngs_qc_args(parser):
 
@@ -214,6 +286,10 @@ def add_all_args(parser):
                              "for more information (default: 11)", default=11)
     parser.add_argument("-t", "--thread", type=int, default=4,
         help="Set the number of threads to run.")
+    parser.add_argument("--single_dag", action="store_true",
+        help="Run all steps in one DAG, so that independent steps run at the same time.")
+    parser.add_argument("--dry_run", action="store_true",
+        help="Predict the run time, memory, makespan and critical path of all steps by the history without running them.")
     parser = add_workflow_args(parser)   
 
     return parser
@@ -9,7 +9,10 @@ import argparse
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
 from pmgap.config import *
 from pmgap.common import check_path, check_paths, mkdir, read_tsv
-from thirdparty.dagflow import DAG, Task, do_dag
+from thirdparty.dagflow import DAG, Task, do_dag, set_defaults
+from thirdparty.dagflow.dag import str2bytes
+from pmgap.parser import set_workflow
+from pmgap.all import create_all_dag
 
 LOG = logging.getLogger(__name__)
 __version__ = "1.0.0"
@@ -25,22 +28,55 @@ except:
 
 def create_pmgap_task(prefix, reads1, reads2, project, projectid,
                       job_type, work_dir, out_dir,
-                      taxon, platform="mgi", database="", gcode=11):
+                      taxon, platform="mgi", database="", gcode=11, thread=10,
+                      poll_cache="", server="", keep_intermediates=False, stage=False,
+                      history="", log_size="256M", log_backups=1, fuse=0, profile=False,
+                      array=False, retries=0, retry_memory=1, resume=False, cpus=0, memory=""):
 
     if database:
        database = check_path(database)
        database = "--database %s" % database
+    # the workflow options passed to the run of sample, see pmgap.parser.add_workflow_args
+    options = []
+    if cpus:
+        options.append("--cpus %s" % cpus)
+    if memory:
+        options.append("--memory %s" % memory)
+    if resume:
+        options.append("--resume")
+    if array:
+        options.append("--array")
+    if poll_cache:
+        options.append("--poll_cache %s" % poll_cache)
+    if server:
+        options.append("--server %s" % server)
+    if keep_intermediates:
+        options.append("--keep_intermediates")
+    if stage:
+        options.append("--stage")
+    if history:
+        options.append("--history %s" % history)
+    if fuse:
+        options.append("--fuse %s" % fuse)
+    if profile:
+        options.append("--profile")
+    if retries:
+        options.append("--retries %s --retry_memory %s" % (retries, retry_memory))
+    options.append("--log_size %s --log_backups %s" % (log_size, log_backups))
     task = Task(
         id="pmgap_%s" % prefix,
         work_dir=work_dir,
         type=job_type,
         option="-pe smp 1",
+        inputs=reads1 + reads2,
+        # the failed jobs are retried by the run of sample, not the whole run
+        retry={"retries": 0},
         script="""
 {root}/pmgap.py all \\
   --reads1 {reads1} \\
   --reads2 {reads2} \\
-  --prefix {prefix} --taxon {taxon} --trim 5 --thread 10 --job_type {job_type} \\
-  --platform {platform} {database} \\
+  --prefix {prefix} --taxon {taxon} --trim 5 --thread {thread} --job_type {job_type} \\
+  --platform {platform} {database} {options} \\
   --project {project} --projectid {projectid} \\
   --work_dir {work}/{prefix}  --out_dir {out}/{prefix} --gcode {gcode}
 """.format(root=ROOT,
@@ -49,8 +85,10 @@ def create_pmgap_task(prefix, reads1, reads2, project, projectid,
             reads2=" ".join(reads2),
             taxon=taxon,
             gcode=gcode,
+            thread=thread,
             platform=platform,
             database=database,
+            options=" ".join(options),
             project=project,
             projectid=projectid,
             job_type=job_type,
@@ -62,13 +100,8 @@ def create_pmgap_task(prefix, reads1, reads2, project, projectid,
     return task
 
 
-def run_pmgap_multi(data, taxon, project, projectid,
-                    work_dir, out_dir, concurrent, refresh,
-                    job_type="local", platform="mgi", database="", gcode=11):
+def read_samples(data):
 
-    work_dir = mkdir(work_dir)
-    out_dir = mkdir(out_dir)
-    data = check_path(data)
     r = {}
 
     for line in read_tsv(data, "\t"):
@@ -77,6 +110,97 @@ def run_pmgap_multi(data, taxon, project, projectid,
         r[line[0]][0].append(line[1])
         r[line[0]][1].append(line[2])
 
+    return r
+
+
+def create_pmgap_multi_dag(samples, taxon, project, projectid, job_type,
+                           work_dir, out_dir, platform="mgi", database="",
+                           gcode=11, thread=10):
+    """
+    create one DAG for the steps of all samples, the tasks of a sample are
+    named {task}_{sample}
+    :param samples: {sample: [reads1, reads2]}
+    :return: dag
+    """
+    dag = DAG("run_pmgap_multi")
+
+    for i in samples:
+        reads1 = check_paths(samples[i][0])
+        reads2 = check_paths(samples[i][1])
+        sample_dag, options = create_all_dag(
+            prefix=i,
+            taxon=taxon,
+            platform=platform,
+            reads1=reads1,
+            reads2=reads2,
+            sequencer="PromethION",
+            reads="",
+            database=database,
+            project=project,
+            projectid=projectid,
+            job_type=job_type,
+            work_dir=mkdir(os.path.join(work_dir, i)),
+            out_dir=mkdir(os.path.join(out_dir, i)),
+            trim=5,
+            thread=thread,
+            gcode=gcode
+        )
+        LOG.info("add %s tasks of %s" % (len(sample_dag.tasks), i))
+        dag.add_task(*sample_dag.set_group(i).tasks.values())
+
+    return dag
+
+
+def run_pmgap_multi(data, taxon, project, projectid,
+                    work_dir, out_dir, concurrent, refresh,
+                    job_type="local", platform="mgi", database="", gcode=11,
+                    single_dag=False, thread=10, server="", keep_intermediates=False,
+                    stage=False, history="", dry_run=False, log_size="256M", log_backups=1, fuse=0,
+                    profile=False, array=False, retries=0, retry_memory=1, resume=False,
+                    cpus=0, memory=""):
+
+    work_dir = mkdir(work_dir)
+    out_dir = mkdir(out_dir)
+    data = check_path(data)
+    r = read_samples(data)
+
+    # the runs of all samples are kept in one history, so the next batch is predicted
+    history = os.path.abspath(history or os.path.join(work_dir, "dagflow.history.db"))
+    set_defaults(history=history)
+
+    # the steps of samples are predicted in one DAG
+    if single_dag or dry_run:
+        dag = create_pmgap_multi_dag(
+            samples=r,
+            taxon=taxon,
+            project=project,
+            projectid=projectid,
+            job_type=job_type,
+            work_dir=work_dir,
+            out_dir=out_dir,
+            platform=platform,
+            database=database,
+            gcode=gcode,
+            thread=thread
+        )
+        do_dag(dag, concurrent, refresh)
+
+        return 0
+
+    # the controllers of samples share one qstat result
+    poll_cache = os.path.join(work_dir, "qstat.cache")
+    set_defaults(poll_cache=poll_cache)
+
+    # the local jobs of the samples run at once share the cpus and memory of
+    # this machine, unless the server shares them
+    if job_type == "local" and not server:
+        samples = max(min(concurrent, len(r)), 1)
+        cpus = max((cpus or os.cpu_count() or 1) // samples, 1)
+        memory = str2bytes(memory) // samples if memory else ""
+    else:
+        cpus = 0
+        memory = ""
+
     dag = DAG("run_pmgap_multi")
     for i in r:
         reads1 = check_paths(r[i][0])
@@ -93,7 +217,23 @@ def run_pmgap_multi(data, taxon, project, projectid,
             projectid=projectid,
             job_type=job_type,
             work_dir=work_dir,
-            out_dir=out_dir
+            out_dir=out_dir,
+            thread=thread,
+            poll_cache=poll_cache,
+            server=server,
+            keep_intermediates=keep_intermediates,
+            stage=stage,
+            history=history,
+            log_size=log_size,
+            log_backups=log_backups,
+            fuse=fuse,
+            profile=profile,
+            array=array,
+            retries=retries,
+            retry_memory=retry_memory,
+            resume=resume,
+            cpus=cpus,
+            memory=memory
         )
         LOG.info("run %s" % i)
         dag.add_task(task)
@@ -105,6 +245,7 @@ def run_pmgap_multi(data, taxon, project, projectid,
 
 def pmgap_multi(args):
 
+    set_workflow(args)
     run_pmgap_multi(
         data=args.data,
         taxon=args.taxon,
@@ -118,6 +259,23 @@ def pmgap_multi(args):
         job_type=args.job_type,
         platform=args.platform,
         database=args.database,
+        single_dag=args.single_dag,
+        thread=args.thread,
+        server=args.server,
+        keep_intermediates=args.keep_intermediates,
+        stage=args.stage,
+        history=args.history,
+        dry_run=args.dry_run,
+        log_size=args.log_size,
+        log_backups=args.log_backups,
+        fuse=args.fuse,
+        profile=args.profile,
+        array=args.array,
+        retries=args.retries,
+        retry_memory=args.retry_memory,
+        resume=args.resume,
+        cpus=args.cpus,
+        memory=args.memory,
     )
 
 
@@ -139,12 +297,46 @@ def add_pmgap_multi_args(parser):
         help="Input project name, default=None.")
     parser.add_argument("-pid", "--projectid", metavar="STR", type=str, required=True,
         help="Input project id, default=None.")
+    parser.add_argument("-t", "--thread", metavar="INT", type=int, default=10,
+        help="Set the number of threads to run for each sample (default: 10).")
+    parser.add_argument("--single_dag", action="store_true",
+        help="Run the steps of all samples in one DAG with one concurrent limit.")
     parser.add_argument("--concurrent", metavar="INT", type=int, default=10,
         help="Maximum number of jobs concurrent  (default: 10).")
     parser.add_argument("--refresh", metavar="INT", type=int, default=30,
         help="Refresh time of log in seconds  (default: 30).")
-    parser.add_argument("--job_type", choices=["sge", "local"], default="local",
-        help="Jobs run on [sge, local]  (default: local).")
+    parser.add_argument("--job_type", choices=["sge", "slurm", "local"], default="local",
+        help="Jobs run on [sge, slurm, local]  (default: local).")
+    parser.add_argument("--cpus", metavar="INT", type=int, default=0,
+        help="CPUs used by local jobs, split by the samples run at once (default: all cpus).")
+    parser.add_argument("--memory", metavar="STR", type=str, default="",
+        help="Memory used by local jobs, eg: 64G, split by the samples run at once (default: no limit).")
+    parser.add_argument("--resume", action="store_true",
+        help="Keep cluster jobs running on exit and reattach them on restart.")
+    parser.add_argument("--array", action="store_true",
+        help="Submit the chunks of parallel sge jobs of samples as one array job.")
+    parser.add_argument("--retries", metavar="INT", type=int, default=0,
+        help="Retry failed jobs INT times with exponential backoff (default: 0).")
+    parser.add_argument("--retry_memory", metavar="FLOAT", type=float, default=1,
+        help="Multiply the memory requested by failed jobs by FLOAT on retry (default: 1).")
+    parser.add_argument("--server", metavar="FILE", type=str, default="",
+        help="Share cpus and memory with other runs by the local server on socket FILE.")
+    parser.add_argument("--fuse", metavar="INT", type=int, default=0,
+        help="Run the chains of jobs shorter than INT seconds as one job, eg: 30 (default: 0, disabled).")
+    parser.add_argument("--keep_intermediates", action="store_true",
+        help="Keep the intermediate files of jobs, they are removed when no job needs them.")
+    parser.add_argument("--stage", action="store_true",
+        help="Run the I/O heavy jobs in $TMPDIR of nodes and move their outputs back.")
+    parser.add_argument("--history", metavar="FILE", type=str, default="",
+        help="Keep the run time and memory of jobs in FILE shared by batches (default: WORK_DIR/dagflow.history.db).")
+    parser.add_argument("--profile", action="store_true",
+        help="Write the timeline and critical path of jobs next to the status file of each run.")
+    parser.add_argument("--log_size", metavar="STR", type=str, default="256M",
+        help="Rotate the logs of local jobs over STR, eg: 1G, 0 for no limit (default: 256M).")
+    parser.add_argument("--log_backups", metavar="INT", type=int, default=1,
+        help="Keep INT gzipped logs rotated of each local job (default: 1).")
+    parser.add_argument("--dry_run", action="store_true",
+        help="Predict the run time, memory, makespan and critical path of the batch without running it.")
     parser.add_argument("--work_dir", metavar="DIR", type=str, default=".",
         help="Work directory (default: current directory).")
     parser.add_argument("--out_dir", metavar="DIR", type=str, default=".",
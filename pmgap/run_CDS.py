@@ -20,7 +20,7 @@ from thirdparty.dagflow import Task, ParallelTask, DAG, do_dag
 from pmgap import __author__, __email__, __version__
 from pmgap.config import *
 from pmgap.common import check_paths, cd, mkdir, get_version
-from pmgap.parser import add_cds_args
+from pmgap.parser import add_cds_args, set_workflow
 from thirdparty.seqkit.split import seq_split
 
 
@@ -42,6 +42,8 @@ def create_refseq_task(proteins, prefix, db, evalue, coverage, threads,
         work_dir="%s/{id}" % work_dir,
         type=job_type,
         option= "-pe smp %s %s" % (threads, QUEUE),
+        inputs=[db, "{protein}"],
+        stage="link",
         script="""
 export PATH={diamond}:$PATH
 time diamond blastp --query {{protein}} --db {db} \\
@@ -93,6 +95,10 @@ def create_interproscan_task(proteins, prefix, job_type, work_dir="", out_dir=""
         work_dir="%s/{id}" % work_dir,
         type=job_type,
         option="-pe smp 1 %s" % QUEUE,
+        inputs=["{protein}"],
+        # the temporary files of interproscan are left in the scratch
+        stage="link",
+        outputs=["{prefixs}.ipr.out"],
         script="""
 export PATH={interproscan}:$PATH
 time interproscan.sh -i {{protein}} -appl Pfam,TIGRFAM,SMART -iprlookup -goterms -t p -f TSV -o {{prefixs}}.ipr.out
@@ -146,6 +152,8 @@ def create_kegg_task(proteins, prefix, db, evalue, coverage, threads, job_type,
         work_dir="%s/{id}" % work_dir,
         type=job_type,
         option="-pe smp %s %s" % (threads, QUEUE),
+        inputs=[db, "{protein}"],
+        stage="link",
         script="""
 export PATH={diamond}:$PATH
 time diamond blastp --query {{protein}} --db {db} \\
@@ -205,6 +213,8 @@ def create_cog_task(proteins, prefix, db, evalue, coverage, threads, job_type,
         work_dir="%s/{id}" % work_dir,
         type=job_type,
         option="-pe smp %s %s" % (threads, QUEUE),
+        inputs=[db, "{protein}"],
+        stage="link",
         script="""
 export PATH={diamond}:$PATH
 time diamond blastp --query {{protein}} --db {db} \\
@@ -258,6 +268,8 @@ def create_swissprot_task(proteins, prefix, db, evalue, coverage, threads, job_t
         work_dir="%s/{id}" % work_dir,
         type=job_type,
         option="-pe smp %s %s" % (threads, QUEUE),
+        inputs=[db, "{protein}"],
+        stage="link",
         script="""
 export PATH={diamond}:$PATH
 time diamond blastp --query {{protein}} --db {db} \\
@@ -297,7 +309,13 @@ cp {prefix}.SwissProt.m6 {prefix}.SwissProt.tsv {out_dir}
 
 
 def create_cds_annotation_dag(protein, prefix, kingdom, evalue, coverage,
-                              threads, job_type, work_dir, out_dir):
+                              threads, job_type, work_dir, out_dir, split=True):
+    """
+    create the DAG of protein annotation
+    :param split: split the proteins by length, the proteins must exist; if False,
+                  the proteins are annotated in one piece and may be created later
+    :return: dag, options
+    """
 
     kingdom = kingdom.lower()
     dag = DAG("CDS")
@@ -313,12 +331,14 @@ def create_cds_annotation_dag(protein, prefix, kingdom, evalue, coverage,
 
     work_dir = mkdir(os.path.abspath(work_dir))
     out_dir = mkdir(os.path.abspath(out_dir))
-    protein = check_paths(protein)
-
     for k, v in work_dict.items():
         work_dict[k] = mkdir(os.path.join(work_dir, v))
 
-    proteins = seq_split([protein], mode="length", num=5000000, output_dir=work_dict["split"])
+    if split:
+        protein = check_paths(protein)
+        proteins = seq_split([protein], mode="length", num=5000000, output_dir=work_dict["split"])
+    else:
+        proteins = [os.path.abspath(protein)]
 
     _options = {
         "software": OrderedDict(),
@@ -423,6 +443,21 @@ def create_cds_annotation_dag(protein, prefix, kingdom, evalue, coverage,
     dag.add_task(*swissprot_tasks)
     dag.add_task(swissprot_join)
 
+    # the relative run time of the searches without history, the slow ones are submitted first
+    for tasks, weight in [(refseq_tasks, 20), (ipr_tasks, 10), (kegg_tasks, 5),
+                          (cog_tasks, 2), (swissprot_tasks, 2)]:
+        for task in tasks:
+            task.weight = weight
+
+    # the chunks of proteins are removed when all searches of them finished
+    if split:
+        for task in refseq_tasks + ipr_tasks + kegg_tasks + cog_tasks + swissprot_tasks:
+            task.temp = [i for i in task.inputs if i in proteins]
+
+    # the joins are a cat and a filter, with --fuse a join is fused into the search when not split
+    for task in [refseq_join, ipr_join, kegg_join, cog_join, swissprot_join]:
+        task.weight = 0.1
+
     return dag, _options
 
 
@@ -450,6 +485,7 @@ contact:  %s <%s>\
 
     parser = add_cds_args(parser)
     args = parser.parse_args()
+    set_workflow(args)
 
     run_cds_annotation(
         proteins=args.protein,
@@ -10,8 +10,11 @@ from collections import OrderedDict
 
 
 class GffRecord(object):
+    """
+    a GFF record, the attributes are split on the first access
+    """
+    __slots__ = ["seqid", "source", "_type", "start", "end", "score", "strand", "phase", "_attrs", "_attributes"]
 
-    #__slots__ = ["seqid", "source", "type", "start", "end", "score", strand, phase, attrs]
     def __init__(self, seqid, source, type, start, end, score, strand, phase, attrs):
         try:
             assert "\n" not in seqid
@@ -37,7 +40,18 @@ class GffRecord(object):
         self.strand = strand
         self.phase = phase
         self._attrs = attrs
-        self.attributes = self._split_attr(attrs)
+        self._attributes = None
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = self._split_attr(self._attrs)
+
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._attributes = attributes
 
     @property
     def length(self):
@@ -92,13 +106,13 @@ class GffRecord(object):
 def open_gff(fn):
     filename = abspath(expanduser(fn))
     if filename.endswith(".gz"):
-        ofs = gzip.open(filename, 'r')
+        ofs = gzip.open(filename, 'rt')
     elif filename.endswith(".dexta"):
         ofs = stream_stdout("undexta -vkU -w60 -i", filename)
     else:
         ofs = open(filename)
 
-    for line in ofs.readlines():
+    for line in ofs:
         line = line.strip()
         if line.startswith('#'):
             continue
@@ -167,6 +167,12 @@ def plot_pep(lengths, window, name):
     plt.savefig("%s.protein_length.png" % name, dpi=900)
 
 
+def cds_stat(fasta, name, gcode=11, min_length=0):
+
+    lengths = codon_usage(fasta, name, gcode, min_length)
+    plot_pep(lengths, 100, name)
+
+
 def set_args():
 
     args = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -194,8 +200,7 @@ def main():
     )
 
     args = set_args()
-    lengths = codon_usage(args.fasta, args.name, args.gcode, args.min_length)
-    plot_pep(lengths, 100, args.name)
+    cds_stat(args.fasta, args.name, args.gcode, args.min_length)
 
 
 if __name__ == "__main__":
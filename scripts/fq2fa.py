@@ -4,11 +4,12 @@
 import os
 import re
 import sys
-import gzip
 import random
 import logging
 import argparse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
+from thirdparty.seqkit.FastqReader import read_fastq, read_id
 
 LOG = logging.getLogger(__name__)
 
@@ -18,32 +19,6 @@ __email__ = "113178210@qq.com"
 __all__ = []
 
 
-def read_fastq(file):
-    '''Read fastq file'''
-    if file.endswith(".fq.gz") or file.endswith(".fastq.gz"):
-        fp = gzip.open(file)
-    elif file.endswith(".fastq") or file.endswith(".fq"):
-        fp = open(file)
-    else:
-        raise Exception("%r file format error" % file)
-
-    seq = []
-    for line in fp:
-        if type(line) == type(b''):
-            line = line.decode('utf-8')
-        line = line.strip()
-
-        if not line:
-            continue
-        seq.append(line)
-        if len(seq)>=4:
-            seq[0] = seq[0].strip("@").split()[0]
-            yield seq[0], seq[1]
-            seq = []
-
-    fp.close()
-
-
 def cut_seq(seq, minlen=250, maxlen=500):
 
     seqlen = len(seq)
@@ -64,14 +39,24 @@ def fq2fa(file, number, cut):
     if number!='all':
         number=int(number)
 
-    for seq_id,seq in read_fastq(file):
-        if n==number:
-             break
-        if cut:
-            seq = cut_seq(seq)
+    out = getattr(sys.stdout, "buffer", sys.stdout)
 
-        print('>%s\n%s' % (seq_id,seq))
-        n +=1
+    for batch in read_fastq(file):
+        lines = []
+
+        for name, seq in zip(batch.names, batch.seqs):
+            if n==number:
+                break
+            if cut:
+                seq = cut_seq(seq)
+
+            lines.append(b'>%s\n%s\n' % (read_id(name), seq))
+            n +=1
+
+        out.write(b''.join(lines))
+
+        if n==number:
+            break
 
 
 def add_args(parser):
@@ -1,61 +1,354 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import sys
 import argparse
 import logging
+from multiprocessing import Pool
 
-from Bio import SeqIO
 from GffReader import open_gff
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
+from thirdparty.seqkit.faidx import FastaIndex, FastaMemory, open_index
+
 
 LOG = logging.getLogger(__name__)
 
-__version__ = "0.1.0"
+__version__ = "0.2.0"
 __author__ = ("Junpeng Fan",)
 __email__ = "jpfan@whu.edu.cn"
 __all__ = []
 
+COMPLEMENT = bytes.maketrans(b"ACGTRYSWKMBDHVNacgtryswkmbdhvn", b"TGCAYRSWMKVHDBNtgcayrswmkvhdbn")
+# the bases of the ambiguous nucleotides (IUPAC)
+IUPAC = {"A": "A", "C": "C", "G": "G", "T": "T", "U": "T", "R": "AG", "Y": "CT", "S": "CG",
+         "W": "AT", "K": "GT", "M": "AC", "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"}
+# the ambiguous amino acids of the codons coding two amino acids, like Bio.Data.CodonTable
+AMBIGUOUS_AAS = {frozenset("ND"): "B", frozenset("QE"): "Z", frozenset("IL"): "J"}
 
-def _rev_comp(seq):
+# the genetic codes of NCBI, {gcode: (amino acids, starts)}, the codons are
+# ordered by TCAG, see https://www.ncbi.nlm.nih.gov/Taxonomy/Utils/wprintgc.cgi
+GENETIC_CODES = {
+    1: ("FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+        "---M------**--*----M---------------M----------------------------"),
+    2: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG",
+        "----------**--------------------MMMM----------**---M------------"),
+    3: ("FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+        "----------**----------------------MM---------------M------------"),
+    4: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+        "--MM------**-------M------------MMMM---------------M------------"),
+    5: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG",
+        "---M------**--------------------MMMM---------------M------------"),
+    6: ("FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+        "--------------*--------------------M----------------------------"),
+    9: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG",
+        "----------**-----------------------M---------------M------------"),
+    10: ("FFLLSSSSYY**CCCWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "----------**-----------------------M----------------------------"),
+    11: ("FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "---M------**--*----M------------MMMM---------------M------------"),
+    12: ("FFLLSSSSYY**CC*WLLLSPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "----------**--*----M---------------M----------------------------"),
+    13: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSGGVVVVAAAADDEEGGGG",
+         "---M------**----------------------MM---------------M------------"),
+    14: ("FFLLSSSSYYY*CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG",
+         "-----------*-----------------------M----------------------------"),
+    16: ("FFLLSSSSYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "----------*---*--------------------M----------------------------"),
+    21: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNNKSSSSVVVVAAAADDEEGGGG",
+         "----------**-----------------------M---------------M------------"),
+    22: ("FFLLSS*SYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "------*---*---*--------------------M----------------------------"),
+    23: ("FF*LSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "--*-------**--*-----------------M--M---------------M------------"),
+    24: ("FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSSKVVVVAAAADDEEGGGG",
+         "---M------**-------M---------------M---------------M------------"),
+    25: ("FFLLSSSSYY**CCGWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "---M------**-----------------------M---------------M------------"),
+    26: ("FFLLSSSSYY**CC*WLLLAPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "----------**--*----M---------------M----------------------------"),
+    27: ("FFLLSSSSYYQQCCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "--------------*--------------------M----------------------------"),
+    28: ("FFLLSSSSYYQQCCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "----------**--*--------------------M----------------------------"),
+    29: ("FFLLSSSSYYYYCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "--------------*--------------------M----------------------------"),
+    30: ("FFLLSSSSYYEECC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "--------------*--------------------M----------------------------"),
+    31: ("FFLLSSSSYYEECCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+         "----------**-----------------------M----------------------------"),
+}
 
-    r = ""
+# the codon tables made by codon_table, {gcode: (codons, pairs, starts, stops)}
+CODON_TABLES = {}
+# the genome of the workers, see init_worker
+WORKER = {}
 
-    transform_dict = {
-        "A": "T",
-        "T": "A",
-        "G": "C",
-        "C": "G"
-    }
 
-    for i in seq:
-        r += transform_dict[i]
+def codon_table(gcode):
+    """
+    the codon table of genetic code, the stops marked in the starts are the
+    stops at the end of genes only, they code amino acids inside. The pairs of
+    codons (4096) are also looked up at once, it halves the lookups
+    :param gcode:
+    :return: ({codon: amino acid}, {2 codons: 2 amino acids}, starts, stops), the codons are bytes
+    """
+    if gcode in CODON_TABLES:
+        return CODON_TABLES[gcode]
 
-    return r[::-1]
+    if gcode not in GENETIC_CODES:
+        raise ValueError("Genetic code %r is not supported" % gcode)
 
+    aas, marks = GENETIC_CODES[gcode]
+    codons = {}
+    starts = set()
+    stops = set()
+    n = 0
 
-def get_gene(gff, genome, _type, gcode=11, translate=False):
+    for a in "TCAG":
+        for b in "TCAG":
+            for c in "TCAG":
+                codon = (a + b + c).encode()
+                codons[codon] = aas[n]
 
-    seqobj = SeqIO.index(genome, format="fasta")
+                if marks[n] == "M":
+                    starts.add(codon)
+                if aas[n] == "*" or marks[n] == "*":
+                    stops.add(codon)
+                n += 1
 
-    for g in open_gff(gff):
-        seq = seqobj[g.seqid][g.start-1: g.end].seq
-        
-        if "N" in str(seq).upper():
+    pairs = dict((i + j, codons[i] + codons[j]) for i in codons for j in codons)
+    CODON_TABLES[gcode] = (codons, pairs, starts, stops)
+
+    return CODON_TABLES[gcode]
+
+
+def rev_comp(seq):
+    """
+    the reverse complement of seq
+    :param seq: bytes
+    :return: bytes
+    """
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def expand_codon(codon):
+    """
+    the codons of an ambiguous codon, eg: GGR -> GGA, GGG
+    :param codon: bytes
+    :return: [bytes, ...], empty if a base is unknown
+    """
+    r = [b""]
+
+    for i in codon.decode():
+        r = [j + k.encode() for j in r for k in IUPAC.get(i, "")]
+
+    return r
+
+
+def translate_codon(codon, codons):
+    """
+    the amino acid of codon, an ambiguous codon is translated if all its codons
+    code the same amino acid (or B, Z, J like Biopython), else it is "X"
+    :param codon: bytes
+    :param codons: see codon_table
+    :return: string
+    """
+    if codon in codons:
+        return codons[codon]
+
+    aas = set(codons.get(i) for i in expand_codon(codon))
+
+    if not aas or None in aas:
+        return "X"
+
+    if len(aas) == 1:
+        return aas.pop()
+
+    return AMBIGUOUS_AAS.get(frozenset(aas), "X")
+
+
+def is_codon_of(codon, group):
+    """
+    whether codon is in group (eg: the starts), all codons of an ambiguous codon must be
+    """
+    if codon in group:
+        return True
+
+    codons = expand_codon(codon)
+
+    return bool(codons) and all(i in group for i in codons)
+
+
+def translate_cds(seq, gcode=11):
+    """
+    translate a complete CDS like Bio.Seq.translate(cds=True), the start
+    codon is translated to M and the stop codon is removed
+    :param seq: bytes
+    :param gcode:
+    :return: string
+    """
+    codons, pairs, starts, stops = codon_table(gcode)
+    seq = seq.upper()
+
+    if len(seq) % 3:
+        raise ValueError("Sequence length %s is not a multiple of three" % len(seq))
+    if not is_codon_of(seq[:3], starts):
+        raise ValueError("First codon %r is not a start codon" % seq[:3].decode())
+    if not is_codon_of(seq[-3:], stops):
+        raise ValueError("Final codon %r is not a stop codon" % seq[-3:].decode())
+
+    end = len(seq) - 3
+    # the codons between the start and stop by pairs, the ambiguous codons are resolved if they can be
+    r = [pairs.get(seq[i:i+6]) or translate_codon(seq[i:i+3], codons) + translate_codon(seq[i+3:i+6], codons)
+         for i in range(3, end - (end - 3) % 6, 6)]
+
+    if (end - 3) % 6:
+        r.append(translate_codon(seq[end-3:end], codons))
+
+    r = "".join(r)
+
+    if "*" in r:
+        raise ValueError("Extra in frame stop codon found")
+
+    return "M" + r
+
+
+def init_worker(genome):
+
+    # the sequences loaded in memory by the parent are shared by fork
+    if not isinstance(WORKER.get("genome"), FastaMemory):
+        WORKER["genome"] = FastaIndex(genome)
+
+
+def extract_genes(features, gcode=11, outputs=("cds",), flank=0, genome=None):
+    """
+    extract the sequences of features on a contig
+    :param features: [(id, type, seqid, start, end, strand), ...]
+    :param gcode:
+    :param outputs: the sequences returned, "cds", "protein" and "gene" (with flank)
+    :param flank: the bases on both sides of "gene"
+    :param genome: FastaIndex object, the genome of the worker if None
+    :return: {output: string of fasta records}
+    """
+    if genome is None:
+        genome = WORKER["genome"]
+    r = dict((i, []) for i in outputs)
+
+    for _id, _type, seqid, start, end, strand in features:
+        seq = genome.fetch(seqid, start, end)
+
+        if b"N" in seq.upper():
             continue
 
-        if g.strand == "-":
-            seq = seq.reverse_complement()
+        title = ">%s [type=%s] [position=%s..%s,strand=%s]\n" % (_id, _type, start, end, strand)
 
-        if g.type in _type:
-            if g.type == "CDS" and translate:
-                seq = seq.translate(table=gcode, cds=True)
+        if strand == "-":
+            seq = rev_comp(seq)
 
-            if 'ID' in g.attributes:
-                _id = g.attributes["ID"]
+        if "cds" in r:
+            r["cds"].append("%s%s\n" % (title, seq.decode()))
+
+        if "protein" in r:
+            if _type == "CDS":
+                r["protein"].append("%s%s\n" % (title, translate_cds(seq, gcode)))
             else:
-                _id = g.attributes["Parent"]
-            print(">%s [type=%s] [position=%s..%s,strand=%s]\n%s" % (_id, g.type, g.start, g.end, g.strand, seq))
+                r["protein"].append("%s%s\n" % (title, seq.decode()))
+
+        if "gene" in r:
+            _start = max(start - flank, 1)
+            _end = min(end + flank, genome.length(seqid))
+            seq = genome.fetch(seqid, _start, _end)
+
+            if strand == "-":
+                seq = rev_comp(seq)
+
+            r["gene"].append(">%s [type=%s] [position=%s..%s,strand=%s] [flank=%s]\n%s\n" % (
+                _id, _type, _start, _end, strand, flank, seq.decode()))
+
+    return dict((i, "".join(j)) for i, j in r.items())
+
+
+def group_features(gff, _type):
+    """
+    the features of types in gff, grouped by the contigs in order
+    :return: [(id, type, seqid, start, end, strand), ...] of each contig
+    """
+    r = []
+
+    for g in open_gff(gff):
+        if g.type not in _type:
+            continue
+
+        if r and r[-1][2] != g.seqid:
+            yield r
+            r = []
+
+        if 'ID' in g.attributes:
+            _id = g.attributes["ID"]
+        else:
+            _id = g.attributes["Parent"]
+
+        r.append((_id, g.type, g.seqid, g.start, g.end, g.strand))
+
+    if r:
+        yield r
+
+
+def get_gene(gff, genome, _type, gcode=11, translate=False, cds="", protein="", gene="",
+             flank=0, thread=1):
+    """
+    extract the sequences of features in one pass of gff, the contigs run in
+    thread processes
+    :param gff:
+    :param genome:
+    :param _type: the types of features, eg: ["CDS"]
+    :param gcode: the genetic code of proteins
+    :param translate: print the proteins of CDS if no output files
+    :param cds: the output file of the sequences
+    :param protein: the output file of the proteins of CDS
+    :param gene: the output file of the sequences with flank
+    :param flank: the bases on both sides of the sequences in gene
+    :param thread: the processes
+    :return:
+    """
+    files = [(i, j) for i, j in [("cds", cds), ("protein", protein), ("gene", gene)] if j]
+
+    if files:
+        handles = dict((i, open(j, "w")) for i, j in files)
+    else:
+        handles = {"protein" if translate else "cds": sys.stdout}
+
+    outputs = tuple(handles.keys())
+    codon_table(gcode)
+
+    # the index is built once before the workers open it
+    fasta = open_index(genome)
+
+    if thread > 1:
+        WORKER["genome"] = fasta
+        pool = Pool(processes=thread, initializer=init_worker, initargs=(genome,))
+        results = pool.imap(_extract_genes, ((i, gcode, outputs, flank) for i in group_features(gff, _type)))
+    else:
+        results = (extract_genes(i, gcode, outputs, flank, fasta) for i in group_features(gff, _type))
+
+    try:
+        for r in results:
+            for i in outputs:
+                handles[i].write(r[i])
+    finally:
+        if thread > 1:
+            pool.terminate()
+        fasta.close()
+
+        for i, j in files:
+            handles[i].close()
+
+
+def _extract_genes(args):
+
+    return extract_genes(*args)
 
 
 def set_args():
@@ -63,6 +356,8 @@ def set_args():
     args = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                    description="""
 description:
+    get_gene.py --gff genomic.gff3 --genome genomic.fasta --type CDS --translate --gcode 11 > protein.fasta
+    get_gene.py --gff genomic.gff3 --genome genomic.fasta --type CDS --protein protein.fasta --cds RNA.fasta
 
 version: %s
 contact:  %s <%s>\
@@ -70,9 +365,20 @@ contact:  %s <%s>\
 
     args.add_argument("--gff", help="")
     args.add_argument("--genome", help="")
-    args.add_argument("--type", nargs="+")
-    args.add_argument("--gcode", type=int,)
-    args.add_argument("--translate", action="store_true")
+    args.add_argument("--type", nargs="+", default=["CDS"])
+    args.add_argument("--gcode", type=int, default=11)
+    args.add_argument("--translate", action="store_true",
+                      help="print the proteins of CDS, if no output files")
+    args.add_argument("--cds", metavar="FILE", default="",
+                      help="output the sequences of features to FILE")
+    args.add_argument("--protein", metavar="FILE", default="",
+                      help="output the proteins of CDS to FILE")
+    args.add_argument("--gene", metavar="FILE", default="",
+                      help="output the sequences of features with --flank to FILE")
+    args.add_argument("--flank", metavar="INT", type=int, default=0,
+                      help="the bases on both sides of the sequences in --gene (default: 0)")
+    args.add_argument("-t", "--thread", metavar="INT", type=int, default=1,
+                      help="the processes reading the contigs (default: 1)")
 
     return args.parse_args()
 
@@ -85,9 +391,9 @@ def main():
     )
 
     args = set_args()
-    get_gene(args.gff, args.genome, args.type, args.gcode, args.translate)
+    get_gene(args.gff, args.genome, args.type, args.gcode, args.translate,
+             args.cds, args.protein, args.gene, args.flank, args.thread)
 
 
 if __name__ == "__main__":
     main()
-
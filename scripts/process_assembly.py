@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import sys
 import argparse
 import logging
-from Bio import SeqIO
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
+from thirdparty.seqkit.FastaReader import yield_fasta_blocks
 
 LOG = logging.getLogger(__name__)
 
@@ -14,38 +17,54 @@ __email__ = "jpfan@whu.edu.cn"
 __all__ = []
 
 
-def process_assembly(fasta, _format, min_length, organism, strain, gcode):
+def format_fasta(name, seq, width=60):
+    """
+    format a fasta record like Bio.SeqIO, the seq is wrapped by width
+    :param name:
+    :param seq: bytes
+    :param width:
+    :return: string
+    """
+    lines = [seq[i:i+width] for i in range(0, len(seq), width)]
 
-    n = 1
+    return ">%s\n%s" % (name, b"".join(i + b"\n" for i in lines).decode())
 
-    if _format:
-        records = sorted(SeqIO.parse(fasta, "fasta"), key=lambda k: len(k), reverse=True)
-    else:
-        records = SeqIO.parse(fasta, "fasta")
 
-    for record in records:
+def process_assembly(fasta, _format, min_length, organism, strain, gcode):
 
-        if len(record.seq) < min_length:
-            continue
-        record.seq = record.seq.upper()
-        record.description = record.description.split(None, 1)
-        
-        if len(record.description)>=2:
-            record.description = record.description[1]
-        else:
-            record.description = ""
+    n = 1
 
+    # the records keep the bytes of sequences, see FastaBytesRecord
+    with open(fasta, "rb") as fh:
         if _format:
-            record.id = _format % n
-        if organism:
-            record.description += " [organism=%s]" % organism
-        if strain:
-            record.description += " [strain=%s]" % strain
-        if gcode:
-            record.description += " [gcode=%s]" % gcode
-
-        print(record.format("fasta"))
-        n += 1
+            records = sorted(yield_fasta_blocks(fh), key=lambda k: len(k), reverse=True)
+        else:
+            records = yield_fasta_blocks(fh)
+
+        for record in records:
+
+            if len(record) < min_length:
+                continue
+            seq = record.raw_seq.upper()
+            record_id = record.id
+            description = record.description
+
+            if _format:
+                record_id = _format % n
+            if organism:
+                description += " [organism=%s]" % organism
+            if strain:
+                description += " [strain=%s]" % strain
+            if gcode:
+                description += " [gcode=%s]" % gcode
+
+            if description and description.split(None, 1)[0] != record_id:
+                name = "%s %s" % (record_id, description)
+            else:
+                name = description or record_id
+
+            print(format_fasta(name, seq))
+            n += 1
 
 
 def add_args(parser):
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from thirdparty.seqkit.faidx import FastaIndex, FastaMemory, open_index
+
+
+class OpenIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, string):
+        path = os.path.join(self.dir, name)
+
+        with open(path, "w") as fh:
+            fh.write(string)
+
+        return path
+
+    def test_same_width(self):
+        path = self.write("same.fa", ">a desc\nACGT\nACGT\nAC\n>b\nTTGG\nC\n")
+
+        with open_index(path) as fasta:
+            self.assertIsInstance(fasta, FastaIndex)
+            self.assertNotIsInstance(fasta, FastaMemory)
+            self.assertEqual(fasta.keys(), ["a", "b"])
+            self.assertEqual(fasta.fetch("a", 3, 7), b"GTACG")
+            self.assertEqual(fasta.fetch("b"), b"TTGGC")
+
+    def test_uneven_width(self):
+        path = self.write("uneven.fa", ">a desc\nACG\nTACGTA\nC\n\n>b\nTT\nGGC\n")
+
+        with open_index(path) as fasta:
+            self.assertIsInstance(fasta, FastaMemory)
+            self.assertEqual(fasta.keys(), ["a", "b"])
+            self.assertEqual(fasta.length("a"), 10)
+            self.assertEqual(fasta.fetch("a", 3, 7), b"GTACG")
+            self.assertEqual(fasta.fetch("a", 8, 20), b"TAC")
+            self.assertEqual(fasta.fetch("b"), b"TTGGC")
+            self.assertEqual(fasta.fetch("b", 4, 2), b"")
+
+        self.assertFalse(os.path.exists(path + ".fai"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
-from .dag import DAG, Task, ParallelTask, set_tasks_order
-from .do_dag import do_dag
+from .dag import DAG, Task, ParallelTask, PythonTask, set_tasks_order, register_executor
+from .do_dag import do_dag, set_defaults
 
 __version__ = "0.2.2"
 __author__ = ("Junpeng Fan", )
@@ -0,0 +1,76 @@
+import os.path
+import json
+import hashlib
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+def file_signature(path, digest=False):
+    """
+    the signature of a file, size and mtime by default or the sha1 of content
+    :param path:
+    :param digest: use the sha1 of content, slow for big files
+    :return: string
+    """
+    path = os.path.abspath(path)
+
+    if not os.path.exists(path):
+        return "%s:missing" % path
+
+    if os.path.isdir(path):
+        return "%s:dir" % path
+
+    if not digest:
+        stat = os.stat(path)
+        return "%s:%s:%s" % (path, stat.st_size, int(stat.st_mtime))
+
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            sha1.update(block)
+
+    return "%s:%s" % (path, sha1.hexdigest())
+
+
+def task_key(task, depends_keys, digest=False, skip=()):
+    """
+    the cache key of a task, the hash of its script, tool versions, declared inputs
+    and the keys of the tasks it depends on. A changed task changes the keys of
+    all its downstream tasks.
+    :param task: Task object
+    :param depends_keys: keys of the tasks depended
+    :param digest: see file_signature
+    :param skip: the inputs not signed, eg: the temporary files removed after use
+    :return: string
+    """
+    # the key of a fused task is the key of its last task, see fusion.py
+    if task.members:
+        for member in task.members:
+            member.key = task_key(member, depends_keys, digest, skip)
+            depends_keys = [member.key]
+
+        return member.key
+
+    sha1 = hashlib.sha1()
+    sha1.update(task.script.encode("utf-8"))
+    sha1.update(json.dumps(task.tools, sort_keys=True).encode("utf-8"))
+
+    for path in sorted(set(task.inputs) - set(skip)):
+        sha1.update(file_signature(path, digest).encode("utf-8"))
+
+    for key in sorted(depends_keys):
+        sha1.update(str(key).encode("utf-8"))
+
+    return sha1.hexdigest()
+
+
+def read_key(done):
+    """
+    read the cache key in done file, old done files are empty
+    :param done:
+    :return:
+    """
+    with open(done) as fh:
+        return fh.read().strip()
@@ -1,12 +1,35 @@
 import os.path
 from collections import OrderedDict
+import re
+import math
 import json
 import logging
-import subprocess
 import time
 
+from .cache import read_key
+from . import runner
+
 
 LOG = logging.getLogger(__name__)
+# the backends of task types, {type: Executor}, see executor.py
+EXECUTORS = OrderedDict()
+
+
+def register_executor(type, executor):
+    """
+    register the backend running the tasks of type
+    :param type: eg: sge, slurm
+    :param executor: Executor object
+    :return:
+    """
+    EXECUTORS[type] = executor
+
+    return executor
+
+
+def get_executor(type):
+
+    return EXECUTORS[type]
 
 
 class DAG(object):
@@ -18,7 +41,7 @@ class DAG(object):
 
     def add_task(self, *tasks):
         for task in tasks:
-            assert id not in self.tasks, "task id %r has been exist in DAG" % id
+            assert task.id not in self.tasks, "task id %r has been exist in DAG" % task.id
             self.tasks[task.id] = task
 
         return 1
@@ -48,7 +71,7 @@ class DAG(object):
         for dag in dags:
             assert isinstance(dag, DAG)
 
-            for task in dag.tasks:
+            for task in dag.tasks.values():
 
                 if not task.depends:
                     task.set_upstream(*last_task)
@@ -57,6 +80,71 @@ class DAG(object):
 
         return 1
 
+    def set_group(self, group):
+        """
+        add group (eg: sample name) to the ids of tasks, so that the DAGs of
+        samples can be merged into one. The done files keep their names, a task
+        finished in a single sample run is not rerun.
+        :param group:
+        :return:
+        """
+        ids = OrderedDict((id, "%s_%s" % (id, group)) for id in self.tasks)
+        tasks = OrderedDict()
+
+        for id, task in self.tasks.items():
+            task.id = ids[id]
+            task.group = group
+            task.depends = [ids.get(i, i) for i in task.depends]
+            tasks[task.id] = task
+
+        self.tasks = tasks
+
+        return self
+
+    def validate(self):
+        """
+        check the depends of tasks before running, raise Exception if
+        a task depends on a task not in DAG or the tasks have a cycle
+        :return: the task ids in topological order
+        """
+        missing = []
+        downstream = OrderedDict((id, []) for id in self.tasks)
+        pending = {}
+
+        for id, task in self.tasks.items():
+            depends = set(task.depends)
+            pending[id] = len(depends)
+
+            for _id in depends:
+                if _id not in self.tasks:
+                    missing.append("%s -> %s" % (_id, id))
+                    continue
+                downstream[_id].append(id)
+
+        if missing:
+            msg = "DAG %r has depends not in DAG:\n%s" % (self.id, "\n".join(missing))
+            LOG.error(msg)
+            raise Exception(msg)
+
+        # Kahn's algorithm, the tasks left are in or behind a cycle
+        order = [id for id in self.tasks if pending[id] == 0]
+        n = 0
+
+        while n < len(order):
+            for _id in downstream[order[n]]:
+                pending[_id] -= 1
+                if pending[_id] == 0:
+                    order.append(_id)
+            n += 1
+
+        if len(order) != len(self.tasks):
+            cycle = [id for id in self.tasks if pending[id] > 0]
+            msg = "DAG %r has a cycle in tasks: %s" % (self.id, ", ".join(cycle))
+            LOG.error(msg)
+            raise Exception(msg)
+
+        return order
+
     def to_json(self):
 
         jsn = OrderedDict()
@@ -108,23 +196,65 @@ class Task(object):
 
     TASKS = []
 
-    def __init__(self, id, script, work_dir=".", type="sge", option=""):
+    def __init__(self, id, script, work_dir=".", type="sge", option="",
+                 inputs=None, tools=None, retry=None, temp=None, stage="", outputs=None):
+        """
+        :param inputs: input files of the task, used with the script and tools
+                       to check whether a finished task should be rerun
+        :param tools: versions of tools used, eg: {"fastp": {"version": "0.20.0"}}
+        :param retry: the retry policy of the task, override the defaults of do_dag,
+                      eg: {"retries": 2, "backoff": 60, "escalate_memory": 1.5}
+        :param temp: temporary files or directories made by the task (relative to work_dir),
+                     removed when the task, its downstream tasks and the tasks with them
+                     in inputs succeeded, see do_dag.TaskIndex
+        :param stage: run the script in $TMPDIR of the node with do_dag(stage), the inputs
+                      are linked ("link") or copied ("copy") there, see staged_script
+        :param outputs: the files moved back to work_dir after a staged run (relative to
+                        work_dir), default all new files
+        """
 
-        assert type in ["sge", "local"], "type must be sge or local "
+        assert type in EXECUTORS, "type must be %s" % ", ".join(EXECUTORS)
 
         self.id = id
+        self.name = id
         self.TASKS.append(id)
         self.work_dir = os.path.abspath(work_dir)
         self.script = script
         self.type = type
         self._option = option
         self.done = os.path.join(self.work_dir, "%s_done" % id)
+        self.inputs = [os.path.abspath(i) for i in inputs or []]
+        self.tools = tools or {}
+        self.retry = retry or {}
+        self.temp = [os.path.join(self.work_dir, i) for i in temp or []]
+        assert stage in ["", "link", "copy"], "stage must be link or copy"
+        self.stage = stage
+        self.outputs = list(outputs or [])
+        self.key = ""
 
         self.depends = []
+        self.group = None
+        self.array = None
+        # the relative run time of the task when no history, see priority.py
+        self.weight = 1
+        # the bytes of inputs and the memory predicted by the history, see predict.py
+        self.size = 0
+        self.predicted_memory = 0
+        # the function of python tasks, see PythonTask
+        self.function = ""
+        self.args = []
+        self.kwargs = {}
+        # the tasks run in the job of this task, see fusion.py
+        self.members = []
         self.status = None
         self.run_id = -1
         self.start_time = 0
         self.end_time = 0
+        self.attempts = 0
+        self.usage = {}
+        self.not_before = 0
+        self.node = ""
+        self.exclude = []
 
     @property
     def option(self):
@@ -144,6 +274,89 @@ class Task(object):
 
         return option
 
+    @property
+    def slots(self):
+        """
+        the number of cpus requested by "-pe smp N", default 1
+        :return:
+        """
+        pe = self.option.get("pe", "")
+
+        if not isinstance(pe, str):
+            return 1
+
+        g = re.search(r"(\d+)", pe)
+        if g:
+            return max(int(g.group(1)), 1)
+
+        return 1
+
+    @property
+    def memory(self):
+        """
+        the memory (bytes) requested by "-l vf=4G" (or h_vmem, mem_free), default
+        the memory predicted, see predict.Predictor
+        :return:
+        """
+        resource = self.option.get("l", "")
+
+        if not isinstance(resource, str):
+            return self.predicted_memory
+
+        g = re.search(r"(?:vf|h_vmem|mem_free|mem)=([\d.]+[KMGTkmgt]?)", resource)
+        if g:
+            return str2bytes(g.group(1))
+
+        return self.predicted_memory
+
+    def escalate(self, slots=1, memory=1):
+        """
+        multiply the cpus of "-pe smp N" and the memory of "-l vf=4G" requested
+        :param slots: factor of cpus
+        :param memory: factor of memory
+        :return:
+        """
+        option = str2dict(self._option)
+
+        if slots > 1 and isinstance(option.get("pe"), str):
+            option["pe"] = re.sub(r"\d+", lambda m: "%s" % int(math.ceil(int(m.group()) * slots)), option["pe"], 1)
+
+        if memory > 1 and isinstance(option.get("l"), str):
+            option["l"] = re.sub(
+                r"((?:vf|h_vmem|mem_free|mem)=)([\d.]+[KMGTkmgt]?)",
+                lambda m: "%s%sM" % (m.group(1), int(math.ceil(str2bytes(m.group(2)) * memory / 1e+06))),
+                option["l"]
+            )
+
+        self._option = dict2str(option)
+
+        # the tasks asking no memory are sized by the prediction
+        if memory > 1 and self.predicted_memory and self.memory == self.predicted_memory:
+            self.predicted_memory = int(self.predicted_memory * memory)
+
+        if slots > 1 or memory > 1:
+            LOG.info("task %r asks for %s cpus and %s bytes memory" % (self.id, self.slots, self.memory))
+
+        return self
+
+    def qsub_option(self, option=None):
+        """
+        the option of qsub, the nodes in exclude are not used
+        :param option: default self.option
+        :return: string
+        """
+        option = dict(option or self.option)
+
+        if self.exclude:
+            hosts = "h=%s" % "&".join("!%s" % i for i in self.exclude)
+
+            if isinstance(option.get("l"), str) and option["l"]:
+                option["l"] = "'%s,%s'" % (option["l"], hosts)
+            else:
+                option["l"] = "'%s'" % hosts
+
+        return dict2str(option)
+
     @property
     def run_time(self):
         """
@@ -181,6 +394,108 @@ class Task(object):
 
         return 1
 
+    def fused_script(self):
+        """
+        the script of the tasks fused, each task writes its own logs and done
+        file and is skipped if done, the tasks after a rerun task are rerun.
+        The logs are rotated like the logs of local tasks, see runner.command
+        :return:
+        """
+        script = """\
+rerun=0
+fifo=$(mktemp -d "${TMPDIR:-/tmp}/dagflow.XXXXXX")
+trap 'rm -rf "$fifo"' EXIT
+mkfifo $fifo/out $fifo/err
+"""
+
+        for task in self.members:
+            mkdir(task.work_dir)
+            script += """
+# {id}
+if [ $rerun = 1 ] || [ ! -f {done} ] || [ -s {done} -a "$(cat {done})" != "{key}" ]; then
+rerun=1
+cd {work_dir}
+{rotate_out} <$fifo/out &
+{rotate_err} <$fifo/err &
+(
+{script}
+) >$fifo/out 2>$fifo/err
+wait
+echo {key} > {done}
+fi
+""".format(id=task.id, done=task.done, key=task.key, work_dir=task.work_dir, script=task.script,
+           rotate_out=runner.command(task.option["o"]), rotate_err=runner.command(task.option["e"]))
+
+        return script
+
+    def get_script(self):
+        """
+        the script run in the job, see fused_script and staged_script
+        :return:
+        """
+        if self.members:
+            return self.fused_script()
+
+        if self.stage:
+            return self.staged_script(self.script)
+
+        return self.script
+
+    def staged_script(self, script):
+        """
+        run script in a new directory of $TMPDIR on the node, the outputs are
+        copied back beside and renamed, so the files in work_dir are never partial.
+        The directory is removed on exit, the outputs of failed runs are dropped.
+        :param script:
+        :return:
+        """
+        names = []
+        copied = {}
+        r = """\
+stage=$(mktemp -d "${TMPDIR:-/tmp}/dagflow.XXXXXX")
+trap 'rm -rf "$stage"' EXIT
+"""
+        for path in self.inputs:
+            name = os.path.basename(path)
+
+            # the inputs of the same name are used in place
+            if name in names:
+                continue
+            names.append(name)
+
+            if self.stage == "copy":
+                r += "cp -r %s $stage/%s\n" % (path, name)
+                copied[path] = name
+            else:
+                r += "ln -s %s $stage/%s\n" % (path, name)
+
+        # the whole paths are replaced, the longest first, and the paths in a
+        # directory copied are moved with it
+        if copied:
+            pattern = re.compile(r"(?<![\w./-])(%s)(?![\w.-])" % "|".join(
+                re.escape(i) for i in sorted(copied, key=len, reverse=True)))
+            script = pattern.sub(lambda m: "$stage/%s" % copied[m.group(1)], script)
+
+        if self.outputs:
+            outputs = " ".join(self.outputs)
+        else:
+            outputs = "$(ls -A $stage)"
+
+        r += """cd $stage
+{script}
+cd {work_dir}
+for name in {outputs}; do
+    case " {inputs} " in *" $name "*) continue;; esac
+    mkdir -p $(dirname $name)
+    rm -rf $name.staged
+    cp -r $stage/$name $name.staged
+    rm -rf $name
+    mv $name.staged $name
+done
+""".format(script=script, work_dir=self.work_dir, outputs=outputs, inputs=" ".join(names))
+
+        return r
+
     def write_script(self):
         """
         write script to .sh
@@ -193,10 +508,10 @@ date
 cd {}
 echo task start
 {}
-touch {}
+echo {} > {}
 echo task done
 date
-""".format(self.work_dir, self.script, self.done)
+""".format(self.work_dir, self.get_script(), self.key, self.done)
 
         mkdir(self.work_dir)
 
@@ -211,67 +526,58 @@ date
     """
     def init(self):
         """
-        init the job status
+        init the job status, a done file with a different cache key is removed
         :return:
         """
         if os.path.isfile(self.done):
-            self.status = "success"
-        elif not self.depends:
+            if self.is_done() and all(i.is_done() for i in self.members):
+                self.status = "success"
+                return self.status
+
+            LOG.info("task %r changed since last run, rerun it" % self.id)
+            os.remove(self.done)
+
+        if not self.depends:
             self.status = "waiting"
         else:
             self.status = "preparing"
 
-    def run(self):
+        return self.status
+
+    def is_done(self):
         """
-        run the job
+        whether the done file holds the cache key of task
         :return:
         """
+        if not os.path.isfile(self.done):
+            return False
 
-        self.write_script()
+        key = read_key(self.done)
 
-        if self.type == "sge":
+        # the done files of old versions have no key
+        return not key or key == self.key
 
-            qsub_option = dict2str(self.option)
-            _id = self.id
-            script_path = os.path.join(self.work_dir, "%s.sh" % self.id)
-            run_cmd = "qsub {qsub_option} -N {_id} {script_path}".format(**locals())
-
-            _id = os.popen(run_cmd).read().strip().split()[2]
-
-            try:
-                int(_id)
-            except:
-                LOG.error(_id)
-                raise Exception(_id)
-
-            self.run_id = _id
-            self.start_time = time.time()
-            self.status = "running"
-            LOG.info("qsub task %r on sge, qid: %r" % (self.id, self.run_id))
-
-            return 0
-
-        elif self.type == "local":
-            script_path = os.path.join(self.work_dir, "%s.sh" % self.id)
-            run_cmd = "sh %s" % script_path
+    def reset(self):
+        """
+        remove the done file and rerun the task, the tasks fused are all rerun
+        :return:
+        """
+        for task in [self] + self.members:
+            if os.path.isfile(task.done):
+                os.remove(task.done)
 
-            child = subprocess.Popen(
-                run_cmd,
-                stdout=open(self.option["o"], "w"),
-                stderr=open(self.option["e"], "w"),
-                shell=True
-            )
+        self.status = None
+        return self.init()
 
-            self.run_id = child
-            self.start_time = time.time()
-            self.status = "running"
-            LOG.info("running task %r on local, pid: %r" % (self.id, self.run_id.pid))
+    def run(self):
+        """
+        run the job by the executor of its type, see executor.py
+        :return:
+        """
 
-            return 0
-        else:
-            pass
+        self.attempts += 1
 
-        return 1
+        return EXECUTORS[self.type].submit(self)
 
     def kill(self):
         """
@@ -281,21 +587,18 @@ date
         if self.status != "running":
             return 1
 
-        kill_cmd = ""
-        if self.type == "sge":
-            kill_cmd = "qdel %s" % self.run_id
-            LOG.info("qdel task %r on sge, qid: %r" % (self.id, self.run_id))
-        elif self.type == "local":
-            kill_cmd = "kill %s" % self.run_id
-            LOG.info("kill task %r on local, pid: %r" % (self.id, self.run_id))
-        else:
-            pass
-
-        os.popen(kill_cmd)
+        EXECUTORS[self.type].kill(self)
         self.check_done()
 
         return 1
 
+    def poll(self):
+        """
+        check whether the task exited
+        :return: None if running else the exit code
+        """
+        return EXECUTORS[self.type].poll(self)
+
     def check_done(self):
         """
         check the status of done task
@@ -309,6 +612,7 @@ date
             return 1
         else:
             self.status = "failed"
+            self.end_time = time.time()
             LOG.info("task %r run but failed" % self.id)
 
             return 0
@@ -333,6 +637,16 @@ date
 
         task._option = dict2str(task_dict["option"])
         task.depends = task_dict["depends"]
+        task.inputs = task_dict.get("inputs", [])
+        task.tools = task_dict.get("tools", {})
+        task.array = task_dict.get("array")
+        task.retry = task_dict.get("retry", {})
+        task.function = task_dict.get("function", "")
+        task.args = task_dict.get("args", [])
+        task.kwargs = task_dict.get("kwargs", {})
+        task.temp = task_dict.get("temp", [])
+        task.stage = task_dict.get("stage", "")
+        task.outputs = task_dict.get("outputs", [])
 
         return task
 
@@ -350,9 +664,20 @@ date
                 "type": self.type,
                 "option": self.option,
                 "depends": self.depends,
+                "inputs": self.inputs,
+                "tools": self.tools,
+                "array": self.array,
+                "retry": self.retry,
+                "function": self.function,
+                "args": self.args,
+                "kwargs": self.kwargs,
+                "temp": self.temp,
+                "stage": self.stage,
+                "outputs": self.outputs,
                 "status": self.status,
                 "start": self.start_time,
-                "end": self.end_time
+                "end": self.end_time,
+                "usage": self.usage
             }
         )}
 
@@ -375,7 +700,18 @@ def mkdir(d):
     return d
 
 
-def ParallelTask(id, script="", work_dir="", type="sge", option="", **extra):
+def ParallelTask(id, script="", work_dir="", type="sge", option="",
+                 inputs=None, tools=None, retry=None, temp=None, stage="", outputs=None, **extra):
+    """
+    create a task for each value of the list options in extra
+    :param inputs: input files of each task, formatted with the options, eg: ["{protein}"]
+    :param tools: see Task
+    :param retry: see Task
+    :param temp: temporary files of each task, formatted like inputs, see Task
+    :param stage: see Task
+    :param outputs: the outputs of each task, formatted like inputs, see Task
+    :return: a list of tasks, sge tasks can be submitted as one array job, see Executor.submit_array
+    """
     parallel_num = 0
 
     args = {}
@@ -409,14 +745,61 @@ def ParallelTask(id, script="", work_dir="", type="sge", option="", **extra):
             work_dir=work_dir.format(id=_id, **args),
             script=script.format(**args),
             type=type,
-            option=option.format(**args)
+            option=option.format(**args),
+            inputs=[i.format(**args) for i in inputs or []],
+            tools=tools,
+            retry=retry,
+            temp=[i.format(**args) for i in temp or []],
+            stage=stage,
+            outputs=[i.format(**args) for i in outputs or []]
         )
+        task.array = id
 
         tasks.append(task)
 
     return tasks
 
 
+def PythonTask(id, function, args=None, kwargs=None, work_dir=".", stdout="",
+               inputs=None, tools=None, retry=None):
+    """
+    create a task running a python function in the warm worker pool, without
+    the startup of python and the imports for each task
+    :param function: "path/to/script.py:name" or "package.module:name", the
+                     function fails by raising exceptions or returning non zero
+    :param args: the json arguments of function
+    :param kwargs:
+    :param stdout: the file of the stdout of function, default {id}.STDOUT
+    :return: Task object
+    """
+    args = list(args or [])
+    kwargs = dict(kwargs or {})
+    inputs = list(inputs or [])
+    path = function.rsplit(":", 1)[0]
+
+    # the script is an input, the task is rerun when it changed
+    if path.endswith(".py"):
+        path = os.path.abspath(path)
+        function = "%s:%s" % (path, function.rsplit(":", 1)[1])
+        inputs.append(path)
+
+    task = Task(
+        id=id,
+        work_dir=work_dir,
+        script="%s(*%s, **%s)" % (function, json.dumps(args), json.dumps(kwargs, sort_keys=True)),
+        type="python",
+        option="-o %s" % os.path.abspath(stdout) if stdout else "",
+        inputs=inputs,
+        tools=tools,
+        retry=retry
+    )
+    task.function = function
+    task.args = args
+    task.kwargs = kwargs
+
+    return task
+
+
 def set_tasks_order(task1, task2):
 
     assert isinstance(task1, list)
@@ -461,6 +844,21 @@ def str2dict(string):
     return r
 
 
+def str2bytes(string):
+    """
+    transform memory string "4G", "500M", "100K" or "1024" to bytes
+    :param string:
+    :return:
+    """
+    string = string.strip().upper()
+    units = {"K": 1e+03, "M": 1e+06, "G": 1e+09, "T": 1e+12}
+
+    if string and string[-1] in units:
+        return int(float(string[:-1]) * units[string[-1]])
+
+    return int(float(string))
+
+
 def dict2str(params, header="-"):
     """
     transform **params to real program param
@@ -1,186 +1,806 @@
 import os
 from collections import OrderedDict
 import sys
+import shutil
+import getpass
+import heapq
 import logging
 import time
+import select
 import signal
 
+from .dag import EXECUTORS, dict2str, get_executor
+from .cache import task_key
+from .store import TaskStore, store_path
+from .poller import get_poller
+from .timeline import write_profile
+from .priority import critical_path_priority, estimate
+from .predict import Predictor, input_sizes, simulate, write_prediction
+from .fusion import fuse_tasks
+from .server import LocalClient
+from . import pool
+from . import runner
+# register the backends of task types
+from . import executor
 
 LOG = logging.getLogger(__name__)
 TASKS = OrderedDict()
 TASK_NAME = ""
+WAKEUP_FD = None
+STORE = None
+RESUME = False
+CLIENT = None
+# the temporary files of tasks and the tasks using them, see temp_users
+TEMP = OrderedDict()
+
+# the failures of tasks on each node in this run
+BLACKLIST = OrderedDict()
+
+# the shortest interval (seconds) between two polls of the cluster queues, the interval is
+# doubled when nothing changes and reset to this value when a cluster task changes status
+MIN_REFRESH_TIME = 5
+
+# the machine wide resources for local tasks, changed by set_defaults
+DEFAULTS = {
+    "cpus": None,
+    "memory": None,
+    "digest": False,
+    "resume": False,
+    # the task store, only kept when the runs are resumed or recorded, see open_store
+    "store": None,
+    "array": False,
+    "poll_cache": "",
+    # write the timeline of the tasks run, see timeline.py
+    "profile": False,
+    # the retry policy of tasks, overridden by Task.retry
+    "retries": 0,
+    "backoff": 30,
+    "escalate_slots": 1,
+    "escalate_memory": 1,
+    # the failures caused by a node (down or Executor.NODE_STATES) before it is excluded,
+    # 0 to never exclude nodes
+    "blacklist": 3,
+    # the function to order waiting tasks, f(tasks, order, history) -> {id: priority},
+    # the tasks with higher priority are submitted first
+    "priority": critical_path_priority,
+    # the socket of the local server shares the cpus and memory with other runs, see server.py
+    "server": "",
+    # the python of the workers running python tasks, default sys.executable
+    "python": "",
+    # the linear chains of tasks shorter than this (seconds) run as one job, 0 to never fuse
+    "fuse": 0,
+    # keep the temporary files of tasks, see Task.temp
+    "keep_intermediates": False,
+    # run the tasks with Task.stage in $TMPDIR of nodes
+    "stage": False,
+    # the database of the runs of tasks shared by DAGs, default the task store if kept, see predict.py
+    "history": "",
+    # predict the run time of DAG without running it
+    "dry_run": False,
+    # the logs of local tasks are rotated over log_size bytes (0 for no limit),
+    # log_backups rotated logs are kept and gzipped with log_compress, see runner.py
+    "log_size": runner.MAX_BYTES,
+    "log_backups": runner.BACKUPS,
+    "log_compress": runner.COMPRESS,
+}
+
+RETRY = ["retries", "backoff", "escalate_slots", "escalate_memory"]
+
+
+def set_defaults(**kwargs):
+    """
+    set the default options of do_dag, eg: set_defaults(cpus=16)
+    :param kwargs:
+    :return:
+    """
+    for key, value in kwargs.items():
+        assert key in DEFAULTS, "unknown option %r" % key
+        DEFAULTS[key] = value
+
+    return DEFAULTS
 
 
-def qhost():
+def is_local(task):
     """
-    "get the status of nodes"
+    whether the task runs on this machine, see Executor.local
+    :param task:
     :return:
     """
-    r = {}
-    contents = os.popen("qhost").read().strip().split("\n")
+    return get_executor(task.type).local
 
-    for line in contents[2:]:
-        line = line.strip()
-        if len(line) == 0:
-            continue
-
-        content = line.split()
-        _name = content[0]
-        _status = content[8]
 
-        if _status == "-":
-            _status = "N"
-        else:
-            _status = "Y"
+def ps():
+    r = []
+    user = getpass.getuser()
+    contents = os.popen('ps -u %s ' % user).read().strip().split('\n')
 
-        r[_name] = _status
+    for line in contents:
+        r.append(line.split()[0])
 
     return r
 
 
-def qstat():
+def child_exit_hander(signum, frame):
+    """
+    do nothing, the signal number is written to WAKEUP_FD by python
+    """
+    pass
+
+
+def init_wakeup():
     """
-    get the running jobs
+    route SIGCHLD to a pipe, so the main loop can select on it and wake up
+    as soon as a local task exits
     :return:
     """
+    global WAKEUP_FD
 
-    r = {}
-    user = os.popen('whoami').read().strip()
-    contents = os.popen('qstat -u %s ' % user).read().strip().split('\n')
+    if WAKEUP_FD is not None:
+        return WAKEUP_FD
 
-    # reading qstat content, the first 2 lines are passed
-    for line in contents[2:]:
-        content = line.split()
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
 
-        _id = content[0]
-        _status = content[4]
+    signal.set_wakeup_fd(write_fd)
+    signal.signal(signal.SIGCHLD, child_exit_hander)
+    pool.set_wakeup(write_fd)
+    WAKEUP_FD = (read_fd, write_fd)
 
-        # running jobs
-        if "@" in content[7]:
-            _node = content[7].split('@')[1]
-        else:
-            _node = ""
+    return WAKEUP_FD
 
-        r[_id] = {"status": _status,
-                  "node": _node}
 
-    return r
+def wait_events(timeout):
+    """
+    block until a child process exits, the local server grants tasks or timeout
+    :param timeout: seconds
+    :return: 1 if woken up by signals else 0
+    """
+    read_fd = WAKEUP_FD[0]
+    fds = [read_fd]
 
+    if CLIENT:
+        fds.append(CLIENT)
 
-def ps():
-    r = []
-    user = os.popen('whoami').read().strip()
-    contents = os.popen('ps -u %s ' % user).read().strip().split('\n')
+    if timeout > 0:
+        ready, _, _ = select.select(fds, [], [], timeout)
+    else:
+        ready = fds
+
+    woken = 0
+    if read_fd in ready:
+        try:
+            while os.read(read_fd, 1024):
+                woken = 1
+        except (BlockingIOError, InterruptedError):
+            pass
 
-    for line in contents:
-        r.append(line.split()[0])
+    if CLIENT in ready:
+        CLIENT.read()
+        woken = 1
 
-    return r
+    return woken
 
 
-def update_task_status(tasks, stop_on_failure):
+class TaskIndex(object):
+    """
+    Index the tasks of a DAG by status and count the unfinished depends of
+    each task, a status change only touches the task and its downstream tasks.
+    "waiting" tasks are kept in a ready queue ordered by priority, then the DAG order.
     """
 
-    :param tasks:
+    STATUS = ["preparing", "waiting", "running", "success", "failed"]
+
+    def __init__(self, tasks, store=None, priority=None, temp=None):
+        """
+        :param tasks:
+        :param store: TaskStore object
+        :param priority: {id: priority}
+        :param temp: the temporary files removed when their tasks succeeded, see temp_users
+        """
+        self.tasks = tasks
+        self.store = store
+        self.temp = temp or {}
+        self.temp_index = {}
+        priority = priority or {}
+        self.order = {}
+        self.downstream = OrderedDict()
+        self.pending = {}
+        self.status = OrderedDict((i, OrderedDict()) for i in self.STATUS)
+        self._status = {}
+        self.ready = []
+        self.started = {}
+
+        for n, (id, task) in enumerate(tasks.items()):
+            self.order[id] = (-priority.get(id, 0), n)
+            self.downstream[id] = []
+
+        for id, task in tasks.items():
+            for _id in set(task.depends):
+                self.downstream[_id].append(id)
+
+        for path, ids in self.temp.items():
+            for id in ids:
+                self.temp_index.setdefault(id, []).append(path)
+
+    def init(self):
+        """
+        index the status of tasks after Task.init
+        :return:
+        """
+        for id, task in self.tasks.items():
+            self.pending[id] = len([i for i in set(task.depends) if self.tasks[i].status != "success"])
+            self._status[id] = task.status
+            self.status[task.status][id] = task
+
+            if task.status == "waiting":
+                heapq.heappush(self.ready, (self.order[id], id))
+
+        for id, task in list(self.status["preparing"].items()):
+            if self.pending[id] == 0:
+                self.set_status(task, "waiting")
+
+        # the files left by runs killed or with intermediates kept
+        for id in list(self.status["success"]):
+            self.remove_temp(self.tasks[id])
+
+        if self.store:
+            self.store.save(*self.tasks.values())
+
+        return self
+
+    def set_status(self, task, status):
+        """
+        set the status of task and update the index
+        :param task:
+        :param status:
+        :return:
+        """
+        task.status = status
+        return self.sync(task)
+
+    def sync(self, task):
+        """
+        update the index after the status of task was changed by itself
+        :param task:
+        :return: 1 if the status changed else 0
+        """
+        old = self._status[task.id]
+        new = task.status
+
+        if old == new:
+            return 0
+
+        del self.status[old][task.id]
+        self.status[new][task.id] = task
+        self._status[task.id] = new
+
+        if self.store:
+            self.store.save(task)
+
+        if new == "preparing" and self.pending[task.id] == 0:
+            return self.set_status(task, "waiting")
+
+        if new == "waiting":
+            heapq.heappush(self.ready, (self.order[task.id], task.id))
+
+        if new == "running":
+            self.started[task.group] = self.started.get(task.group, 0) + 1
+
+        if new == "success":
+            for id in self.downstream[task.id]:
+                self.pending[id] -= 1
+                _task = self.tasks[id]
+
+                if self.pending[id] == 0 and _task.status == "preparing":
+                    self.set_status(_task, "waiting")
+
+            self.remove_temp(task)
+        elif old == "success":
+            for id in self.downstream[task.id]:
+                self.pending[id] += 1
+
+        return 1
+
+    def remove_temp(self, task):
+        """
+        remove the temporary files used by task, if all their tasks succeeded
+        :param task: a task succeeded
+        :return: the number of files removed
+        """
+        n = 0
+
+        for path in self.temp_index.get(task.id, []):
+            if not os.path.lexists(path):
+                continue
+
+            if any(self.tasks[i].status != "success" for i in self.temp[path]):
+                continue
+
+            LOG.info("remove temporary file %r" % path)
+            remove_path(path)
+            n += 1
+
+        return n
+
+    def pop_ready(self):
+        """
+        pop all waiting tasks in order, use push_ready to return the tasks not submitted
+        :return: a list of tasks
+        """
+        r = []
+
+        while self.ready:
+            _, id = heapq.heappop(self.ready)
+            task = self.tasks[id]
+
+            # skip the stale entries of tasks changed status
+            if task.status == "waiting" and id in self.status["waiting"]:
+                r.append(task)
+
+        return r
+
+    def push_ready(self, *tasks):
+
+        for task in tasks:
+            heapq.heappush(self.ready, (self.order[task.id], task.id))
+
+        return 1
+
+    def fair_share(self, tasks):
+        """
+        order tasks so that the groups with fewer running (then fewer started)
+        tasks go first, the order in a group is kept
+        :param tasks: waiting tasks in order
+        :return: a list of tasks
+        """
+        running = {}
+        groups = OrderedDict()
+
+        for id, task in self.status["running"].items():
+            running[task.group] = running.get(task.group, 0) + 1
+
+        for task in tasks:
+            groups.setdefault(task.group, []).append(task)
+
+        if len(groups) <= 1:
+            return tasks
+
+        heap = []
+        for n, (group, _tasks) in enumerate(groups.items()):
+            _tasks.reverse()
+            heapq.heappush(heap, (running.get(group, 0), self.started.get(group, 0), n, group))
+
+        r = []
+        while heap:
+            count, started, n, group = heapq.heappop(heap)
+            r.append(groups[group].pop())
+
+            if groups[group]:
+                heapq.heappush(heap, (count + 1, started + 1, n, group))
+
+        return r
+
+    def count(self, status):
+
+        return len(self.status[status])
+
+    def info(self):
+
+        return "job status: %s preparing %s waiting, %s running, %s success, %s failed." % (
+            self.count("preparing"), self.count("waiting"), self.count("running"),
+            self.count("success"), self.count("failed")
+        )
+
+
+def remove_path(path):
+    """
+    remove a file, link or directory
+    :param path:
     :return:
     """
-    sge_running_task = qstat()
-    #local_running_task = ps()
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+    return path
+
+
+def temp_users(tasks):
+    """
+    the tasks using each temporary file: the tasks making it, their downstream
+    tasks and the tasks with it in inputs
+    :param tasks:
+    :return: {path: set of task ids}
+    """
+    r = OrderedDict()
+    downstream = {}
+
+    for id, task in tasks.items():
+        for _id in set(task.depends):
+            downstream.setdefault(_id, []).append(id)
 
-    queue_status = qhost()
-    died_queue = [i for i in queue_status if queue_status[i] == "N"]
+    for id, task in tasks.items():
+        for path in task.temp:
+            r.setdefault(path, set()).update([id] + downstream.get(id, []))
 
     for id, task in tasks.items():
+        for path in task.inputs:
+            if path in r:
+                r[path].add(id)
+
+    return r
 
-        # pass success or failed task
-        if task.status in ["success", "failed", "waiting"]:
+
+def init_tasks(tasks, order):
+    """
+    init the status of tasks in topological order, a task is rerun if its
+    cache key changed or any task it depends on is rerun
+    :param tasks:
+    :param order: task ids in topological order, see DAG.validate
+    :return:
+    """
+    for id in order:
+        task = tasks[id]
+        task.key = task_key(task, [tasks[i].key for i in task.depends], DEFAULTS["digest"], TEMP)
+        task.init()
+
+        if task.status != "success":
             continue
 
-        # preparing tasks and waiting tasks
-        if task.status == "preparing":
-            # check task depends, if a preparing task's depends submit, change stats to waiting
-            dep_status = 1
+        rerun = [i for i in task.depends if tasks[i].status != "success"]
+        if rerun:
+            LOG.info("task %r is rerun because %s rerun" % (id, ", ".join(rerun)))
+            task.reset()
 
-            for _id in task.depends:
+    # the tasks making the temporary inputs removed of tasks to run are rerun
+    for id in reversed(order):
+        task = tasks[id]
+
+        if task.status == "success":
+            continue
+
+        for _id in set(task.depends):
+            _task = tasks[_id]
+            missing = [i for i in _task.temp if i in task.inputs and not os.path.exists(i)]
+
+            if _task.status == "success" and missing:
+                LOG.info("task %r is rerun to make %s for %r" % (_id, ", ".join(missing), id))
+                _task.reset()
+
+    return tasks
 
-                if tasks[_id].status != "success":
-                    dep_status = 0
-                    break
 
-            if dep_status:
-                task.status = "waiting"
+def reattach_tasks(tasks, store):
+    """
+    reattach the cluster tasks still running since the last run of DAG, the
+    tasks changed since they were submitted are deleted and rerun
+    :param tasks:
+    :param store: TaskStore object
+    :return: the number of tasks reattached
+    """
+    rows = store.load()
+    running_jobs = {}
+    n = 0
+
+    for row in rows.values():
+        if row["status"] != "running" or row["type"] in running_jobs:
             continue
 
-        # check recent done tasks on sge
-        if task.type == "sge" and task.run_id not in sge_running_task:
-            status = task.check_done()
+        if row["type"] in EXECUTORS and not get_executor(row["type"]).local:
+            running_jobs[row["type"]] = get_executor(row["type"]).refresh().jobs
 
-            if not status and stop_on_failure:
-                LOG.info("Task %r failed, stop all tasks" % task.id)
-                del_online_tasks()
+    for id, row in rows.items():
+        if id not in tasks:
             continue
-        elif task.type == "local":
-            if task.run_id.poll() is not None:
+
+        task = tasks[id]
+        task.attempts = row["attempts"] or 0
+
+        if row["status"] != "running" or row["type"] != task.type or task.status == "success":
+            continue
+
+        if row["run_id"] not in running_jobs.get(task.type, {}):
+            continue
+
+        if row["key"] != task.key:
+            LOG.info("task %r changed since submitted, delete %s job %s" % (id, task.type, row["run_id"]))
+            get_executor(task.type).cancel(row["run_id"])
+            continue
+
+        task.run_id = row["run_id"]
+        task.start_time = row["start"]
+        task.status = "running"
+        LOG.info("reattach task %r to %s job %s" % (id, task.type, task.run_id))
+        n += 1
+
+    return n
+
+
+def blacklist(type):
+    """
+    the nodes excluded from the cluster tasks of type, the nodes are forgiven
+    when no node up would be left, so the tasks are never stuck in the queue
+    :param type:
+    :return:
+    """
+    if not DEFAULTS["blacklist"]:
+        return []
+
+    r = [i for i in BLACKLIST if BLACKLIST[i] >= DEFAULTS["blacklist"]]
+
+    if not r:
+        return r
+
+    nodes = get_executor(type).poller.qhost()
+
+    if not [i for i in nodes if nodes[i] == "Y" and i not in r]:
+        LOG.warning("no %s node is left without %s, they are used again" % (type, ", ".join(r)))
+
+        for i in r:
+            BLACKLIST[i] = 0
+        return []
+
+    return r
+
+
+def add_failure(node, count=1):
+    """
+    count a failure on node
+    :param node:
+    :param count:
+    :return:
+    """
+    if not node:
+        return 0
+
+    BLACKLIST[node] = BLACKLIST.get(node, 0) + count
+
+    if DEFAULTS["blacklist"] and BLACKLIST[node] - count < DEFAULTS["blacklist"] <= BLACKLIST[node]:
+        LOG.warning("%s tasks failed on node %r, exclude it from cluster tasks" % (BLACKLIST[node], node))
+
+    return BLACKLIST[node]
+
+
+def retry_task(index, task, stop_on_failure, force=False):
+    """
+    retry the failed task after a backoff time of backoff * 2 ^ (attempts - 1)
+    seconds, the cpus and memory requested are escalated by its policy
+    :param index: TaskIndex object
+    :param task:
+    :param stop_on_failure: stop all tasks if the task can not be retried
+    :param force: retry at once and not count the attempt, for the failures of nodes
+    :return: 1 if retried else 0
+    """
+    policy = dict((i, task.retry.get(i, DEFAULTS[i])) for i in RETRY)
+
+    if force:
+        task.attempts -= 1
+        LOG.info("retry task %r" % task.id)
+        index.set_status(task, "preparing")
+        return 1
+
+    if task.attempts > policy["retries"]:
+        if stop_on_failure:
+            LOG.info("Task %r failed, stop all tasks" % task.id)
+            del_online_tasks()
+        return 0
+
+    delay = policy["backoff"] * 2 ** (task.attempts - 1)
+    task.not_before = time.time() + delay
+    task.escalate(policy["escalate_slots"], policy["escalate_memory"])
+    LOG.info("retry task %r in %ss, attempt %s of %s" % (task.id, int(delay), task.attempts + 1, policy["retries"] + 1))
+    index.set_status(task, "preparing")
+
+    return 1
+
+
+def update_task_status(index, stop_on_failure, poll_cluster=True):
+    """
+    update the status of running tasks
+    :param index: TaskIndex object
+    :param stop_on_failure:
+    :param poll_cluster: poll the queues and nodes of the cluster tasks
+    :return: the number of cluster tasks changed their status
+    """
+    changed = 0
+    polled = OrderedDict()
+
+    if poll_cluster:
+        for task in index.status["running"].values():
+            if task.type not in polled and not is_local(task):
+                polled[task.type] = get_executor(task.type).refresh()
+
+    for id, task in list(index.status["running"].items()):
+        backend = get_executor(task.type)
+
+        if backend.local:
+            if task.poll() is not None:
                 status = task.check_done()
+                index.sync(task)
 
-                if not status and stop_on_failure:
-                    LOG.info("Task %r failed, stop all tasks" % task.id)
-                    del_online_tasks()
+                if CLIENT:
+                    CLIENT.release(task)
+
+                if not status:
+                    retry_task(index, task, stop_on_failure)
+            continue
+
+        # cluster tasks are only checked when their queue is polled
+        if task.type not in polled:
             continue
-        else:
-            pass
 
-        # check sge tasks running status
-        _status = sge_running_task[task.run_id]["status"]
+        # the queue shared by other DAGs may be older than the task
+        if task.start_time >= backend.last_poll:
+            continue
 
-        if _status == "Eqw":
+        state = backend.state(task)
+
+        # check recent done tasks on cluster
+        if not state:
+            changed += 1
+            status = task.check_done()
+            index.sync(task)
+
+            if not status:
+                retry_task(index, task, stop_on_failure)
+            continue
+
+        # check cluster tasks running status
+        _status = state["status"]
+        _node = state["node"]
+
+        if _node:
+            task.node = _node
+
+        if _node in backend.dead_nodes:
+            changed += 1
+            LOG.info("node %r of task %r is down" % (_node, task.id))
+            add_failure(_node, DEFAULTS["blacklist"] or 1)
             task.kill()
+            index.sync(task)
+
+            if task.status == "failed":
+                retry_task(index, task, stop_on_failure, force=True)
+        elif _status in backend.ERROR_STATES:
+            changed += 1
 
-        _node = sge_running_task[task.run_id]["node"]
+            # the failures of scripts are not counted against their nodes
+            if _status in backend.NODE_STATES:
+                add_failure(_node)
 
-        if _node in died_queue:
             task.kill()
-            task.status = "preparing"
-    
-    return tasks
+            index.sync(task)
+
+            if task.status == "failed":
+                retry_task(index, task, stop_on_failure)
 
+    return changed
 
-def submit_tasks(tasks, concurrent_tasks):
+
+def submit_tasks(index, concurrent_tasks, cpus=None, memory=None):
+    """
+    submit waiting tasks, local tasks are packed into the free cpus and memory
+    of this machine according to their "-pe smp N" and "-l vf=" requests
+    :param index: TaskIndex object
+    :param concurrent_tasks: the max number of running tasks
+    :param cpus: the cpu budget of local tasks, default os.cpu_count()
+    :param memory: the memory budget (bytes) of local tasks, default no limit
+    :return:
+    """
 
     # limit the max concurrent_tasks
     if concurrent_tasks > 800:
         concurrent_tasks = 800
 
-    running_tasks = []
-    waiting_tasks = []
+    if not cpus:
+        cpus = os.cpu_count() or 1
 
-    for id, task in tasks.items():
-
-        if task.status == "running":
-            running_tasks.append(task)
+    # job all submitted, pass
+    if not index.count("waiting"):
+        return index
 
-        if task.status == "waiting":
-            waiting_tasks.append(task)
+    task_num = index.count("running")
+    free_cpus = cpus
+    free_memory = memory
 
-    # job all submitted, pass
-    if not waiting_tasks:
-        return tasks
+    for id, task in index.status["running"].items():
+        if not is_local(task):
+            continue
+        free_cpus -= min(task.slots, cpus)
+        if memory:
+            free_memory -= min(task.memory, memory)
 
-    task_num = len(running_tasks)
+    waiting_tasks = index.fair_share(index.pop_ready())
+    unsubmitted = []
+    arrays = OrderedDict()
+    now = time.time()
+    exclude = {}
 
     for task in waiting_tasks:
+
+        if task_num >= concurrent_tasks or task.not_before > now:
+            unsubmitted.append(task)
+            continue
+
+        if is_local(task) and CLIENT:
+            # the local server shares the cpus and memory with other runs
+            if task.id not in CLIENT.granted:
+                if task_num + len(CLIENT.requested) < concurrent_tasks:
+                    CLIENT.acquire(task)
+                unsubmitted.append(task)
+                continue
+        elif is_local(task):
+            # a task asks for more than the budget runs alone
+            slots = min(task.slots, cpus)
+            task_memory = min(task.memory, memory) if memory else 0
+
+            if slots > free_cpus or (memory and task_memory > free_memory):
+                unsubmitted.append(task)
+                continue
+
+            free_cpus -= slots
+            if memory:
+                free_memory -= task_memory
+
+        # the inputs are ready now, update the key written to the done file
+        task.key = task_key(task, [index.tasks[i].key for i in task.depends], DEFAULTS["digest"], TEMP)
+
         task_num += 1
 
-        if task_num > concurrent_tasks:
-            break
+        if not is_local(task):
+            if task.type not in exclude:
+                exclude[task.type] = blacklist(task.type)
+            task.exclude = exclude[task.type]
+
+        # the tasks of a ParallelTask are submitted together as an array job
+        if DEFAULTS["array"] and not is_local(task) and task.array:
+            option = task.option
+            del option["o"], option["e"]
+            arrays.setdefault((task.type, task.array, dict2str(sorted(option.items()))), []).append(task)
+            continue
 
         task.run()
+        index.sync(task)
 
-    return tasks
+    for tasks in arrays.values():
+        get_executor(tasks[0].type).submit_array(tasks)
+
+        for task in tasks:
+            index.sync(task)
+
+    index.push_ready(*unsubmitted)
+
+    return index
 
 
 def del_task_hander(signum, frame):
-    del_online_tasks()
+
+    if RESUME:
+        detach_online_tasks()
+    else:
+        del_online_tasks()
+
+
+def detach_online_tasks():
+    """
+    exit and keep the cluster tasks running, they are reattached by the next run with resume
+    :return:
+    """
+    LOG.info("keep the running cluster jobs, rerun with resume to reattach them")
+
+    for id, task in TASKS.items():
+
+        if task.status == "running" and is_local(task):
+            task.kill()
+
+    pool.shutdown()
+
+    if STORE:
+        STORE.save(*TASKS.values())
+
+    sys.exit("sorry, the program exit")
 
 
 def del_online_tasks():
@@ -192,11 +812,34 @@ def del_online_tasks():
         if task.status == "running":
             task.kill()
 
+    pool.shutdown()
+
+    if STORE:
+        STORE.save(*TASKS.values())
+
     write_tasks(TASKS)
 
     sys.exit("sorry, the program exit")
 
 
+def log_progress(tasks):
+    """
+    log the run time, the bytes of logs and the last line of the local tasks running
+    :param tasks:
+    :return:
+    """
+    for task in tasks:
+        pid = getattr(task.run_id, "pid", None)
+
+        if task.status != "running" or pid is None:
+            continue
+
+        LOG.info("task %r running %ss, %s bytes of logs: %s" % (
+            task.id, int(time.time() - task.start_time), sum(runner.progress(pid)), runner.tail(pid)[:200]))
+
+    return 0
+
+
 def write_tasks(tasks):
     failed_tasks = []
 
@@ -216,7 +859,81 @@ The following tasks were failed:
         return 0
 
 
-def do_dag(dag, concurrent_tasks=10, refresh_time=60, stop_on_failure=False):
+def output_prefix(dag):
+    """
+    the prefix of the files written about dag, beside its task store
+    :param dag:
+    :return:
+    """
+    return os.path.join(os.path.dirname(DEFAULTS["store"] or store_path(dag)), dag.id)
+
+
+def open_store(dag, resume):
+    """
+    open the task store of dag, it is only kept in a file when the run is
+    resumed or the store is set, the runs of tasks are still recorded in the
+    history database if it is set
+    :param dag:
+    :param resume:
+    :return: TaskStore object or None
+    """
+    if resume or DEFAULTS["store"]:
+        return TaskStore(DEFAULTS["store"] or store_path(dag), dag.id, DEFAULTS["history"])
+
+    if DEFAULTS["history"]:
+        return TaskStore(":memory:", dag.id, DEFAULTS["history"])
+
+    return None
+
+
+def dry_run(dag, order, history, concurrent_tasks, cpus=None, memory=None):
+    """
+    predict the run of dag without running it, the tasks done are skipped,
+    the prediction is written to {dag.id}.predict.tsv, see output_prefix
+    :param dag:
+    :param order: task ids in topological order
+    :param history: {id: seconds}, see predict.Predictor.history
+    :param concurrent_tasks:
+    :param cpus: the cpu budget of local tasks
+    :param memory: the memory budget (bytes) of local tasks
+    :return: (makespan, critical path)
+    """
+    tasks = dag.tasks
+    done = set()
+
+    # like init_tasks, but the done files are never removed
+    for id in order:
+        task = tasks[id]
+        task.key = task_key(task, [tasks[i].key for i in task.depends], DEFAULTS["digest"], TEMP)
+
+        if task.is_done() and all(i.is_done() for i in task.members) and set(task.depends) <= done:
+            done.add(id)
+
+    priority = DEFAULTS["priority"](tasks, order, history)
+    schedule = simulate(tasks, order, history, priority, min(concurrent_tasks, 800), cpus, memory, done)
+
+    return write_prediction(tasks, order, history, schedule, done,
+                            output_prefix(dag) + ".predict.tsv")
+
+
+def do_dag(dag, concurrent_tasks=10, refresh_time=60, stop_on_failure=False,
+           min_refresh_time=MIN_REFRESH_TIME, cpus=None, memory=None, resume=None):
+    """
+    run the tasks of dag, local tasks are checked as soon as they exit and
+    cluster tasks are checked by polling their queues at an adaptive interval between
+    min_refresh_time and refresh_time
+    :param dag:
+    :param concurrent_tasks:
+    :param refresh_time: the max interval of queue polling
+    :param stop_on_failure:
+    :param min_refresh_time: the min interval of queue polling
+    :param cpus: the cpu budget of local tasks, default DEFAULTS["cpus"] or os.cpu_count()
+    :param memory: the memory budget (bytes) of local tasks, default DEFAULTS["memory"]
+    :param resume: keep the cluster tasks running on exit and reattach them on restart,
+                   default DEFAULTS["resume"]. The status of tasks is kept in
+                   DEFAULTS["store"] or {work_dir}/{dag.id}.dagflow.db with resume or store
+    :return:
+    """
 
     #dag.to_json()
 
@@ -230,52 +947,137 @@ def do_dag(dag, concurrent_tasks=10, refresh_time=60, stop_on_failure=False):
 
     LOG.info("DAG: %s, %s tasks" % (dag.id, len(dag.tasks)))
     LOG.info("Run with %s tasks concurrent and status refreshed per %ss" % (concurrent_tasks, refresh_time))
-
-    global TASKS
+    order = dag.validate()
+
+    global TASKS, STORE, RESUME, CLIENT, TEMP
+
+    cpus = cpus or DEFAULTS["cpus"] or os.cpu_count() or 1
+    memory = memory or DEFAULTS["memory"]
+    LOG.info("Local tasks are limited to %s cpus" % cpus)
+
+    RESUME = DEFAULTS["resume"] if resume is None else resume
+    pool.configure(cpus, DEFAULTS["python"] or None)
+    runner.configure(DEFAULTS["log_size"], DEFAULTS["log_backups"], DEFAULTS["log_compress"])
+
+    # the pollers of schedulers keep their results in their own cache files
+    get_poller("sge", cache_file=DEFAULTS["poll_cache"])
+    get_poller("slurm", cache_file=DEFAULTS["poll_cache"] and DEFAULTS["poll_cache"] + ".slurm")
+
+    if DEFAULTS["server"]:
+        CLIENT = LocalClient(DEFAULTS["server"], "%s:%s" % (dag.id, os.getpid()))
+        LOG.info("Local tasks are scheduled by the server on %s" % DEFAULTS["server"])
+    STORE = open_store(dag, RESUME)
+    if STORE and STORE.path != ":memory:":
+        LOG.info("The status of tasks is kept in %s" % STORE.path)
+    input_sizes(dag.tasks, order)
+    history = Predictor(STORE.samples() if STORE else []).history(dag.tasks)
+
+    if not DEFAULTS["stage"]:
+        for task in dag.tasks.values():
+            task.stage = ""
+
+    fused = DEFAULTS["fuse"] and fuse_tasks(dag, history, DEFAULTS["fuse"])
+    if fused:
+        order = dag.validate()
+
+        # a fused task takes the time of its tasks
+        for id in fused:
+            history[id] = sum(estimate(i, history) for i in dag.tasks[id].members)
     TASKS = dag.tasks
+    TEMP = temp_users(TASKS)
+
+    if DEFAULTS["dry_run"]:
+        dry_run(dag, order, history, concurrent_tasks, cpus, memory)
+
+        if STORE:
+            STORE.close()
+            STORE = None
+
+        if CLIENT:
+            CLIENT.close()
+            CLIENT = None
+
+        return 0
 
     signal.signal(signal.SIGINT, del_task_hander)
     signal.signal(signal.SIGTERM, del_task_hander)
     # signal.signal(signal.SIGKILL, qdel_online_tasks)
+    init_wakeup()
 
-    for id, task in TASKS.items():
-        task.init()
+    init_tasks(TASKS, order)
+
+    if RESUME:
+        reattach_tasks(TASKS, STORE)
+
+    priority = DEFAULTS["priority"](TASKS, order, history)
+    index = TaskIndex(TASKS, STORE, priority, {} if DEFAULTS["keep_intermediates"] else TEMP).init()
 
-    loop = 0
+    cluster_refresh = min(min_refresh_time, refresh_time)
+    next_poll = time.time() + cluster_refresh
+    info = ""
+    last_info = 0
 
     while 1:
         # qsub tasks
-        submit_tasks(TASKS, concurrent_tasks)
-
-        task_status = {
-            "preparing": [],
-            "waiting": [],
-            "running": [],
-            "success": [],
-            "failed": []
-        }
-
-        for id, task in TASKS.items():
-            task_status[task.status].append(id)
-
-        info = "job status: %s preparing %s waiting, %s running, %s success, %s failed." % (
-            len(task_status["preparing"]),
-            len(task_status["waiting"]), len(task_status["running"]),
-            len(task_status["success"]), len(task_status["failed"]),
-        )
-        LOG.info(info)
+        submit_tasks(index, concurrent_tasks, cpus, memory)
+
+        # log when the status changed, or at least once per refresh_time
+        if info != index.info() or time.time() - last_info >= refresh_time:
+            status_changed = info != index.info()
+            info = index.info()
+            last_info = time.time()
+            LOG.info(info)
+
+            # the local tasks running long show their progress
+            if not status_changed:
+                log_progress(index.status["running"].values())
+
+        # the tasks to retry later
+        delayed = [i.not_before for i in index.status["waiting"].values() if i.not_before > time.time()]
 
         # all run
-        if loop != 0 and len(task_status["running"]) == 0:
+        if index.count("running") == 0 and not delayed and not (CLIENT and CLIENT.requested):
             break
+
+        cluster_running = [i for i in index.status["running"].values() if not is_local(i)]
+
+        # local tasks wake us up by SIGCHLD, the timeout is only a fallback
+        if cluster_running:
+            timeout = next_poll - time.time()
         else:
-            time.sleep(refresh_time)
-            loop += 1
-            update_task_status(TASKS, stop_on_failure)
+            timeout = refresh_time
+
+        if delayed:
+            timeout = min(timeout, min(delayed) - time.time())
+
+        wait_events(timeout)
+        poll_cluster = bool(cluster_running) and time.time() >= next_poll
+
+        changed = update_task_status(index, stop_on_failure, poll_cluster=poll_cluster)
+
+        if poll_cluster:
+            if changed:
+                cluster_refresh = min(min_refresh_time, refresh_time)
+            else:
+                cluster_refresh = min(cluster_refresh * 2, refresh_time)
+            next_poll = time.time() + cluster_refresh
+
+    # the usage of cluster tasks is kept in the store after the accounting of profile
+    if DEFAULTS["profile"]:
+        write_profile(dag, output_prefix(dag))
+
+    if STORE:
+        STORE.save(*TASKS.values())
+        STORE.close()
+
+    if CLIENT:
+        CLIENT.close()
+        CLIENT = None
+
+    STORE = None
 
     # write failed
     status = write_tasks(TASKS)
     totalTime = time.time() - start
     LOG.info('Total time:' + time.strftime("%H:%M:%S", time.gmtime(totalTime)))
     return status
-
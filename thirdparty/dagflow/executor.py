@@ -0,0 +1,529 @@
+"""
+The backends running the tasks of each type, a backend is registered by
+register_executor(type, executor) and used by Task.run, Task.kill and do_dag.
+
+    sge     qsub, qstat, qdel and qacct
+    slurm   sbatch, squeue, scancel and sacct
+    local   the subprocesses on this machine
+    python  the functions in the worker pool, see pool.py
+
+The fake_cluster.py stand-in runs the sge and slurm commands on this machine.
+"""
+
+import os
+import re
+import math
+import time
+import signal
+import getpass
+import hashlib
+import logging
+import subprocess
+
+from .dag import register_executor, str2bytes, mkdir
+from .poller import get_poller
+from . import pool
+from . import runner
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Executor(object):
+    """
+    The interface of backends:
+        submit(task)              start the task, set its run_id, start_time and status
+        poll(task)                None if the task is running, else its exit code
+        kill(task)                stop the task
+        accounting(tasks, since)  set the usage of the tasks finished
+    """
+
+    name = ""
+    # the tasks run on this machine, counted in the cpus and memory of do_dag
+    local = True
+
+    def submit(self, task):
+        raise NotImplementedError
+
+    def submit_array(self, tasks):
+        """
+        submit the tasks of a ParallelTask with the same options
+        :param tasks:
+        :return:
+        """
+        for task in tasks:
+            task.run()
+
+        return 0
+
+    def poll(self, task):
+        raise NotImplementedError
+
+    def kill(self, task):
+        raise NotImplementedError
+
+    def accounting(self, tasks, since):
+
+        return 0
+
+    def job_id(self, task):
+        """
+        the id of the job of task kept in the store and the timeline
+        :param task:
+        :return: string
+        """
+        return str(task.run_id)
+
+    def started(self, task, run_id):
+
+        task.run_id = run_id
+        task.start_time = time.time()
+        task.status = "running"
+        LOG.info("submit task %r to %s, job id: %r" % (task.id, self.name, self.job_id(task)))
+
+        return 0
+
+
+class LocalExecutor(Executor):
+    """
+    Run the script of task by sh in its own process group, the output is
+    streamed to the size-capped logs of task, see runner.py
+    """
+
+    name = "local"
+
+    def submit(self, task):
+        task.write_script()
+
+        child = subprocess.Popen(
+            "sh %s" % os.path.join(task.work_dir, "%s.sh" % task.id),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=True,
+            start_new_session=True
+        )
+        child.logs = runner.stream(child, task.option["o"], task.option["e"])
+
+        return self.started(task, child)
+
+    def poll(self, task):
+        """
+        check whether the task exited and collect its resource usage
+        :return: None if running else the exit code
+        """
+        try:
+            pid, status, rusage = os.wait4(task.run_id.pid, os.WNOHANG)
+        except ChildProcessError:
+            if task.run_id.poll() is not None:
+                runner.wait([task.run_id.logs])
+            return task.run_id.poll()
+
+        if pid == 0:
+            return None
+
+        runner.wait([task.run_id.logs])
+        task.run_id.returncode = os.waitstatus_to_exitcode(status)
+        task.usage = {
+            "cpu_user": rusage.ru_utime,
+            "cpu_sys": rusage.ru_stime,
+            "max_rss": rusage.ru_maxrss * 1024,
+            "read_blocks": rusage.ru_inblock,
+            "write_blocks": rusage.ru_oublock,
+        }
+
+        return task.run_id.returncode
+
+    def kill(self, task):
+        """
+        kill the processes of task, the commands started by its script too
+        """
+        LOG.info("kill task %r on local, pid: %r" % (task.id, task.run_id.pid))
+
+        try:
+            os.killpg(task.run_id.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+        return 1
+
+    def job_id(self, task):
+
+        return str(getattr(task.run_id, "pid", task.run_id))
+
+
+class PoolExecutor(Executor):
+    """
+    Run the function of python task in the warm worker pool, see PythonTask
+    """
+
+    name = "python pool"
+
+    def submit(self, task):
+        mkdir(task.work_dir)
+
+        return self.started(task, pool.submit(task))
+
+    def poll(self, task):
+
+        if not task.run_id.done():
+            return None
+
+        try:
+            r = task.run_id.result()
+        except Exception as e:
+            LOG.error("task %r failed in python pool: %r" % (task.id, e))
+            return 1
+
+        task.usage = r["usage"]
+
+        return r["returncode"]
+
+    def kill(self, task):
+
+        # the running functions are killed with the pool, see pool.shutdown
+        if task.run_id.cancel():
+            LOG.info("cancel task %r in python pool" % task.id)
+
+        return 1
+
+    def job_id(self, task):
+
+        return ""
+
+
+class ClusterExecutor(Executor):
+    """
+    The backends of job schedulers, the queue is polled for all tasks at once
+    by refresh, the tasks not in the queue are finished
+    """
+
+    local = False
+    # the states of jobs stuck by errors, they are killed and retried
+    ERROR_STATES = []
+    # the error states caused by the node of job, they are counted by the blacklist
+    NODE_STATES = []
+
+    def __init__(self):
+        self.jobs = {}
+        self.dead_nodes = []
+        self.last_poll = 0
+
+    @property
+    def poller(self):
+
+        return get_poller(self.name)
+
+    def refresh(self):
+        """
+        poll the jobs in the queue and the nodes down
+        :return:
+        """
+        self.jobs = self.poller.qstat()
+        self.last_poll = self.poller.last_poll
+        nodes = self.poller.qhost()
+        self.dead_nodes = [i for i in nodes if nodes[i] == "N"]
+
+        return self
+
+    def state(self, task):
+        """
+        the state of task in the queue of the last refresh
+        :return: {"status": status, "node": node} or None if finished
+        """
+        return self.jobs.get(str(task.run_id))
+
+    def poll(self, task):
+
+        if self.state(task):
+            return None
+
+        return 0
+
+    def cancel(self, run_id):
+
+        raise NotImplementedError
+
+    def kill(self, task):
+
+        LOG.info("kill task %r on %s, job id: %r" % (task.id, self.name, task.run_id))
+        self.cancel(task.run_id)
+
+        return 1
+
+
+class SGEExecutor(ClusterExecutor):
+
+    name = "sge"
+    ERROR_STATES = ["Eqw"]
+    NODE_STATES = ["Eqw"]
+
+    def submit(self, task):
+        task.write_script()
+        script_path = os.path.join(task.work_dir, "%s.sh" % task.id)
+
+        # Your job 123 ("name") has been submitted
+        output = os.popen("qsub %s -N %s %s" % (task.qsub_option(), task.id, script_path)).read().strip()
+        _id = (output.split() + ["", "", ""])[2]
+
+        if not _id.isdigit():
+            LOG.error(output)
+            raise Exception(output)
+
+        return self.started(task, _id)
+
+    def submit_array(self, tasks):
+        """
+        submit sge tasks as one array job "qsub -t 1-N", the element i runs the
+        script of the ith task, the run_id of the task is "job_id.i"
+        :param tasks: sge tasks with the same qsub options, except -o and -e
+        :return:
+        """
+        if len(tasks) == 1:
+            return tasks[0].run()
+
+        lines = []
+        for task in tasks:
+            task.write_script()
+            task.attempts += 1
+
+            lines.append("%s\t%s\t%s" % (
+                os.path.join(task.work_dir, "%s.sh" % task.id), task.option["o"], task.option["e"]
+            ))
+
+        name = tasks[0].array or tasks[0].id
+        sha1 = hashlib.sha1("\n".join(task.id for task in tasks).encode("utf-8")).hexdigest()[:8]
+        work_dir = os.path.commonpath([task.work_dir for task in tasks])
+        prefix = os.path.join(work_dir, "%s.%s.array" % (name, sha1))
+
+        with open(prefix + ".list", "w") as fh:
+            fh.write("\n".join(lines) + "\n")
+
+        # every element writes the logs of its own task
+        with open(prefix + ".sh", "w") as fh:
+            fh.write("""\
+set -- $(sed -n "${{SGE_TASK_ID}}p" {0}.list)
+exec sh $1 > $2 2> $3
+""".format(prefix))
+
+        option = tasks[0].option
+        option["o"] = prefix + ".STDOUT"
+        option["e"] = prefix + ".STDERR"
+        qsub_option = tasks[0].qsub_option(option)
+        run_cmd = "qsub {qsub_option} -t 1-{n} -N {name} {prefix}.sh".format(n=len(tasks), **locals())
+
+        # Your job-array 123.1-10:1 ("name") has been submitted
+        output = os.popen(run_cmd).read().strip()
+        _id = (output.split() + ["", "", ""])[2].split(".")[0]
+
+        if not _id.isdigit():
+            LOG.error(output)
+            raise Exception(output)
+
+        for n, task in enumerate(tasks):
+            task.run_id = "%s.%s" % (_id, n+1)
+            task.start_time = time.time()
+            task.status = "running"
+
+        LOG.info("qsub %s tasks of %r as an array job on sge, qid: %r" % (len(tasks), name, _id))
+
+        return 0
+
+    def cancel(self, run_id):
+
+        # the element of an array job is "job_id.task_id"
+        if "." in str(run_id):
+            os.popen("qdel %s -t %s" % tuple(str(run_id).split(".")))
+        else:
+            os.popen("qdel %s" % run_id)
+
+        return 1
+
+    def accounting(self, tasks, since):
+        """
+        get the usage of finished sge tasks by one qacct call
+        :param tasks:
+        :param since: the time of the first task started
+        :return: the number of tasks updated
+        """
+        tasks = [i for i in tasks if i.end_time and not i.usage]
+
+        if not tasks:
+            return 0
+
+        begin = time.strftime("%Y%m%d%H%M", time.localtime(since - 60))
+        usage = parse_qacct(os.popen("qacct -o %s -b %s -j 2>/dev/null" % (getpass.getuser(), begin)).read())
+
+        return set_usage(tasks, usage)
+
+
+class SlurmExecutor(ClusterExecutor):
+    """
+    Translate the sge options of task to sbatch: "-pe smp N" to --cpus-per-task,
+    "-l vf=4G" to --mem, "-q queue" to --partition and the nodes excluded to --exclude
+    """
+
+    name = "slurm"
+    ERROR_STATES = ["BF", "NF", "OOM"]
+    NODE_STATES = ["BF", "NF"]
+
+    def sbatch_option(self, task):
+        option = task.option
+        r = ["-J %s" % task.id, "-o %s" % option["o"], "-e %s" % option["e"],
+             "--cpus-per-task=%s" % task.slots]
+
+        if task.memory:
+            r.append("--mem=%sM" % int(math.ceil(task.memory / 1e+06)))
+
+        if isinstance(option.get("q"), str):
+            r.append("--partition=%s" % option["q"])
+
+        if task.exclude:
+            r.append("--exclude=%s" % ",".join(task.exclude))
+
+        return " ".join(r)
+
+    def submit(self, task):
+        task.write_script()
+        script_path = os.path.join(task.work_dir, "%s.sh" % task.id)
+
+        # 123 or 123;cluster
+        output = os.popen("sbatch --parsable %s %s" % (self.sbatch_option(task), script_path)).read().strip()
+        _id = output.split(";")[0]
+
+        if not _id.isdigit():
+            LOG.error(output)
+            raise Exception(output)
+
+        return self.started(task, _id)
+
+    def cancel(self, run_id):
+
+        os.popen("scancel %s" % run_id)
+
+        return 1
+
+    def accounting(self, tasks, since):
+        """
+        get the usage of finished slurm tasks by one sacct call
+        :return: the number of tasks updated
+        """
+        tasks = [i for i in tasks if i.end_time and not i.usage]
+
+        if not tasks:
+            return 0
+
+        cmd = "sacct -n -P -o JobID,NodeList,UserCPU,SystemCPU,MaxRSS,MaxDiskRead,MaxDiskWrite -j %s 2>/dev/null"
+        usage = parse_sacct(os.popen(cmd % ",".join(str(i.run_id) for i in tasks)).read())
+
+        return set_usage(tasks, usage)
+
+
+def parse_qacct(string):
+    """
+    parse the output of "qacct -j", the elements of array jobs are "job_id.task_id"
+    :param string:
+    :return: {run_id: usage}
+    """
+    r = {}
+
+    for record in re.split(r"\n=+\n", "\n" + string):
+        job = {}
+
+        for line in record.strip().split("\n"):
+            content = line.split(None, 1)
+            if len(content) == 2:
+                job[content[0]] = content[1].strip()
+
+        if "jobnumber" not in job:
+            continue
+
+        _id = job["jobnumber"]
+        if job.get("taskid", "undefined") != "undefined":
+            _id = "%s.%s" % (_id, job["taskid"])
+
+        def number(key):
+            return float(job.get(key, "0").rstrip("s") or 0)
+
+        r[_id] = {
+            "cpu_user": number("ru_utime"),
+            "cpu_sys": number("ru_stime"),
+            "max_rss": int(number("ru_maxrss") * 1024),
+            "max_vmem": str2bytes(job.get("maxvmem", "0").rstrip("B") or "0"),
+            "read_blocks": int(number("ru_inblock")),
+            "write_blocks": int(number("ru_oublock")),
+            "node": job.get("hostname", ""),
+        }
+
+    return r
+
+
+def slurm_seconds(string):
+    """
+    convert the time of sacct "[DD-][HH:]MM:SS[.mmm]" to seconds
+    :param string:
+    :return:
+    """
+    if not string:
+        return 0
+
+    days = 0
+    if "-" in string:
+        days, string = string.split("-", 1)
+
+    r = 0
+    for part in string.split(":"):
+        r = r * 60 + float(part)
+
+    return int(days) * 86400 + r
+
+
+def parse_sacct(string):
+    """
+    parse the output of "sacct -n -P -o JobID,NodeList,UserCPU,SystemCPU,MaxRSS,MaxDiskRead,MaxDiskWrite",
+    the max of the steps (eg: "123.batch") is taken for the memory and disk
+    :param string:
+    :return: {run_id: usage}
+    """
+    r = {}
+
+    for line in string.strip().split("\n"):
+        fields = line.split("|")
+
+        if len(fields) < 7:
+            continue
+
+        _id = fields[0].split(".")[0]
+        usage = r.setdefault(_id, {"cpu_user": 0, "cpu_sys": 0, "max_rss": 0,
+                                   "read_bytes": 0, "write_bytes": 0, "node": ""})
+
+        if "." not in fields[0]:
+            usage["node"] = fields[1]
+            usage["cpu_user"] = slurm_seconds(fields[2])
+            usage["cpu_sys"] = slurm_seconds(fields[3])
+
+        for key, value in [("max_rss", fields[4]), ("read_bytes", fields[5]), ("write_bytes", fields[6])]:
+            if value:
+                usage[key] = max(usage[key], int(str2bytes(value)))
+
+    return r
+
+
+def set_usage(tasks, usage):
+    """
+    set the usage of tasks by the run_id
+    :return: the number of tasks updated
+    """
+    n = 0
+
+    for task in tasks:
+        if str(task.run_id) in usage:
+            task.usage = usage[str(task.run_id)]
+            n += 1
+
+    return n
+
+
+register_executor("local", LocalExecutor())
+register_executor("python", PoolExecutor())
+register_executor("sge", SGEExecutor())
+register_executor("slurm", SlurmExecutor())
@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+"""
+A local stand-in of sge (qsub, qstat, qdel, qhost, qacct) and slurm (sbatch,
+squeue, scancel, sacct, sinfo) to test dagflow without a cluster, jobs are
+run in background on this machine.
+
+    python fake_cluster.py install DIR
+    export PATH=DIR:$PATH
+
+The cluster is scripted by the environment:
+
+    FAKE_CLUSTER_DIR    the state of jobs (default: /tmp/fake_cluster_$USER)
+    FAKE_CLUSTER_SLOTS  the jobs running at once, the others are pending (default: no limit)
+    FAKE_CLUSTER_NODES  the names of nodes, eg: node1,node2 (default: localhost)
+    FAKE_CLUSTER_DOWN   the nodes down, their jobs keep running until deleted
+    FAKE_CLUSTER_FAIL   the probability of a job failing without running its script
+
+the lines "NAME=value" in $FAKE_CLUSTER_DIR/config override the environment,
+so the cluster can be changed while a DAG is running, eg: a node goes down.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import random
+import getpass
+import signal
+import subprocess
+
+
+STATE_DIR = os.environ.get("FAKE_CLUSTER_DIR", "/tmp/fake_cluster_%s" % getpass.getuser())
+SGE_COMMANDS = ["qsub", "qstat", "qdel", "qhost", "qacct"]
+SLURM_COMMANDS = ["sbatch", "squeue", "scancel", "sacct", "sinfo"]
+COMMANDS = SGE_COMMANDS + SLURM_COMMANDS
+
+# the options of qsub without value
+FLAGS = ["V", "cwd", "j", "notify"]
+
+
+def getenv(name, default=""):
+    """
+    the option of cluster, from $FAKE_CLUSTER_DIR/config or the environment
+    :param name:
+    :param default:
+    :return:
+    """
+    path = os.path.join(STATE_DIR, "config")
+
+    if os.path.exists(path):
+        with open(path) as fh:
+            for line in fh:
+                key, _, value = line.strip().partition("=")
+                if key == name:
+                    return value
+
+    return os.environ.get(name, default)
+
+
+def getenv_list(name, default=""):
+
+    return [i for i in getenv(name, default).split(",") if i]
+
+
+def lock():
+    """
+    lock the state of jobs, the lock is released when the command exits
+    :return:
+    """
+    fh = open(os.path.join(STATE_DIR, "lock"), "a")
+    fcntl.flock(fh, fcntl.LOCK_EX)
+
+    return fh
+
+
+def next_job_id():
+
+    with open(os.path.join(STATE_DIR, "job_id"), "a+") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.seek(0)
+        job_id = int(fh.read().strip() or 0) + 1
+        fh.seek(0)
+        fh.truncate()
+        fh.write("%s" % job_id)
+
+    return job_id
+
+
+def job_path(job):
+
+    return os.path.join(STATE_DIR, "%s.%s.json" % (job["id"], job["task_id"] or 0))
+
+
+def save_job(job):
+
+    with open(job_path(job), "w") as fh:
+        json.dump(job, fh)
+
+    return job
+
+
+def add_job(job_id, task_id, name, script, out, err, env, exclude):
+    """
+    queue a job, it starts when a slot is free, see dispatch
+    :return:
+    """
+    return save_job({
+        "id": job_id, "task_id": task_id, "name": name, "script": script,
+        "out": out, "err": err, "env": env, "exclude": exclude,
+        "user": getpass.getuser(), "state": "pending", "pid": 0, "node": "",
+        "submit": time.time(), "start": 0
+    })
+
+
+def start_job(job, node):
+
+    command = "exec sh %s" % job["script"]
+
+    # the failed jobs exit without running their scripts
+    if random.random() < float(getenv("FAKE_CLUSTER_FAIL", "0") or 0):
+        command = "exit 1"
+
+    child = subprocess.Popen(
+        command,
+        shell=True,
+        stdout=open(job["out"], "a"),
+        stderr=open(job["err"], "a"),
+        env=dict(os.environ, **job["env"]),
+        start_new_session=True
+    )
+
+    job.update(state="running", pid=child.pid, node=node, start=time.time())
+
+    return save_job(job)
+
+
+def is_running(pid):
+
+    try:
+        # reap our own finished children, others are reaped by init
+        os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        pass
+
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+
+    with open("/proc/%s/stat" % pid) as fh:
+        return fh.read().split(")")[-1].split()[0] != "Z"
+
+
+def load_jobs():
+    """
+    the jobs queued, the finished jobs are moved to the accounting
+    :return:
+    """
+    r = []
+
+    for name in os.listdir(STATE_DIR):
+        if not name.endswith(".json"):
+            continue
+
+        with open(os.path.join(STATE_DIR, name)) as fh:
+            r.append(json.load(fh))
+
+    jobs = sorted(r, key=lambda x: (x["id"], x["task_id"] or 0))
+    r = []
+
+    for job in jobs:
+        if job["state"] == "pending" or is_running(job["pid"]):
+            r.append(job)
+            continue
+
+        job.update(state="finished", end=time.time())
+        with open(os.path.join(STATE_DIR, "accounting"), "a") as fh:
+            fh.write(json.dumps(job) + "\n")
+        os.remove(job_path(job))
+
+    return r
+
+
+def dispatch():
+    """
+    start the pending jobs on the free slots, the nodes are used in turn
+    :return: the jobs queued
+    """
+    fh = lock()
+    jobs = load_jobs()
+    slots = int(getenv("FAKE_CLUSTER_SLOTS", "0") or 0)
+    nodes = getenv_list("FAKE_CLUSTER_NODES", "localhost")
+    down = getenv_list("FAKE_CLUSTER_DOWN")
+    running = len([i for i in jobs if i["state"] == "running"])
+
+    for job in jobs:
+        if job["state"] != "pending" or (slots and running >= slots):
+            continue
+
+        candidates = [i for i in nodes if i not in down and i not in job["exclude"]]
+        if not candidates:
+            continue
+
+        start_job(job, candidates[job["id"] % len(candidates)])
+        running += 1
+
+    fh.close()
+
+    return jobs
+
+
+def parse_qsub_args(args):
+    """
+    parse "qsub -N name -t 1-4 script.sh" to ({"N": "name", "t": "1-4"}, "script.sh")
+    :param args:
+    :return:
+    """
+    option = {}
+    n = 0
+
+    while n < len(args) - 1:
+        key = args[n].lstrip("-")
+
+        if key == "pe":
+            option[key] = args[n+1:n+3]
+            n += 3
+        elif key in FLAGS or args[n+1].startswith("-"):
+            option[key] = True
+            n += 1
+        else:
+            option[key] = args[n+1]
+            n += 2
+
+    return option, args[-1]
+
+
+def qsub_exclude(option):
+    """
+    the nodes excluded by "-l h=!node1&!node2"
+    :param option:
+    :return:
+    """
+    r = []
+
+    for resource in str(option.get("l", "")).strip("'").split(","):
+        if resource.startswith("h="):
+            r += [i.lstrip("!") for i in resource[2:].split("&")]
+
+    return r
+
+
+def qsub(args):
+    option, script = parse_qsub_args(args)
+    job_id = next_job_id()
+    name = option.get("N", os.path.basename(script))
+
+    if "t" in option:
+        start, end = option["t"].split(":")[0].split("-")
+        task_ids = list(range(int(start), int(end)+1))
+    else:
+        task_ids = [None]
+
+    for task_id in task_ids:
+        env = {"JOB_ID": str(job_id), "SGE_TASK_ID": str(task_id or "undefined")}
+        add_job(job_id, task_id, name, script, option.get("o", os.devnull),
+                option.get("e", os.devnull), env, qsub_exclude(option))
+
+    dispatch()
+
+    if task_ids[0] is None:
+        print('Your job %s ("%s") has been submitted' % (job_id, name))
+    else:
+        print('Your job-array %s.%s:1 ("%s") has been submitted' % (job_id, option["t"], name))
+
+    return 0
+
+
+def qstat(args):
+
+    jobs = dispatch()
+
+    if "-xml" in args:
+        print("<?xml version='1.0'?>\n<job_info>\n  <queue_info>")
+        for job in jobs:
+            running = job["state"] == "running"
+            print("""\
+    <job_list state="%s">
+      <JB_job_number>%s</JB_job_number>
+      <JB_name>%s</JB_name>
+      <JB_owner>%s</JB_owner>
+      <state>%s</state>
+      <queue_name>%s</queue_name>
+      <slots>1</slots>%s
+    </job_list>""" % ("running" if running else "pending", job["id"], job["name"], job["user"],
+                      "r" if running else "qw", "all.q@%s" % job["node"] if running else "",
+                      "\n      <tasks>%s</tasks>" % job["task_id"] if job["task_id"] else ""))
+        print("  </queue_info>\n  <job_info>\n  </job_info>\n</job_info>")
+        return 0
+
+    print("job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID")
+    print("-" * 113)
+
+    for job in jobs:
+        start = time.strftime("%m/%d/%Y %H:%M:%S", time.localtime(job["start"] or job["submit"]))
+        print("%7s 0.50000 %-10s %-12s %-5s %s %-30s 1 %s" % (
+            job["id"], job["name"][:10], job["user"], "r" if job["state"] == "running" else "qw",
+            start, "all.q@%s" % job["node"] if job["node"] else "", job["task_id"] or ""))
+
+    return 0
+
+
+def delete_jobs(job_id, task_id=None):
+    """
+    kill the jobs, the pending jobs are removed
+    :return: the jobs deleted
+    """
+    fh = lock()
+    r = []
+
+    for job in load_jobs():
+        if str(job["id"]) != str(job_id) or (task_id and job["task_id"] != task_id):
+            continue
+
+        if job["state"] == "pending":
+            os.remove(job_path(job))
+        else:
+            try:
+                os.killpg(job["pid"], signal.SIGTERM)
+            except OSError:
+                pass
+
+        r.append(job)
+
+    fh.close()
+
+    return r
+
+
+def qdel(args):
+    job_id = args[0]
+    task_id = None
+
+    if "-t" in args:
+        task_id = int(args[args.index("-t")+1])
+
+    for job in delete_jobs(job_id, task_id):
+        print("%s has deleted job %s" % (job["user"], job_id))
+
+    return 0
+
+
+def qhost(args):
+
+    nodes = getenv_list("FAKE_CLUSTER_NODES", "localhost")
+    down = getenv_list("FAKE_CLUSTER_DOWN")
+
+    if "-xml" in args:
+        print("<?xml version='1.0'?>\n<qhost>\n <host name='global'>\n   <hostvalue name='load_avg'>-</hostvalue>\n </host>")
+        for node in nodes:
+            print("""\
+ <host name='%s'>
+   <hostvalue name='arch_string'>lx-amd64</hostvalue>
+   <hostvalue name='num_proc'>%s</hostvalue>
+   <hostvalue name='load_avg'>%s</hostvalue>
+ </host>""" % (node, os.cpu_count(), "-" if node in down else "0.00"))
+        print("</qhost>")
+        return 0
+
+    print("HOSTNAME                ARCH         NCPU NSOC NCOR NTHR  LOAD  MEMTOT  MEMUSE  SWAPTO  SWAPUS")
+    print("-" * 94)
+    print("global                  -               -    -    -    -     -       -       -       -       -")
+    for node in nodes:
+        print("%-23s lx-amd64     %4s    1 %4s %4s  %4s    1.0G    0.0G    0.0G    0.0G" % (
+            node, os.cpu_count(), os.cpu_count(), os.cpu_count(), "-" if node in down else "0.00"))
+
+    return 0
+
+
+def finished_jobs():
+    """
+    the jobs finished, see load_jobs
+    :return:
+    """
+    dispatch()
+    path = os.path.join(STATE_DIR, "accounting")
+
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def qacct(args):
+
+    for job in finished_jobs():
+        print("=" * 62)
+        for key, value in [("hostname", job["node"]), ("owner", job["user"]), ("jobname", job["name"]),
+                           ("jobnumber", job["id"]), ("taskid", job["task_id"] or "undefined"),
+                           ("ru_wallclock", "%.3fs" % (job["end"] - job["start"])),
+                           ("ru_utime", "0.000s"), ("ru_stime", "0.000s"), ("ru_maxrss", "0"),
+                           ("maxvmem", "0.000B")]:
+            print("%-13s%s" % (key, value))
+
+    return 0
+
+
+def parse_sbatch_args(args):
+    """
+    parse "sbatch -J name --mem=1000M script.sh" to ({"J": "name", "mem": "1000M"}, "script.sh")
+    :param args:
+    :return:
+    """
+    option = {}
+    n = 0
+
+    while n < len(args) - 1:
+        if args[n].startswith("--"):
+            key, _, value = args[n][2:].partition("=")
+            option[key] = value or True
+            n += 1
+        else:
+            option[args[n].lstrip("-")] = args[n+1]
+            n += 2
+
+    return option, args[-1]
+
+
+def sbatch(args):
+    option, script = parse_sbatch_args(args)
+    job_id = next_job_id()
+    name = option.get("J", option.get("job-name", os.path.basename(script)))
+    exclude = [i for i in str(option.get("exclude", "")).split(",") if i and option.get("exclude") is not True]
+
+    add_job(job_id, None, name, script, option.get("o", os.devnull), option.get("e", os.devnull),
+            {"SLURM_JOB_ID": str(job_id)}, exclude)
+    dispatch()
+
+    if "parsable" in option:
+        print(job_id)
+    else:
+        print("Submitted batch job %s" % job_id)
+
+    return 0
+
+
+def squeue(args):
+    """
+    print the jobs as "%i|%t|%N", the only format used by dagflow
+    """
+    for job in dispatch():
+        if job["state"] == "running":
+            print("%s|R|%s" % (job["id"], job["node"]))
+        else:
+            print("%s|PD|" % job["id"])
+
+    return 0
+
+
+def scancel(args):
+
+    for job_id in args:
+        delete_jobs(job_id)
+
+    return 0
+
+
+def sinfo(args):
+    """
+    print the nodes as "%N|%t", the only format used by dagflow
+    """
+    down = getenv_list("FAKE_CLUSTER_DOWN")
+
+    for node in getenv_list("FAKE_CLUSTER_NODES", "localhost"):
+        print("%s|%s" % (node, "down*" if node in down else "idle"))
+
+    return 0
+
+
+def sacct(args):
+    """
+    print the jobs as "JobID|NodeList|UserCPU|SystemCPU|MaxRSS|MaxDiskRead|MaxDiskWrite"
+    """
+    job_ids = []
+    if "-j" in args:
+        job_ids = args[args.index("-j")+1].split(",")
+
+    for job in finished_jobs():
+        if job_ids and str(job["id"]) not in job_ids:
+            continue
+
+        print("%s|%s|00:00.000|00:00.000|||" % (job["id"], job["node"]))
+        print("%s.batch|%s|00:00.000|00:00.000|0|0|0" % (job["id"], job["node"]))
+
+    return 0
+
+
+def install(path):
+    """
+    write the commands to path
+    :param path:
+    :return:
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    for command in COMMANDS:
+        script = os.path.join(path, command)
+
+        with open(script, "w") as fh:
+            fh.write('#!/bin/sh\nexec "%s" "%s" %s "$@"\n' % (sys.executable, os.path.abspath(__file__), command))
+
+        os.chmod(script, 0o755)
+
+    return 0
+
+
+def main():
+
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS + ["install"]:
+        sys.exit("usage: %s {install DIR|%s} ..." % (sys.argv[0], "|".join(COMMANDS)))
+
+    if sys.argv[1] == "install":
+        return install(sys.argv[2])
+
+    if not os.path.isdir(STATE_DIR):
+        os.makedirs(STATE_DIR)
+
+    return globals()[sys.argv[1]](sys.argv[2:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import logging
+from collections import OrderedDict
+
+from .dag import Task, str2dict, dict2str
+from .priority import estimate
+
+
+LOG = logging.getLogger(__name__)
+
+# the tasks expected to run shorter than this (seconds) are fused with their neighbours in a chain
+MAX_TIME = 30
+
+
+def is_cheap(task, history, max_time=MAX_TIME):
+    """
+    whether the task is cheap, by its run time in history or its weight
+    (eg: task.weight = 0.1 for a task of a few seconds)
+    :param task:
+    :param history: {id or name: seconds}, see predict.Predictor.history
+    :param max_time:
+    :return:
+    """
+    return estimate(task, history) <= max_time
+
+
+def main_task(tasks, history, max_time=MAX_TIME):
+    """
+    the task whose cpus and memory are asked for by the fused job, the tasks
+    can be fused if at most one is not cheap and the others fit in its request
+    :param tasks: the tasks of chain
+    :return: Task object or None
+    """
+    if "python" in [i.type for i in tasks] or len(set(i.type for i in tasks)) != 1:
+        return None
+
+    # the staged tasks run in the scratch of nodes, see Task.staged_script
+    if any(i.stage for i in tasks):
+        return None
+
+    if len(set(i.option.get("q") for i in tasks)) != 1:
+        return None
+
+    expensive = [i for i in tasks if not is_cheap(i, history, max_time)]
+    if len(expensive) > 1:
+        return None
+
+    if expensive:
+        main = expensive[0]
+    else:
+        main = max(tasks, key=lambda x: (x.slots, x.memory))
+
+    for task in tasks:
+        if task.slots > main.slots or task.memory > main.memory:
+            return None
+
+    return main
+
+
+def find_chains(dag, history, max_time=MAX_TIME):
+    """
+    find the linear chains in dag, a task joins the chain of its upstream if
+    it is the only task depending on it and the only task it depends on, and
+    the chain is still cheap, see main_task
+    :return: [[head, task1, task2], ...]
+    """
+    downstream = dict((id, set()) for id in dag.tasks)
+
+    for id, task in dag.tasks.items():
+        for _id in set(task.depends):
+            downstream[_id].add(id)
+
+    chains = []
+    chained = {}
+
+    for id in dag.validate():
+        task = dag.tasks[id]
+        depends = set(task.depends)
+
+        if len(depends) != 1:
+            continue
+
+        upstream = dag.tasks[depends.pop()]
+        if len(downstream[upstream.id]) != 1:
+            continue
+
+        chain = chained.get(upstream.id, [upstream])
+        if not main_task(chain + [task], history, max_time):
+            continue
+
+        if len(chain) == 1:
+            chains.append(chain)
+            chained[upstream.id] = chain
+
+        chain.append(task)
+        chained[id] = chain
+
+    return chains
+
+
+def fuse_chain(chain, main):
+    """
+    create the task running the tasks of chain in one job. The tasks keep
+    their logs and done files, so a fused run and a normal run resume each other.
+    :param chain: tasks, see find_chains
+    :param main: the task whose options are used by the job, see main_task
+    :return: Task object
+    """
+    head = chain[0]
+    last = chain[-1]
+    option = str2dict(main._option)
+
+    # the tasks write their own logs, the job has its own
+    for key in ["o", "e"]:
+        option.pop(key, None)
+
+    task = Task(
+        id="%s+%s" % (head.id, last.id),
+        work_dir=head.work_dir,
+        script="\n".join(i.script for i in chain),
+        type=head.type,
+        option=dict2str(option),
+        inputs=[i for member in chain for i in member.inputs],
+        retry=main.retry
+    )
+    task.temp = [i for member in chain for i in member.temp]
+    task.members = list(chain)
+    task.depends = list(head.depends)
+    task.group = head.group
+    task.weight = sum(i.weight for i in chain)
+    task.size = max(i.size for i in chain)
+    task.predicted_memory = max(i.predicted_memory for i in chain)
+    # the key of task is the key of the last one, see cache.task_key
+    task.done = last.done
+
+    return task
+
+
+def fuse_tasks(dag, history, max_time=MAX_TIME):
+    """
+    fuse the linear chains of cheap tasks in dag, the tasks depending on the
+    last task of a chain depend on the fused task
+    :param dag: DAG object, the tasks are replaced
+    :param history: {id or name: seconds}
+    :param max_time: see MAX_TIME
+    :return: {fused id: [task ids]}
+    """
+    chains = find_chains(dag, history, max_time)
+
+    if not chains:
+        return {}
+
+    heads = {}
+    rename = {}
+    fused = OrderedDict()
+
+    for chain in chains:
+        task = fuse_chain(chain, main_task(chain, history, max_time))
+        heads[chain[0].id] = task
+        fused[task.id] = [i.id for i in chain]
+
+        for i in chain:
+            rename[i.id] = task.id
+
+    tasks = OrderedDict()
+
+    for id, task in dag.tasks.items():
+        if id in heads:
+            tasks[heads[id].id] = heads[id]
+        elif id not in rename:
+            tasks[id] = task
+
+    for task in tasks.values():
+        task.depends = [rename.get(i, i) for i in task.depends]
+
+    dag.tasks = tasks
+
+    for id, ids in fused.items():
+        LOG.info("fuse tasks %s into task %r" % (", ".join(ids), id))
+
+    return fused
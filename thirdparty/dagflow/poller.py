@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import getpass
+import logging
+import tempfile
+import subprocess
+import xml.etree.ElementTree as ET
+
+
+LOG = logging.getLogger(__name__)
+POLLERS = {}
+
+
+def run_command(command, timeout=60):
+    """
+    run the command of scheduler, a failed or timed out command raises
+    ValueError, so its empty output is never taken as no jobs
+    :param command:
+    :param timeout: seconds
+    :return: the stdout
+    """
+    try:
+        p = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           timeout=timeout, universal_newlines=True)
+    except (subprocess.TimeoutExpired, OSError) as e:
+        raise ValueError("%r failed: %s" % (command, e))
+
+    if p.returncode != 0:
+        raise ValueError("%r exit with %s: %s" % (command, p.returncode, p.stderr.strip()))
+
+    return p.stdout
+
+
+def parse_task_range(string):
+    """
+    parse the ja-task-ID of qstat, eg: "1-5:2,8" to [1, 3, 5, 8]
+    :param string:
+    :return:
+    """
+    r = []
+
+    for part in string.split(","):
+        step = 1
+        if ":" in part:
+            part, step = part.split(":")
+
+        if "-" in part:
+            start, end = part.split("-")
+            r += list(range(int(start), int(end)+1, int(step)))
+        else:
+            r.append(int(part))
+
+    return r
+
+
+def parse_qstat_xml(string):
+    """
+    parse the output of "qstat -xml", the elements of array jobs are "job_id.task_id"
+    :param string:
+    :return: {job_id: {"status": "r", "node": "node1"}}
+    """
+    r = {}
+
+    for job in ET.fromstring(string).iter("job_list"):
+        _id = job.findtext("JB_job_number", "").strip()
+        _status = job.findtext("state", "").strip()
+        _queue = job.findtext("queue_name", "") or ""
+        _task_ids = job.findtext("tasks", "").strip()
+
+        if "@" in _queue:
+            _node = _queue.split("@")[1].strip()
+        else:
+            _node = ""
+
+        r[_id] = {"status": _status,
+                  "node": _node}
+
+        if _task_ids:
+            for n in parse_task_range(_task_ids):
+                r["%s.%s" % (_id, n)] = r[_id]
+
+    return r
+
+
+def parse_qhost_xml(string):
+    """
+    parse the output of "qhost -xml", the nodes without load are down
+    :param string:
+    :return: {node: "Y" or "N"}
+    """
+    r = {}
+
+    for host in ET.fromstring(string).iter("host"):
+        _name = host.get("name")
+
+        if _name == "global":
+            continue
+
+        _load = "-"
+        for value in host.iter("hostvalue"):
+            if value.get("name") == "load_avg":
+                _load = (value.text or "-").strip()
+
+        r[_name] = "N" if _load == "-" else "Y"
+
+    return r
+
+
+def parse_squeue(string):
+    """
+    parse the output of "squeue -h -o '%i|%t|%N'", the elements of array jobs are "job_id_task_id"
+    :param string:
+    :return: {job_id: {"status": "R", "node": "node1"}}
+    """
+    r = {}
+
+    for line in string.strip().split("\n"):
+        if not line.strip():
+            continue
+
+        _id, _status, _node = (line.split("|") + ["", ""])[:3]
+        r[_id.strip()] = {"status": _status.strip(), "node": _node.strip()}
+
+    return r
+
+
+def parse_sinfo(string):
+    """
+    parse the output of "sinfo -h -N -o '%N|%t'", the nodes down, failed or not
+    responding ("*") are down
+    :param string:
+    :return: {node: "Y" or "N"}
+    """
+    r = {}
+
+    for line in string.strip().split("\n"):
+        if "|" not in line:
+            continue
+
+        _name, _state = [i.strip() for i in line.split("|")[:2]]
+
+        if _state.startswith(("down", "fail")) or _state.endswith("*"):
+            r[_name] = "N"
+        elif r.get(_name) != "N":
+            r[_name] = "Y"
+
+    return r
+
+
+class SGEPoller(object):
+    """
+    Poll qstat and qhost for all DAGs in the process, the results are cached
+    for qstat_ttl and qhost_ttl seconds. With cache_file, the result of qstat
+    is shared with the other processes of the same user.
+    """
+
+    def __init__(self, qstat_ttl=3, qhost_ttl=300, cache_file=""):
+        self.user = getpass.getuser()
+        self.qstat_ttl = qstat_ttl
+        self.qhost_ttl = qhost_ttl
+        self.cache_file = cache_file
+        self._qstat = (0, {})
+        self._qhost = (0, {})
+
+    def read_cache(self):
+        """
+        read the qstat result of other processes
+        :return: (time, jobs) or None
+        """
+        if not self.cache_file or not os.path.isfile(self.cache_file):
+            return None
+
+        try:
+            with open(self.cache_file) as fh:
+                cache = json.load(fh)
+        except (IOError, ValueError):
+            return None
+
+        if cache.get("user") != self.user:
+            return None
+
+        return cache["time"], cache["jobs"]
+
+    def write_cache(self, poll_time, jobs):
+        """
+        write the qstat result to cache_file by rename, readers never see a partial file
+        :return:
+        """
+        if not self.cache_file:
+            return 0
+
+        dirname = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, temp = tempfile.mkstemp(dir=dirname, prefix=".qstat.")
+
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"user": self.user, "time": poll_time, "jobs": jobs}, fh)
+
+        os.rename(temp, self.cache_file)
+
+        return 1
+
+    def list_jobs(self):
+
+        return parse_qstat_xml(run_command("qstat -xml -u %s" % self.user))
+
+    def list_nodes(self):
+
+        return parse_qhost_xml(run_command("qhost -xml"))
+
+    def qstat(self):
+        """
+        get the jobs of user
+        :return:
+        """
+        now = time.time()
+
+        if now - self._qstat[0] < self.qstat_ttl:
+            return self._qstat[1]
+
+        cache = self.read_cache()
+        if cache and now - cache[0] < self.qstat_ttl:
+            self._qstat = cache
+            return cache[1]
+
+        try:
+            jobs = self.list_jobs()
+        except (ET.ParseError, ValueError) as e:
+            # keep the last result, the tasks are not taken as finished by a failed qstat
+            LOG.warning("poll jobs failed: %s" % e)
+            return self._qstat[1]
+
+        self._qstat = (now, jobs)
+        self.write_cache(now, jobs)
+
+        return jobs
+
+    def qhost(self):
+        """
+        get the status of nodes
+        :return:
+        """
+        now = time.time()
+
+        if now - self._qhost[0] < self.qhost_ttl:
+            return self._qhost[1]
+
+        try:
+            hosts = self.list_nodes()
+        except (ET.ParseError, ValueError) as e:
+            LOG.warning("poll nodes failed: %s" % e)
+            return self._qhost[1]
+
+        self._qhost = (now, hosts)
+
+        return hosts
+
+    @property
+    def last_poll(self):
+        """
+        the time of the qstat result returned last
+        :return:
+        """
+        return self._qstat[0]
+
+    def expire(self):
+        """
+        drop the cached qstat result of this process
+        :return:
+        """
+        self._qstat = (0, {})
+
+        return self
+
+
+class SlurmPoller(SGEPoller):
+    """
+    Poll squeue and sinfo like SGEPoller, the array elements are "job_id_task_id"
+    """
+
+    def list_jobs(self):
+        string = run_command("squeue -h -u %s -o '%%i|%%t|%%N'" % self.user)
+
+        if string and "|" not in string:
+            raise ValueError(string)
+
+        return parse_squeue(string)
+
+    def list_nodes(self):
+
+        return parse_sinfo(run_command("sinfo -h -N -o '%N|%t'"))
+
+
+def get_poller(scheduler="sge", **kwargs):
+    """
+    get the poller of scheduler shared by all DAGs in the process, kwargs change its options
+    :param scheduler: sge or slurm
+    :return: SGEPoller or SlurmPoller object
+    """
+    if scheduler not in POLLERS:
+        POLLERS[scheduler] = {"sge": SGEPoller, "slurm": SlurmPoller}[scheduler]()
+
+    poller = POLLERS[scheduler]
+
+    for key, value in kwargs.items():
+        assert hasattr(poller, key), "unknown option %r" % key
+        setattr(poller, key, value)
+
+    return poller
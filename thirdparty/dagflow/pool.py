@@ -0,0 +1,237 @@
+import os
+import sys
+import logging
+import resource
+import traceback
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+LOG = logging.getLogger(__name__)
+POOL = None
+WAKEUP_FD = None
+
+# the number of workers (default os.cpu_count()) and their python (default sys.executable)
+PROCESSES = None
+EXECUTABLE = None
+
+# the python functions loaded by the workers, {path: module}
+MODULES = {}
+
+
+def load_function(function):
+    """
+    load a function by "path/to/script.py:name" or "package.module:name", the
+    modules are kept in the worker, so the imports are paid once
+    :param function:
+    :return: callable
+    """
+    path, name = function.rsplit(":", 1)
+
+    if path not in MODULES:
+        if path.endswith(".py"):
+            # the scripts import their neighbours, eg: GffReader
+            if os.path.dirname(path) not in sys.path:
+                sys.path.insert(0, os.path.dirname(path))
+
+            spec = importlib.util.spec_from_file_location(
+                "_dagflow_%s" % os.path.basename(path)[:-3], path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(path)
+
+        MODULES[path] = module
+
+    return getattr(MODULES[path], name)
+
+
+def reset_peak_rss():
+    """
+    reset the peak rss of the worker to its current rss (Linux 4.0 or later),
+    so the peak of a function is not of the functions run before in the worker
+    :return: True if reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except (IOError, OSError):
+        return False
+
+    return True
+
+
+def peak_rss():
+    """
+    the peak rss (bytes) of the worker since reset_peak_rss
+    :return: bytes or None if unknown
+    """
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+
+    return None
+
+
+def run_function(function, args, kwargs, work_dir, stdout, stderr, done, key):
+    """
+    run a function in the work directory of task, the stdout and stderr of the
+    function (and the programs it runs) are written to files. The exceptions
+    are written to stderr and the task fails, the worker is kept. The max_rss
+    of usage is the peak of the function (or the programs it runs), None if it
+    can not be told from the peak of the worker, so it is not predicted from.
+    :return: {"returncode": 0 or 1, "usage": {}}
+    """
+    reset = reset_peak_rss()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    start = resource.getrusage(resource.RUSAGE_SELF)
+    cwd = os.getcwd()
+    saved = [os.dup(1), os.dup(2)]
+    returncode = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    with open(stdout, "w") as out, open(stderr, "w") as err:
+        os.dup2(out.fileno(), 1)
+        os.dup2(err.fileno(), 2)
+        sys.stdout, sys.stderr = out, err
+
+        try:
+            os.chdir(work_dir)
+            r = load_function(function)(*args, **kwargs)
+
+            if r in [None, 0, True]:
+                with open(done, "w") as fh:
+                    fh.write("%s\n" % key)
+                returncode = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            out.flush()
+            err.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            os.chdir(cwd)
+
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    max_rss = peak_rss() if reset else None
+
+    # the peak of the programs run is only known if they are the largest run by the worker
+    end_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if max_rss is not None and end_children > children:
+        max_rss = max(max_rss, end_children * 1024)
+
+    return {
+        "returncode": returncode,
+        "usage": {
+            "cpu_user": end.ru_utime - start.ru_utime,
+            "cpu_sys": end.ru_stime - start.ru_stime,
+            "max_rss": max_rss,
+            "read_blocks": end.ru_inblock - start.ru_inblock,
+            "write_blocks": end.ru_oublock - start.ru_oublock,
+        }
+    }
+
+
+def set_wakeup(fd):
+    """
+    write to fd when a function finished, see do_dag.init_wakeup
+    :param fd:
+    :return:
+    """
+    global WAKEUP_FD
+    WAKEUP_FD = fd
+
+    return fd
+
+
+def wakeup(future):
+
+    if WAKEUP_FD is not None:
+        try:
+            os.write(WAKEUP_FD, b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+
+def configure(processes=None, executable=None):
+    """
+    set the options of the pool started later
+    :param processes: the number of workers
+    :param executable: the python of workers, it must import dagflow and the functions
+    :return:
+    """
+    global PROCESSES, EXECUTABLE
+    PROCESSES = processes
+    EXECUTABLE = executable
+
+    return 1
+
+
+def get_pool():
+    """
+    get the worker pool, a broken pool (eg: a worker was killed) is replaced
+    :return:
+    """
+    global POOL
+
+    if POOL is not None and not getattr(POOL, "_broken", False):
+        return POOL
+
+    context = multiprocessing.get_context("forkserver")
+    if EXECUTABLE:
+        context.set_executable(EXECUTABLE)
+
+    POOL = ProcessPoolExecutor(
+        max_workers=PROCESSES or os.cpu_count() or 1,
+        mp_context=context,
+        max_tasks_per_child=100
+    )
+    LOG.info("start a pool of %s python workers" % POOL._max_workers)
+
+    return POOL
+
+
+def submit(task):
+    """
+    submit the function of python task to the pool
+    :param task: Task object of type "python"
+    :return: Future object
+    """
+    future = get_pool().submit(
+        run_function, task.function, task.args, task.kwargs, task.work_dir,
+        task.option["o"], task.option["e"], task.done, task.key
+    )
+    future.add_done_callback(wakeup)
+
+    return future
+
+
+def shutdown():
+    """
+    stop the workers, the functions running are killed
+    :return:
+    """
+    global POOL
+
+    if POOL is None:
+        return 0
+
+    processes = list((POOL._processes or {}).values())
+    POOL.shutdown(wait=False, cancel_futures=True)
+
+    for process in processes:
+        process.terminate()
+
+    POOL = None
+
+    return len(processes)
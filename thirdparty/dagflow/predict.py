@@ -0,0 +1,291 @@
+"""
+Predict the run time and peak memory of tasks from the runs recorded in the
+task store (see TaskStore.samples), and simulate a DAG to estimate its makespan
+before it runs. The runs of a task are keyed by its name pattern, the chunks of
+a ParallelTask share one pattern (eg: "Refseq_01" -> "Refseq_*"), and scaled by
+the size of its inputs, see input_sizes.
+"""
+
+import os
+import re
+import math
+import heapq
+import logging
+from collections import OrderedDict
+
+from .dag import get_executor
+from .priority import estimate
+from .timeline import critical_path
+
+
+LOG = logging.getLogger(__name__)
+
+# the runs of a pattern used, the latest first
+MAX_SAMPLES = 50
+# the predicted peak memory is asked with this headroom
+MEMORY_HEADROOM = 1.2
+
+
+def pattern(name):
+    """
+    the pattern of task name, the number of ParallelTask chunks is replaced by "*"
+    :param name:
+    :return:
+    """
+    return re.sub(r"_\d+$", "_*", name)
+
+
+def median(values):
+
+    values = sorted(values)
+    n = len(values)
+
+    if n % 2:
+        return values[n // 2]
+
+    return (values[n // 2 - 1] + values[n // 2]) / 2.0
+
+
+def fit(points, size):
+    """
+    predict y of size by a power law y = a * size ^ b fitted to the points
+    of 3 sizes at least, or the median of y
+    :param points: [(size, y), ...]
+    :param size: the size of the task, 0 if unknown
+    :return: y or 0 if no points
+    """
+    points = [i for i in points if i[1] > 0]
+
+    if not points:
+        return 0
+
+    sized = [(math.log(x), math.log(y)) for x, y in points if x > 0]
+
+    if size <= 0 or len(set(i[0] for i in sized)) < 3:
+        return median([i[1] for i in points])
+
+    mx = sum(i[0] for i in sized) / len(sized)
+    my = sum(i[1] for i in sized) / len(sized)
+    var = sum((i[0] - mx) ** 2 for i in sized)
+    b = sum((i[0] - mx) * (i[1] - my) for i in sized) / var
+    # the runs of tools grow with the inputs, but not faster than quadratic
+    b = min(max(b, 0), 2)
+
+    return math.exp(my + b * (math.log(size) - mx))
+
+
+class Predictor(object):
+    """
+    Predict the run time (seconds) and peak memory (bytes) of tasks
+    """
+
+    def __init__(self, samples, max_samples=MAX_SAMPLES):
+        """
+        :param samples: the runs of tasks, [{"name", "wall", "max_rss", "size"}, ...], the latest first
+        :param max_samples: see MAX_SAMPLES
+        """
+        self.samples = OrderedDict()
+
+        for i in samples:
+            runs = self.samples.setdefault(pattern(i["name"]), [])
+
+            if len(runs) < max_samples:
+                runs.append(i)
+
+    def predict(self, task):
+        """
+        :param task:
+        :return: (seconds, memory), 0 if unknown
+        """
+        runs = self.samples.get(pattern(task.name), [])
+
+        wall = fit([(i["size"] or 0, i["wall"] or 0) for i in runs], task.size)
+        memory = fit([(i["size"] or 0, i["max_rss"] or 0) for i in runs], task.size)
+
+        return wall, int(memory * MEMORY_HEADROOM)
+
+    def history(self, tasks):
+        """
+        predict the tasks, the tasks asking no memory are sized by the prediction
+        :param tasks: {id: task}
+        :return: {id: seconds} of the tasks predicted, see priority.estimate
+        """
+        r = {}
+
+        for id, task in tasks.items():
+            wall, memory = self.predict(task)
+
+            if wall:
+                r[id] = wall
+
+            if memory:
+                task.predicted_memory = memory
+
+        LOG.info("The run time of %s/%s tasks is predicted by the history" % (len(r), len(tasks)))
+
+        return r
+
+
+def input_sizes(tasks, order):
+    """
+    set the size of tasks, the bytes of their inputs existing, the tasks whose
+    inputs are made later take the size of their upstream tasks, so the tasks
+    of a sample are scaled by the size of its raw data
+    :param tasks: {id: task}
+    :param order: task ids in topological order
+    :return: {id: bytes}
+    """
+    r = {}
+
+    for id in order:
+        task = tasks[id]
+        size = 0
+
+        for path in task.inputs:
+            if os.path.isfile(path):
+                size += os.path.getsize(path)
+
+        if not size:
+            size = max([r[i] for i in task.depends] or [0])
+
+        task.size = size
+        r[id] = size
+
+    return r
+
+
+def simulate(tasks, order, history, priority, concurrent_tasks, cpus, memory=None, done=()):
+    """
+    simulate the run of DAG like do_dag, the waiting tasks start by priority
+    when fewer than concurrent_tasks are running, local tasks also wait for
+    the cpus and memory of this machine
+    :param tasks: {id: task}
+    :param order: task ids in topological order
+    :param history: {id: seconds}, see Predictor.history
+    :param priority: {id: priority}
+    :param concurrent_tasks:
+    :param cpus: the cpus of local tasks
+    :param memory: the memory (bytes) of local tasks, None for no limit
+    :param done: the ids of tasks finished, they take no time
+    :return: {id: (start, end)}
+    """
+    rank = dict((id, n) for n, id in enumerate(order))
+    depends = dict((id, set(tasks[id].depends)) for id in order)
+    downstream = dict((id, []) for id in order)
+
+    for id in order:
+        for _id in depends[id]:
+            downstream[_id].append(id)
+
+    r = {}
+    ready = []
+    running = []
+    now = 0
+    free_cpus = cpus
+    free_memory = memory
+
+    def finish(id, end):
+        r[id] = (r.get(id, (end, end))[0], end)
+
+        for _id in downstream[id]:
+            depends[_id].discard(id)
+
+            if not depends[_id]:
+                heapq.heappush(ready, (-priority.get(_id, 0), rank[_id], _id))
+
+    for id in order:
+        if not depends[id]:
+            heapq.heappush(ready, (-priority.get(id, 0), rank[id], id))
+
+    while ready or running:
+        waiting = []
+
+        while ready:
+            item = heapq.heappop(ready)
+            id = item[2]
+            task = tasks[id]
+
+            if id in done:
+                r[id] = (now, now)
+                finish(id, now)
+                continue
+
+            local = get_executor(task.type).local
+            slots = min(task.slots, cpus)
+            task_memory = min(task.memory, memory) if memory else 0
+
+            if len(running) >= concurrent_tasks or (local and (
+                    slots > free_cpus or (memory and task_memory > free_memory))):
+                waiting.append(item)
+                continue
+
+            if local:
+                free_cpus -= slots
+                if memory:
+                    free_memory -= task_memory
+
+            r[id] = (now, now)
+            heapq.heappush(running, (now + estimate(task, history), rank[id], id))
+
+        for item in waiting:
+            heapq.heappush(ready, item)
+
+        if not running:
+            break
+
+        end, _, id = heapq.heappop(running)
+        now = end
+        task = tasks[id]
+
+        if get_executor(task.type).local:
+            free_cpus += min(task.slots, cpus)
+            if memory:
+                free_memory += min(task.memory, memory)
+
+        finish(id, end)
+
+    return r
+
+
+def write_prediction(tasks, order, history, schedule, done, filename):
+    """
+    write the prediction of tasks to filename (tsv), and log the makespan and
+    the critical path
+    :param schedule: see simulate
+    :return: (makespan, critical path)
+    """
+    walls = dict((id, {"wall": 0 if id in done else estimate(tasks[id], history)}) for id in order)
+    path, total = critical_path(tasks, order, walls)
+    makespan = max([i[1] for i in schedule.values()] or [0])
+
+    with open(filename, "w") as fh:
+        fh.write("#id\tname\ttype\tsize\tstatus\tpredicted\truntime\tmemory\tstart\tend\tcritical\n")
+
+        for id in order:
+            task = tasks[id]
+            start, end = schedule.get(id, (0, 0))
+
+            fh.write("%s\t%s\t%s\t%s\t%s\t%s\t%.1f\t%s\t%.1f\t%.1f\t%s\n" % (
+                id, task.name, task.type, task.size, "done" if id in done else "todo",
+                "yes" if id in history else "no", walls[id]["wall"], task.memory,
+                start, end, "yes" if id in path else "no"))
+
+    slot_hours = sum(walls[id]["wall"] * tasks[id].slots for id in order) / 3600.0
+
+    LOG.info("Prediction of tasks written to %s" % filename)
+    LOG.info("Predicted makespan: %s, %.1f slot hours for %s tasks to run" % (
+        format_seconds(makespan), slot_hours, len(order) - len(done)))
+    LOG.info("Predicted critical path (%s): %s" % (format_seconds(total), " -> ".join(path)))
+
+    for id in sorted(order, key=lambda x: -walls[x]["wall"])[:5]:
+        LOG.info("task %r: %s, %s slots, %s bytes memory" % (
+            id, format_seconds(walls[id]["wall"]), tasks[id].slots, tasks[id].memory))
+
+    return makespan, path
+
+
+def format_seconds(seconds):
+
+    seconds = int(seconds)
+
+    return "%d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
@@ -0,0 +1,53 @@
+import logging
+
+
+LOG = logging.getLogger(__name__)
+
+# the run time (seconds) of a task with weight 1 and no history
+DEFAULT_TIME = 60
+
+
+def estimate(task, history):
+    """
+    the run time of task, from history or the static weight of task
+    :param task:
+    :param history: {id or name: seconds}, see predict.Predictor.history
+    :return: seconds
+    """
+    if task.id in history:
+        return history[task.id]
+
+    if task.name in history:
+        return history[task.name]
+
+    return task.weight * DEFAULT_TIME
+
+
+def critical_path_priority(tasks, order, history):
+    """
+    the priority of a task is the length of the longest chain from it to the
+    end of DAG, the tasks on the critical path are submitted first
+    :param tasks: {id: task}
+    :param order: task ids in topological order, see DAG.validate
+    :param history: {id or name: seconds}
+    :return: {id: priority}
+    """
+    downstream = dict((id, []) for id in tasks)
+
+    for id, task in tasks.items():
+        for _id in set(task.depends):
+            downstream[_id].append(id)
+
+    r = {}
+    for id in reversed(order):
+        r[id] = estimate(tasks[id], history) + max([r[i] for i in downstream[id]] or [0])
+
+    return r
+
+
+def insertion_priority(tasks, order, history):
+    """
+    submit the tasks in the order they were added to DAG
+    :return: {id: priority}
+    """
+    return dict((id, 0) for id in tasks)
@@ -0,0 +1,283 @@
+"""
+Stream the stdout and stderr of local tasks to their log files in one asyncio
+event loop. A log is rotated when it grows over MAX_BYTES, BACKUPS old logs are
+kept (gzipped with COMPRESS), so the verbose tools never fill the disk. The
+pipes are closed when the tasks exit, and the last lines of the logs are kept
+in memory for the progress of tasks, see tail and progress.
+
+The tasks are still reaped by do_dag (os.wait4), the loop only moves their output.
+The tasks not run by LocalExecutor, eg: the tasks fused in one job, pipe their
+output to this script run as a command, see command and main.
+"""
+
+import os
+import sys
+import gzip
+import shutil
+import asyncio
+import logging
+import argparse
+import threading
+
+
+LOG = logging.getLogger(__name__)
+LOOP = None
+
+# the size (bytes) of a log before it is rotated, 0 for no limit
+MAX_BYTES = 256000000
+# the number of rotated logs kept, the older are removed
+BACKUPS = 1
+# gzip the rotated logs
+COMPRESS = True
+# the bytes of the end of logs kept in memory
+TAIL_BYTES = 4096
+
+# the logs of running tasks, {pid: (stdout, stderr)}
+STREAMS = {}
+
+
+class RotatingLog(object):
+    """
+    A log file rotated to path.1 (or path.1.gz), path.2, ... when it is full
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS, compress=COMPRESS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.size = 0
+        self.total = 0
+        self.last = b""
+        # unbuffered, the log files can be followed by "tail -f"
+        self.fh = open(path, "wb", buffering=0)
+
+    def backup(self, n):
+
+        return "%s.%s%s" % (self.path, n, ".gz" if self.compress else "")
+
+    async def write(self, data):
+
+        if self.max_bytes and self.size and self.size + len(data) > self.max_bytes:
+            await self.rotate()
+
+        self.fh.write(data)
+        self.size += len(data)
+        self.total += len(data)
+        self.last = (self.last + data)[-TAIL_BYTES:]
+
+        return len(data)
+
+    async def rotate(self):
+        """
+        move the log to path.1, the older logs are shifted and the oldest removed,
+        gzip runs in a thread, only the task of this log waits
+        :return:
+        """
+        self.fh.close()
+
+        if self.backups:
+            for n in range(self.backups - 1, 0, -1):
+                if os.path.exists(self.backup(n)):
+                    os.replace(self.backup(n), self.backup(n + 1))
+
+            if self.compress:
+                await asyncio.get_running_loop().run_in_executor(None, gzip_file, self.path, self.backup(1))
+            else:
+                os.replace(self.path, self.backup(1))
+
+        self.fh = open(self.path, "wb", buffering=0)
+        self.size = 0
+
+        return self.path
+
+    def close(self):
+
+        self.fh.close()
+
+    def tail(self, lines=1):
+        """
+        the last lines of log
+        :param lines:
+        :return: string
+        """
+        return "\n".join(self.last.decode("utf-8", "replace").splitlines()[-lines:])
+
+
+def gzip_file(path, target):
+
+    with open(path, "rb") as fh, gzip.open(target + ".tmp", "wb", compresslevel=1) as out:
+        shutil.copyfileobj(fh, out, 1 << 20)
+
+    os.replace(target + ".tmp", target)
+    os.remove(path)
+
+    return target
+
+
+def configure(max_bytes=None, backups=None, compress=None):
+    """
+    set the rotation of the logs opened later
+    :param max_bytes: see MAX_BYTES
+    :param backups: see BACKUPS
+    :param compress: see COMPRESS
+    :return:
+    """
+    global MAX_BYTES, BACKUPS, COMPRESS
+
+    if max_bytes is not None:
+        MAX_BYTES = max_bytes
+    if backups is not None:
+        BACKUPS = backups
+    if compress is not None:
+        COMPRESS = compress
+
+    return 1
+
+
+def get_loop():
+    """
+    get the event loop, it runs in a daemon thread
+    :return:
+    """
+    global LOOP
+
+    if LOOP is not None:
+        return LOOP
+
+    LOOP = asyncio.new_event_loop()
+    threading.Thread(target=LOOP.run_forever, name="dagflow-logs", daemon=True).start()
+
+    return LOOP
+
+
+async def pump(pipe, log):
+    """
+    copy the output of pipe to log until the pipe is closed
+    :return: the bytes copied
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=1 << 20)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+
+    try:
+        while 1:
+            data = await reader.read(1 << 16)
+            if not data:
+                break
+            await log.write(data)
+    finally:
+        transport.close()
+        log.close()
+
+    return log.total
+
+
+async def stream_logs(pid, stdout, stderr, out, err):
+
+    logs = (RotatingLog(out, MAX_BYTES, BACKUPS, COMPRESS), RotatingLog(err, MAX_BYTES, BACKUPS, COMPRESS))
+    STREAMS[pid] = logs
+
+    try:
+        return await asyncio.gather(pump(stdout, logs[0]), pump(stderr, logs[1]))
+    finally:
+        STREAMS.pop(pid, None)
+
+
+def stream(child, out, err):
+    """
+    stream the stdout and stderr of child (Popen with pipes) to the files out and err
+    :return: Future object, done when the pipes are closed
+    """
+    return asyncio.run_coroutine_threadsafe(
+        stream_logs(child.pid, child.stdout, child.stderr, out, err), get_loop())
+
+
+def progress(pid):
+    """
+    the bytes written to stdout and stderr by process
+    :param pid:
+    :return: (stdout, stderr)
+    """
+    logs = STREAMS.get(pid)
+
+    if not logs:
+        return 0, 0
+
+    return logs[0].total, logs[1].total
+
+
+def tail(pid, lines=1):
+    """
+    the last lines of stderr, or stdout if nothing in stderr
+    :param pid:
+    :param lines:
+    :return: string
+    """
+    logs = STREAMS.get(pid)
+
+    if not logs:
+        return ""
+
+    return logs[1].tail(lines) or logs[0].tail(lines)
+
+
+def command(path):
+    """
+    the command rotating its stdin to the log path like the local tasks, with
+    the rotation configured in this process
+    :param path:
+    :return: string
+    """
+    r = "%s %s --max_bytes %s --backups %s" % (sys.executable, os.path.abspath(__file__), MAX_BYTES, BACKUPS)
+
+    if not COMPRESS:
+        r += " --no_compress"
+
+    return "%s %s" % (r, path)
+
+
+def rotate(path, pipe):
+    """
+    copy pipe to the log path rotated until the pipe is closed
+    :return: the bytes copied
+    """
+    return asyncio.run(pump(pipe, RotatingLog(path, MAX_BYTES, BACKUPS, COMPRESS)))
+
+
+def wait(futures, timeout=1):
+    """
+    wait for the logs of tasks exited, the pipes kept by their background
+    commands are still streamed after timeout
+    :return: the number of logs closed
+    """
+    n = 0
+
+    for future in futures:
+        try:
+            future.result(timeout)
+            n += 1
+        except Exception as e:
+            LOG.debug("logs not closed: %r" % e)
+
+    return n
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Write the stdin to LOG rotated like the logs of local tasks")
+    parser.add_argument("log", metavar="LOG", help="the log file")
+    parser.add_argument("--max_bytes", metavar="INT", type=int, default=MAX_BYTES,
+        help="Rotate the log over INT bytes, 0 for no limit (default: %s)." % MAX_BYTES)
+    parser.add_argument("--backups", metavar="INT", type=int, default=BACKUPS,
+        help="Keep INT logs rotated (default: %s)." % BACKUPS)
+    parser.add_argument("--no_compress", action="store_true",
+        help="Do not gzip the logs rotated.")
+    args = parser.parse_args()
+
+    configure(args.max_bytes, args.backups, not args.no_compress)
+    rotate(args.log, sys.stdin.buffer)
+
+
+if __name__ == "__main__":
+    main()
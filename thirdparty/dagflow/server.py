@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+"""
+A local scheduler shared by the do_dag runs on one machine. The server owns
+the cpu and memory budget of the machine and grants them to the local tasks
+of all runs fairly, the runs start their tasks when granted and release the
+resources when the tasks exit. The server never runs the tasks, so the tasks
+of every user run as the user, and the grants of a run are released when it
+disconnects.
+
+    python server.py start --socket /tmp/dagflow.sock --cpus 32 --memory 128G
+    python server.py status --socket /tmp/dagflow.sock
+
+The messages are json lines over the unix socket:
+    {"cmd": "hello", "run": "name"}
+    {"cmd": "acquire", "id": "task", "slots": 4, "memory": 1000000}
+    {"cmd": "release", "id": "task"}
+    {"cmd": "status"}
+and the server sends {"event": "grant", "id": "task"} when a task can run.
+"""
+
+import os
+import sys
+import json
+import socket
+import getpass
+import logging
+import argparse
+import selectors
+from collections import OrderedDict, deque
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+    from thirdparty.dagflow.dag import str2bytes
+else:
+    from .dag import str2bytes
+
+LOG = logging.getLogger(__name__)
+SOCKET = "/tmp/dagflow.sock"
+# the permission of socket, the runs of the users in the group can share the server
+MODE = 0o660
+
+
+class Run(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.name = ""
+        self.user = ""
+        self.queue = deque()
+        self.running = OrderedDict()
+        self.granted = 0
+        self.buffer = b""
+
+
+class LocalServer(object):
+    """
+    Grant the cpus and memory of this machine to the tasks of runs, the run
+    with the fewest running (then granted) tasks goes first
+    """
+
+    def __init__(self, path=SOCKET, cpus=None, memory=None, mode=MODE):
+        self.path = path
+        self.mode = mode
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory = memory or 0
+        self.free_cpus = self.cpus
+        self.free_memory = self.memory
+        self.runs = OrderedDict()
+        self.selector = selectors.DefaultSelector()
+
+    def listen(self):
+
+        if os.path.exists(self.path):
+            try:
+                socket.socket(socket.AF_UNIX).connect(self.path)
+                raise Exception("server is running on %s" % self.path)
+            except ConnectionRefusedError:
+                os.remove(self.path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        # no task is run by the server, the runs of other users can share it by mode
+        os.chmod(self.path, self.mode)
+        sock.listen(128)
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ)
+        LOG.info("server on %s, %s cpus, %s bytes memory" % (self.path, self.cpus, self.memory or "unlimited"))
+
+        return sock
+
+    def serve(self):
+        sock = self.listen()
+
+        try:
+            while 1:
+                for key, mask in self.selector.select():
+                    if key.fileobj is sock:
+                        conn, _ = sock.accept()
+                        conn.setblocking(False)
+                        self.runs[conn] = Run(conn)
+                        self.selector.register(conn, selectors.EVENT_READ)
+                    else:
+                        self.read(self.runs[key.fileobj])
+
+                self.schedule()
+        finally:
+            sock.close()
+            os.remove(self.path)
+
+    def read(self, run):
+
+        try:
+            data = run.conn.recv(65536)
+        except ConnectionError:
+            data = b""
+
+        if not data:
+            return self.close(run)
+
+        run.buffer += data
+        while b"\n" in run.buffer:
+            line, run.buffer = run.buffer.split(b"\n", 1)
+
+            if not line.strip():
+                continue
+
+            # a bad message closes its run only, the server is shared by other runs
+            try:
+                self.handle(run, json.loads(line.decode("utf-8")))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                LOG.warning("bad message %r from run %r: %r" % (line[:200], run.name, e))
+                return self.close(run)
+
+        return 1
+
+    def send(self, run, message):
+
+        try:
+            run.conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        except OSError:
+            return 0
+
+        return 1
+
+    def close(self, run):
+        """
+        release the resources of a run disconnected
+        :return:
+        """
+        for id in list(run.running):
+            self.release(run, id)
+
+        self.selector.unregister(run.conn)
+        run.conn.close()
+        del self.runs[run.conn]
+        LOG.info("run %r exit" % run.name)
+
+        return 0
+
+    def handle(self, run, message):
+        cmd = message.get("cmd")
+
+        if cmd == "hello":
+            run.name = message.get("run", "")
+            run.user = message.get("user", "")
+            LOG.info("run %r of %r connected" % (run.name, run.user))
+        elif cmd == "acquire":
+            slots = max(min(int(message.get("slots", 1)), self.cpus), 1)
+            memory = int(message.get("memory", 0))
+            if self.memory:
+                memory = min(memory, self.memory)
+            run.queue.append((message["id"], slots, memory))
+        elif cmd == "release":
+            self.release(run, message["id"])
+        elif cmd == "cancel":
+            run.queue = deque(i for i in run.queue if i[0] != message["id"])
+        elif cmd == "status":
+            self.send(run, self.status())
+        else:
+            LOG.warning("unknown message %r" % message)
+
+        return 1
+
+    def release(self, run, id):
+
+        if id not in run.running:
+            return 0
+
+        slots, memory = run.running.pop(id)
+        self.free_cpus += slots
+        self.free_memory += memory
+
+        return 1
+
+    def fits(self, slots, memory):
+
+        if slots > self.free_cpus:
+            return False
+
+        if self.memory and memory > self.free_memory:
+            return False
+
+        return True
+
+    def schedule(self):
+        """
+        grant the queued tasks until nothing fits
+        :return: the number of tasks granted
+        """
+        n = 0
+
+        while 1:
+            runs = sorted([i for i in self.runs.values() if i.queue],
+                          key=lambda x: (len(x.running), x.granted))
+            granted = 0
+
+            for run in runs:
+                for request in run.queue:
+                    id, slots, memory = request
+
+                    if not self.fits(slots, memory):
+                        continue
+
+                    run.queue.remove(request)
+                    run.running[id] = (slots, memory)
+                    run.granted += 1
+                    self.free_cpus -= slots
+                    self.free_memory -= memory
+                    self.send(run, {"event": "grant", "id": id})
+                    granted = 1
+                    break
+
+                if granted:
+                    break
+
+            if not granted:
+                return n
+
+            n += 1
+
+    def status(self):
+
+        return {
+            "event": "status",
+            "cpus": self.cpus,
+            "free_cpus": self.free_cpus,
+            "memory": self.memory,
+            "free_memory": self.free_memory,
+            "runs": [{"run": i.name, "user": i.user, "running": len(i.running), "queued": len(i.queue)}
+                     for i in self.runs.values()]
+        }
+
+
+class LocalClient(object):
+    """
+    The connection of a do_dag run to the server
+    """
+
+    def __init__(self, path=SOCKET, run=""):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.buffer = b""
+        self.requested = set()
+        self.granted = set()
+        self.events = []
+        self.send({"cmd": "hello", "run": run, "user": getpass.getuser()})
+
+    def fileno(self):
+
+        return self.sock.fileno()
+
+    def send(self, message):
+
+        self.sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+        return 1
+
+    def acquire(self, task):
+        """
+        ask for the cpus and memory of task, see read for the grant
+        :param task:
+        :return:
+        """
+        if task.id in self.requested:
+            return 0
+
+        self.requested.add(task.id)
+        self.send({"cmd": "acquire", "id": task.id, "slots": task.slots, "memory": task.memory})
+
+        return 1
+
+    def release(self, task):
+
+        if task.id not in self.granted:
+            return 0
+
+        self.granted.discard(task.id)
+        self.send({"cmd": "release", "id": task.id})
+
+        return 1
+
+    def recv(self):
+
+        data = self.sock.recv(65536)
+        if not data:
+            raise Exception("server %s exit" % self.path)
+
+        self.buffer += data
+
+        return len(data)
+
+    def read(self, block=False):
+        """
+        read the messages from server
+        :param block: wait for a message
+        :return: the messages
+        """
+        messages = []
+
+        if block and b"\n" not in self.buffer:
+            self.recv()
+
+        self.sock.setblocking(False)
+        try:
+            while 1:
+                self.recv()
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self.sock.setblocking(True)
+
+        while b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            message = json.loads(line.decode("utf-8"))
+
+            if message.get("event") == "grant":
+                self.requested.discard(message["id"])
+                self.granted.add(message["id"])
+
+            messages.append(message)
+
+        return messages
+
+    def status(self):
+
+        self.send({"cmd": "status"})
+
+        while 1:
+            for message in self.read(block=True):
+                if message.get("event") == "status":
+                    return message
+
+    def close(self):
+
+        self.sock.close()
+
+
+def add_server_args(parser):
+
+    parser.add_argument("command", choices=["start", "status"],
+        help="Start the server or show its status.")
+    parser.add_argument("--socket", metavar="FILE", type=str, default=SOCKET,
+        help="Unix socket of the server (default: %s)." % SOCKET)
+    parser.add_argument("--cpus", metavar="INT", type=int, default=0,
+        help="CPUs shared by local jobs (default: all cpus).")
+    parser.add_argument("--memory", metavar="STR", type=str, default="",
+        help="Memory shared by local jobs, eg: 64G (default: no limit).")
+    parser.add_argument("--mode", metavar="OCT", type=str, default="%o" % MODE,
+        help="Permission of the socket, 666 to share it with all users (default: %o)." % MODE)
+
+    return parser
+
+
+def main():
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO,
+        format="[%(levelname)s] %(message)s"
+    )
+
+    parser = add_server_args(argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__
+    ))
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print(json.dumps(LocalClient(args.socket, "status").status(), indent=2))
+        return 0
+
+    LocalServer(args.socket, args.cpus, str2bytes(args.memory) if args.memory else 0,
+                int(args.mode, 8)).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os.path
+import logging
+import sqlite3
+import time
+
+from .dag import get_executor
+
+
+LOG = logging.getLogger(__name__)
+
+
+class TaskStore(object):
+    """
+    Keep the state of tasks in a sqlite database, so a DAG can be resumed
+    after the controller exits. The runs of tasks finished are kept as the
+    samples of predict.Predictor, in the database or a history database
+    shared by the runs of many DAGs.
+    """
+
+    COLUMNS = ["status", "type", "run_id", "pid", "start", "end", "attempts", "key", "updated"]
+
+    def __init__(self, path, dag_id, history=""):
+        """
+        :param path:
+        :param dag_id:
+        :param history: the database of samples shared by DAGs, default path
+        """
+        # the tasks of ":memory:" are not kept, only their runs in history
+        self.path = path if path == ":memory:" else os.path.abspath(path)
+        self.dag_id = dag_id
+        self.samples_table = "samples"
+
+        for i in [path != ":memory:" and self.path, history]:
+            if i and not os.path.isdir(os.path.dirname(os.path.abspath(i))):
+                os.makedirs(os.path.dirname(os.path.abspath(i)))
+
+        self.conn = sqlite3.connect(self.path, timeout=60)
+
+        if history:
+            self.conn.execute("ATTACH DATABASE ? AS history", (os.path.abspath(history),))
+            self.samples_table = "history.samples"
+
+        self.conn.execute("""
+CREATE TABLE IF NOT EXISTS tasks (
+    dag TEXT NOT NULL,
+    id TEXT NOT NULL,
+    status TEXT,
+    type TEXT,
+    run_id TEXT,
+    pid INTEGER,
+    start REAL,
+    end REAL,
+    attempts INTEGER DEFAULT 0,
+    key TEXT,
+    updated REAL,
+    PRIMARY KEY (dag, id)
+)""")
+        self.conn.execute("""
+CREATE TABLE IF NOT EXISTS %s (
+    dag TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    start REAL,
+    wall REAL,
+    max_rss INTEGER,
+    size INTEGER,
+    slots INTEGER,
+    PRIMARY KEY (dag, id, start)
+)""" % self.samples_table)
+        self.conn.commit()
+        LOG.debug("open task store %r" % self.path)
+
+    def save(self, *tasks):
+        """
+        save the state of tasks
+        :param tasks:
+        :return:
+        """
+        rows = []
+        samples = []
+
+        for task in tasks:
+            pid = getattr(task.run_id, "pid", None)
+            run_id = get_executor(task.type).job_id(task)
+
+            rows.append((
+                self.dag_id, task.id, task.status, task.type, run_id, pid,
+                task.start_time, task.end_time, task.attempts, task.key, time.time()
+            ))
+
+            if task.status == "success" and task.start_time and task.end_time:
+                samples.append((
+                    self.dag_id, task.id, task.name, task.start_time, task.end_time - task.start_time,
+                    task.usage.get("max_rss"), task.size, task.slots
+                ))
+
+        self.conn.executemany("INSERT OR REPLACE INTO tasks VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+        self.conn.executemany("INSERT OR REPLACE INTO %s VALUES (?,?,?,?,?,?,?,?)" % self.samples_table, samples)
+        self.conn.commit()
+
+        return len(rows)
+
+    def load(self):
+        """
+        load the state of tasks in DAG
+        :return: {id: {column: value}}
+        """
+        r = {}
+        sql = "SELECT id, %s FROM tasks WHERE dag=?" % ", ".join(self.COLUMNS)
+
+        for row in self.conn.execute(sql, (self.dag_id,)):
+            r[row[0]] = dict(zip(self.COLUMNS, row[1:]))
+
+        return r
+
+    def samples(self):
+        """
+        the runs of tasks finished, the latest first
+        :return: [{"name", "wall", "max_rss", "size"}, ...]
+        """
+        columns = ["name", "wall", "max_rss", "size"]
+        sql = "SELECT %s FROM %s ORDER BY start DESC" % (", ".join(columns), self.samples_table)
+
+        return [dict(zip(columns, row)) for row in self.conn.execute(sql)]
+
+    def close(self):
+
+        self.conn.close()
+
+
+def store_path(dag):
+    """
+    the default path of the task store, in the common work directory of tasks
+    :param dag:
+    :return:
+    """
+    work_dirs = [task.work_dir for task in dag.tasks.values()]
+
+    if work_dirs:
+        root = os.path.commonpath(work_dirs)
+    else:
+        root = os.getcwd()
+
+    return os.path.join(root, "%s.dagflow.db" % dag.id)
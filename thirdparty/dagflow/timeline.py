@@ -0,0 +1,177 @@
+import os
+import csv
+import json
+import html
+import logging
+from collections import OrderedDict
+
+from .dag import get_executor
+
+
+LOG = logging.getLogger(__name__)
+
+FIELDS = ["id", "group", "stage", "type", "status", "run_id", "node", "start", "end",
+          "wall", "slots", "memory", "cpu_user", "cpu_sys", "cpu_efficiency",
+          "max_rss", "read_blocks", "write_blocks"]
+
+
+def task_profile(task, root):
+    """
+    the profile of a task run
+    :param task:
+    :param root: the common work directory, the first directory below is the stage
+    :return: dict
+    """
+    usage = task.usage
+    wall = task.end_time - task.start_time
+    cpu = usage.get("cpu_user", 0) + usage.get("cpu_sys", 0)
+    stage = os.path.relpath(task.work_dir, root).split(os.sep)[0]
+
+    return OrderedDict([
+        ("id", task.id),
+        ("group", task.group or ""),
+        ("stage", "" if stage == "." else stage),
+        ("type", task.type),
+        ("status", task.status),
+        ("run_id", get_executor(task.type).job_id(task)),
+        ("node", usage.get("node", "localhost" if get_executor(task.type).local else "")),
+        ("start", task.start_time),
+        ("end", task.end_time),
+        ("wall", round(wall, 3)),
+        ("slots", task.slots),
+        ("memory", task.memory),
+        ("cpu_user", usage.get("cpu_user", "")),
+        ("cpu_sys", usage.get("cpu_sys", "")),
+        ("cpu_efficiency", round(cpu / wall / task.slots, 3) if usage and wall > 0 else ""),
+        ("max_rss", usage.get("max_rss", "")),
+        ("read_blocks", usage.get("read_blocks", "")),
+        ("write_blocks", usage.get("write_blocks", "")),
+    ])
+
+
+def critical_path(tasks, order, profiles):
+    """
+    the chain of tasks with the longest wall time, tasks not run take no time
+    :param tasks: {id: task}
+    :param order: task ids in topological order, see DAG.validate
+    :param profiles: {id: profile}
+    :return: (ids, seconds)
+    """
+    cost = {}
+    prev = {}
+
+    for id in order:
+        task = tasks[id]
+        cost[id] = 0
+        prev[id] = None
+
+        for _id in task.depends:
+            if cost[_id] > cost[id]:
+                cost[id] = cost[_id]
+                prev[id] = _id
+
+        if id in profiles:
+            cost[id] += profiles[id]["wall"]
+
+    if not cost:
+        return [], 0
+
+    id = max(cost, key=lambda i: cost[i])
+    total = cost[id]
+    path = []
+
+    while id:
+        path.append(id)
+        id = prev[id]
+
+    path.reverse()
+
+    return path, total
+
+
+def write_html(profiles, path, filename):
+    """
+    write a gantt chart of tasks
+    :return:
+    """
+    start = min(i["start"] for i in profiles)
+    span = max(max(i["end"] for i in profiles) - start, 1)
+    colors = {"success": "#4c9f70", "failed": "#d1495b"}
+    rows = []
+
+    for i in sorted(profiles, key=lambda x: x["start"]):
+        left = (i["start"] - start) / span * 100
+        width = max(i["wall"] / span * 100, 0.2)
+        title = ", ".join("%s: %s" % (k, i[k]) for k in FIELDS if i[k] != "")
+        color = "#e8a33d" if i["id"] in path else colors.get(i["status"], "#888888")
+
+        rows.append("""\
+<div class="row"><span class="name">{name}</span><div class="lane">\
+<div class="bar" style="left:{left:.3f}%;width:{width:.3f}%;background:{color}" title="{title}"></div>\
+</div></div>""".format(name=html.escape(i["id"]), left=left, width=width, color=color, title=html.escape(title)))
+
+    with open(filename, "w") as fh:
+        fh.write("""\
+<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>timeline</title><style>
+body {{font: 12px sans-serif}}
+.row {{display: flex; height: 16px; margin: 1px 0}}
+.name {{width: 260px; overflow: hidden; white-space: nowrap}}
+.lane {{position: relative; flex: 1; background: #f3f3f3}}
+.bar {{position: absolute; top: 2px; bottom: 2px}}
+</style></head><body>
+<p>{n} tasks, {span} seconds, the critical path is orange</p>
+{rows}
+</body></html>
+""".format(n=len(profiles), span=int(span), rows="\n".join(rows)))
+
+    return filename
+
+
+def write_profile(dag, prefix):
+    """
+    write the timeline of the tasks run to {prefix}.timeline.json, .csv and .html,
+    and log the tasks and stages take the most time
+    :param dag:
+    :param prefix:
+    :return: the profiles of tasks
+    """
+    tasks = [i for i in dag.tasks.values() if i.start_time and i.end_time]
+
+    if not tasks:
+        return []
+
+    # the usage of cluster tasks is asked from the accounting of their schedulers
+    since = min(i.start_time for i in tasks)
+    for type in OrderedDict((i.type, 1) for i in tasks):
+        get_executor(type).accounting([i for i in tasks if i.type == type], since)
+
+    root = os.path.commonpath([i.work_dir for i in dag.tasks.values()])
+    profiles = OrderedDict((i.id, task_profile(i, root)) for i in tasks)
+    path, total = critical_path(dag.tasks, dag.validate(), profiles)
+
+    with open(prefix + ".timeline.json", "w") as fh:
+        json.dump({"dag": dag.id, "critical_path": path, "critical_time": total,
+                   "tasks": list(profiles.values())}, fh, indent=2)
+
+    with open(prefix + ".timeline.csv", "w") as fh:
+        writer = csv.DictWriter(fh, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(profiles.values())
+
+    write_html(list(profiles.values()), path, prefix + ".timeline.html")
+
+    stages = OrderedDict()
+    for i in profiles.values():
+        stages[i["stage"]] = stages.get(i["stage"], 0) + i["wall"]
+
+    LOG.info("Timeline of tasks written to %s.timeline.{json,csv,html}" % prefix)
+    LOG.info("Critical path (%ss): %s" % (int(total), " -> ".join(path)))
+    LOG.info("Wall time by stage: %s" % ", ".join(
+        "%s %ss" % (k or ".", int(v)) for k, v in sorted(stages.items(), key=lambda x: -x[1])))
+
+    for i in sorted(profiles.values(), key=lambda x: -x["wall"])[:5]:
+        LOG.info("task %r: %ss, %s slots, cpu efficiency %s, max rss %s" % (
+            i["id"], int(i["wall"]), i["slots"], i["cpu_efficiency"], i["max_rss"]))
+
+    return profiles
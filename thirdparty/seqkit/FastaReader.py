@@ -5,6 +5,10 @@ import os.path
 
 LOG = logging.getLogger(__name__)
 ALLOWED_FASTA = [".fa", ".fasta", ".fa.gz", ".fasta.gz"]
+# the bytes read from the file at a time by read_fasta
+BLOCK_SIZE = 1 << 22
+# the bytes removed from the sequences, the line ends and spaces
+WHITESPACE = b"\r\n\t "
 
 
 def split_header(name):
@@ -23,8 +27,10 @@ def split_header(name):
 
 class FastaRecord(object):
     """
-    object to process a fasta record
+    object to process a fasta record, the header is split to id and
+    description on the first access
     """
+    __slots__ = ("_name", "_seq", "_id", "_description")
     DELIMITER = ">"
 
     def __init__(self, name, seq):
@@ -34,7 +40,8 @@ class FastaRecord(object):
             assert self.DELIMITER not in seq
             self._name = name
             self._seq = seq
-            self._id, self._description = split_header(name)
+            self._id = None
+            self._description = None
         except AssertionError:
             raise ValueError("Invalid FASTA record data")
 
@@ -51,6 +58,9 @@ class FastaRecord(object):
         The id of the seq, equal to the FASTA header
         up to the first whitespace.
         """
+        if self._id is None:
+            self._id, self._description = split_header(self._name)
+
         return self._id
 
     @property
@@ -59,6 +69,9 @@ class FastaRecord(object):
         The description of the seq in the FASTA file, equal to
         the contents of the FASTA header following the first whitespace
         """
+        if self._description is None:
+            self._id, self._description = split_header(self._name)
+
         return self._description
 
     @property
@@ -102,6 +115,51 @@ class FastaRecord(object):
         return len(self.seq)
 
 
+class FastaBytesRecord(object):
+    """
+    a light fasta record of bytes yielded by read_fasta, the name and seq are
+    decoded only when they are asked, len() and the raw_* bytes are free
+    """
+    __slots__ = ("raw_name", "raw_seq", "_id", "_description")
+
+    def __init__(self, raw_name, raw_seq):
+        self.raw_name = raw_name
+        self.raw_seq = raw_seq
+        self._id = None
+        self._description = None
+
+    def _split_name(self):
+        self._id, self._description = split_header(self.raw_name.decode())
+
+    @property
+    def name(self):
+        return self.raw_name.decode()
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._split_name()
+
+        return self._id
+
+    @property
+    def description(self):
+        if self._description is None:
+            self._split_name()
+
+        return self._description
+
+    @property
+    def seq(self):
+        return self.raw_seq.decode()
+
+    def __str__(self):
+        return ">%s\n%s" % (self.name, self.seq)
+
+    def __len__(self):
+        return len(self.raw_seq)
+
+
 def check_format(filename):
     """
     check the format of file
@@ -140,6 +198,99 @@ def yield_fasta_records(stream):
         yield FastaRecord.from_string(string)
 
 
+def parse_fasta_block(data, validate=False):
+    """
+    parse the complete fasta records in data
+    :param data: bytes starting with ">"
+    :param validate: check the records like FastaRecord
+    :return: a list of FastaBytesRecord
+    """
+    r = []
+
+    for part in data[1:].split(b"\n>"):
+        name, _, seq = part.partition(b"\n")
+        name = name.strip()
+        seq = seq.translate(None, WHITESPACE)
+
+        if validate and (not seq or b">" in seq):
+            raise ValueError("Invalid FASTA record data %r" % name[:50])
+
+        r.append(FastaBytesRecord(name, seq))
+
+    return r
+
+
+def yield_fasta_blocks(stream, validate=False, block_size=BLOCK_SIZE):
+    """
+    yield fasta records from a binary stream read by blocks, the records are
+    split on "\\n>" in one pass and their sequence lines are joined once
+    :param stream: a binary stream object
+    :param validate: see parse_fasta_block
+    :param block_size: see BLOCK_SIZE
+    :return:
+    """
+    pending = []
+    head = True
+
+    while True:
+        block = stream.read(block_size)
+
+        if not block:
+            break
+
+        if head:
+            block = block.lstrip()
+            if not block:
+                continue
+            if block[:1] != b">":
+                raise ValueError("String not recognized as a valid FASTA record")
+            head = False
+
+        # the start of the last record in block, the records before it are complete
+        cut = block.rfind(b"\n>") + 1
+
+        if not cut and not (pending and block[:1] == b">" and pending[-1][-1:] == b"\n"):
+            pending.append(block)
+            continue
+
+        data = b"".join(pending + [block[:cut]]).rstrip()
+        pending = [block[cut:]]
+
+        if data:
+            for record in parse_fasta_block(data, validate):
+                yield record
+
+    data = b"".join(pending).rstrip()
+
+    if data:
+        for record in parse_fasta_block(data, validate):
+            yield record
+
+
+def read_fasta(filename, validate=False, block_size=BLOCK_SIZE):
+    """
+    read fasta file by blocks and return FastaBytesRecord, much faster than
+    open_fasta for large files, see yield_fasta_blocks
+    :param filename:
+    :param validate: check the records like open_fasta
+    :param block_size: see BLOCK_SIZE
+    :return:
+    """
+    check_format(filename)
+    filename = os.path.abspath(filename)
+
+    LOG.info("Parse fasta sequences from %r" % filename)
+
+    if filename.endswith(".gz"):
+        stream = gzip.open(filename, "rb")
+    else:
+        stream = open(filename, "rb")
+
+    with stream:
+        for record in yield_fasta_blocks(stream, validate, block_size):
+            yield record
+
+
 def open_fasta(filename):
     """
     read fasta file and return fasta records
@@ -148,7 +299,7 @@ def open_fasta(filename):
     """
     check_format(filename)
     filename = os.path.abspath(filename)
-    mode = 'r'
+    mode = 'rt'
 
     LOG.info("Parse fasta sequences from %r" % filename)
 
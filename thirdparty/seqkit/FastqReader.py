@@ -1,21 +1,33 @@
 
 import gzip
+import zlib
+import shutil
 import logging
 import os.path
+import subprocess
 
 LOG = logging.getLogger(__name__)
 ALLOWED_FASTQ = [".fq", ".fastq", ".fq.gz", ".fastq.gz"]
+# the records in a batch yielded by read_fastq
+BATCH_SIZE = 10000
+# the bytes read from the file at a time
+BLOCK_SIZE = 1 << 22
+# the decompressors of .gz run in a subprocess, the first found is used, or zlib
+DECOMPRESSORS = [["igzip", "-d", "-c"], ["pigz", "-d", "-c"]]
 
 
 class FastqRecord(object):
     """
     Object to process a fastq record
     """
+    __slots__ = ("_description", "_seq", "_desc2", "_quality", "_id")
+
     def __init__(self, description, seq, desc2, quality):
         self._description = description[1:]
         self._seq = seq
         self._desc2 = desc2
         self._quality = quality
+        self._id = None
 
     @property
     def identifier(self):
@@ -32,7 +44,10 @@ class FastqRecord(object):
         up to the first whitespace.
         :return:
         """
-        return self._description.split()[0]
+        if self._id is None:
+            self._id = self._description.split()[0]
+
+        return self._id
 
     @property
     def seq(self):
@@ -91,6 +106,315 @@ def check_format(filename):
         raise Exception(msg)
 
 
+class FastqBytesRecord(object):
+    """
+    a light fastq record of bytes yielded by FastqBatch, the fields are decoded
+    only when they are asked
+    """
+    __slots__ = ("raw_name", "raw_seq", "raw_quality", "_id")
+
+    def __init__(self, raw_name, raw_seq, raw_quality):
+        self.raw_name = raw_name
+        self.raw_seq = raw_seq
+        self.raw_quality = raw_quality
+        self._id = None
+
+    @property
+    def identifier(self):
+        return self.raw_name[1:].decode()
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = read_id(self.raw_name).decode()
+
+        return self._id
+
+    @property
+    def seq(self):
+        return self.raw_seq.decode()
+
+    @property
+    def quality(self):
+        return self.raw_quality.decode()
+
+    def __str__(self):
+        return "%s\n%s\n+\n%s" % (self.raw_name.decode(), self.seq, self.quality)
+
+    def __len__(self):
+        return len(self.raw_seq)
+
+
+class FastqBatch(object):
+    """
+    a batch of fastq records kept as lists of bytes, the headers (with "@"),
+    sequences and qualities
+    """
+    __slots__ = ("names", "seqs", "quals")
+
+    def __init__(self, names, seqs, quals):
+        self.names = names
+        self.seqs = seqs
+        self.quals = quals
+
+    def ids(self):
+        """
+        the ids of records, see read_id
+        :return: a list of bytes
+        """
+        return [read_id(i) for i in self.names]
+
+    def lengths(self):
+
+        return [len(i) for i in self.seqs]
+
+    def __iter__(self):
+
+        for i in range(len(self.seqs)):
+            yield FastqBytesRecord(self.names[i], self.seqs[i], self.quals[i])
+
+    def __len__(self):
+        return len(self.seqs)
+
+
+def read_id(name):
+    """
+    the id of a fastq header, up to the first whitespace, "@" is not included
+    :param name: bytes
+    :return: bytes
+    """
+    return name[1:].split(None, 1)[0] if len(name) > 1 else b""
+
+
+def pair_id(name):
+    """
+    the id of a read shared by its mate, "/1" and "/2" are removed
+    :param name: bytes
+    :return: bytes
+    """
+    name = read_id(name)
+
+    if name[-2:] in (b"/1", b"/2"):
+        return name[:-2]
+
+    return name
+
+
+class ZlibStream(object):
+    """
+    a binary stream of gzipped file decompressed by zlib, the files of
+    several gzip members (eg: bgzip, cat *.gz) are read to the end
+    """
+
+    def __init__(self, filename, block_size=BLOCK_SIZE):
+        self.fh = open(filename, "rb")
+        self.block_size = block_size
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+
+    def read(self, size=-1):
+
+        while True:
+            data = self.fh.read(self.block_size)
+
+            if not data:
+                if not self.decompressor.eof:
+                    raise IOError("%r is truncated" % self.fh.name)
+                return self.decompressor.flush()
+
+            r = self.decompressor.decompress(data)
+
+            # a new gzip member starts
+            while self.decompressor.eof and self.decompressor.unused_data:
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+                r += self.decompressor.decompress(data)
+
+            if r:
+                return r
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ProcessStream(object):
+    """
+    a binary stream of the output of a decompressor subprocess, an error is
+    raised if it fails
+    """
+
+    def __init__(self, command, filename):
+        self.command = command
+        self.child = subprocess.Popen(command + [filename], stdout=subprocess.PIPE, bufsize=BLOCK_SIZE)
+
+    def read(self, size=-1):
+        return self.child.stdout.read(size)
+
+    def close(self):
+        self.child.stdout.close()
+
+        if self.child.wait():
+            raise IOError("%r exited with %s" % (" ".join(self.command), self.child.returncode))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if args[0] is None:
+            self.close()
+        else:
+            self.child.kill()
+            self.child.stdout.close()
+            self.child.wait()
+
+
+def open_stream(filename, decompress=True):
+    """
+    open a fastq file as binary stream, .gz is read by the DECOMPRESSORS found or zlib
+    :param filename:
+    :param decompress: use the DECOMPRESSORS
+    :return:
+    """
+    if not filename.endswith(".gz"):
+        return open(filename, "rb")
+
+    if decompress:
+        for command in DECOMPRESSORS:
+            if shutil.which(command[0]):
+                LOG.debug("decompress %r by %s" % (filename, command[0]))
+                return ProcessStream(command, filename)
+
+    return ZlibStream(filename)
+
+
+def yield_fastq_batches(stream, batch_size=BATCH_SIZE, validate=False, block_size=BLOCK_SIZE):
+    """
+    yield batches of fastq records from a binary stream, the records are read
+    from blocks split to lines once, and the 4 lines are taken by slices
+    :param stream: a binary stream object
+    :param batch_size: see BATCH_SIZE
+    :param validate: check the lengths of sequences and qualities
+    :param block_size: see BLOCK_SIZE
+    :return: FastqBatch
+    """
+    rest = b""
+    names, seqs, quals = [], [], []
+    end = False
+
+    while not end:
+        block = stream.read(block_size)
+
+        if not block:
+            end = True
+            data = rest + b"\n"
+        else:
+            data = rest + block
+
+        if b"\r" in data:
+            data = data.replace(b"\r", b"")
+
+        lines = data.split(b"\n")
+
+        if b"\n\n" in data or not lines[0]:
+            lines = [i for i in lines[:-1] if i] + lines[-1:]
+
+        # the last line is not complete
+        n = (len(lines) - 1) // 4 * 4
+        rest = b"\n".join(lines[n:])
+
+        _names = lines[0:n:4]
+        _seqs = lines[1:n:4]
+        _quals = lines[3:n:4]
+
+        for i in _names:
+            if i[:1] != b"@":
+                raise ValueError("String not recognized as a valid FASTQ record %r" % i[:50])
+
+        for i in lines[2:n:4]:
+            if i[:1] != b"+":
+                raise ValueError("String not recognized as a valid FASTQ record %r" % i[:50])
+
+        if validate:
+            for i in range(len(_seqs)):
+                if len(_seqs[i]) != len(_quals[i]):
+                    raise ValueError("Invalid FASTQ record %r, the lengths of seq and quality differ" % _names[i][:50])
+
+        names += _names
+        seqs += _seqs
+        quals += _quals
+
+        while len(seqs) >= batch_size or (end and seqs):
+            yield FastqBatch(names[:batch_size], seqs[:batch_size], quals[:batch_size])
+            del names[:batch_size], seqs[:batch_size], quals[:batch_size]
+
+    if rest.strip():
+        raise ValueError("Incomplete FASTQ record at the end %r" % rest[:50])
+
+
+def read_fastq(filename, batch_size=BATCH_SIZE, validate=False, decompress=True):
+    """
+    read fastq file and return FastqBatch of batch_size records
+    :param filename:
+    :param batch_size: see BATCH_SIZE
+    :param validate: see yield_fastq_batches
+    :param decompress: see open_stream
+    :return:
+    """
+    check_format(filename)
+    filename = os.path.abspath(filename)
+
+    LOG.info("Parse fastq sequences from %r" % filename)
+
+    with open_stream(filename, decompress) as stream:
+        for batch in yield_fastq_batches(stream, batch_size, validate):
+            yield batch
+
+
+def read_fastq_records(filename, validate=False, decompress=True):
+    """
+    read fastq file and return FastqBytesRecord
+    :return:
+    """
+    for batch in read_fastq(filename, validate=validate, decompress=decompress):
+        for record in batch:
+            yield record
+
+
+def read_fastq_pairs(filename1, filename2, batch_size=BATCH_SIZE, validate=False, decompress=True):
+    """
+    read the paired fastq files and return the batches of mates (batch1, batch2),
+    an error is raised if the ids of mates differ or a file is shorter
+    :param filename1: R1
+    :param filename2: R2
+    :return:
+    """
+    batches1 = read_fastq(filename1, batch_size, validate, decompress)
+    batches2 = read_fastq(filename2, batch_size, validate, decompress)
+
+    for batch1 in batches1:
+        batch2 = next(batches2, None)
+
+        if batch2 is None or len(batch1) != len(batch2):
+            raise ValueError("The reads of %r and %r are not paired, %r is shorter" % (
+                filename1, filename2, filename2 if batch2 is None or len(batch2) < len(batch1) else filename1))
+
+        for i in range(len(batch1)):
+            if pair_id(batch1.names[i]) != pair_id(batch2.names[i]):
+                raise ValueError("The reads are not paired: %r in %r, %r in %r" % (
+                    batch1.names[i][1:].decode(), filename1, batch2.names[i][1:].decode(), filename2))
+
+        yield batch1, batch2
+
+    if next(batches2, None) is not None:
+        raise ValueError("The reads of %r and %r are not paired, %r is shorter" % (
+            filename1, filename2, filename1))
+
+
 def yield_fastq_records(stream):
     """
     yield fastq records from stream
@@ -125,7 +449,7 @@ def open_fastq(filename):
     check_format(filename)
 
     filename = os.path.abspath(filename)
-    mode = 'r'
+    mode = 'rt'
 
     LOG.info("Parse fastq sequences from %r" % filename)
     if filename.endswith(".gz"):
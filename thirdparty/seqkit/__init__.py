@@ -1,4 +1,5 @@
-from .FastqReader import open_fastq
-from .FastaReader import open_fasta
+from .FastqReader import open_fastq, read_fastq, read_fastq_pairs
+from .FastaReader import open_fasta, read_fasta
+from .faidx import FastaIndex
 from .split import seq_split
 from .stat import seq_stat
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import gzip
+import time
+import random
+import argparse
+import logging
+
+from .FastaReader import open_fasta, read_fasta
+from .FastqReader import FastqBatch, open_fastq, read_fastq
+from .faidx import FastaIndex, load_index
+from .common import __author__, __version__, __email__
+from .common import check_paths, get_seq_format
+
+
+LOG = logging.getLogger(__name__)
+
+READERS = {
+    "fasta": [
+        ("open_fasta", open_fasta),
+        ("read_fasta", read_fasta),
+        ("read_fasta(validate)", lambda x: read_fasta(x, validate=True)),
+    ],
+    "fastq": [
+        ("open_fastq", open_fastq),
+        ("read_fastq", read_fastq),
+        ("read_fastq(validate)", lambda x: read_fastq(x, validate=True)),
+        ("read_fastq(zlib)", lambda x: read_fastq(x, decompress=False)),
+    ],
+}
+
+
+def data_size(filename):
+    """
+    the bytes of data in file, uncompressed if it is gzipped
+    :param filename:
+    :return:
+    """
+    r = 0
+
+    with (gzip.open(filename, "rb") if filename.endswith(".gz") else open(filename, "rb")) as fh:
+        while True:
+            block = fh.read(1 << 22)
+            if not block:
+                break
+            r += len(block)
+
+    return r
+
+
+def run_reader(reader, filename):
+    """
+    read all records of filename by reader, the readers yield records or FastqBatch
+    :return: (seconds, records, bases)
+    """
+    records = 0
+    bases = 0
+    start = time.time()
+
+    for record in reader(filename):
+        if isinstance(record, FastqBatch):
+            records += len(record)
+            bases += sum(record.lengths())
+        else:
+            records += 1
+            bases += len(record)
+
+    return time.time() - start, records, bases
+
+
+def benchmark(filenames, repeat=3):
+    """
+    time the readers on files, the best of repeat runs is kept
+    :param filenames:
+    :param repeat:
+    :return: [(filename, reader, seconds, MB/s), ...]
+    """
+    r = []
+
+    print("%-30s\t%-22s\t%10s\t%12s\t%8s\t%8s" % ("#file", "reader", "records", "bases", "seconds", "MB/s"))
+
+    for filename in filenames:
+        prefix, fmt = get_seq_format(filename)
+        size = data_size(filename)
+
+        for name, reader in READERS.get(fmt, []):
+            seconds, records, bases = min(run_reader(reader, filename) for i in range(repeat))
+            speed = size / 1e6 / seconds if seconds else 0
+
+            print("%-30s\t%-22s\t%10s\t%12s\t%8.2f\t%8.1f" % (
+                filename.split("/")[-1], name, records, bases, seconds, speed))
+            r.append((filename, name, seconds, speed))
+
+    return r
+
+
+class RecordIndex(object):
+    """
+    fetch the regions by reading the whole record at its offset, like Bio.SeqIO.index
+    """
+
+    def __init__(self, filename):
+        self.offsets = {}
+        self.fh = open(filename, "rb")
+        pos = 0
+
+        for line in self.fh:
+            if line.startswith(b">"):
+                self.offsets[line[1:].split(None, 1)[0].decode()] = pos
+            pos += len(line)
+
+    def fetch(self, seqid, start, end):
+        self.fh.seek(self.offsets[seqid])
+        self.fh.readline()
+        lines = []
+
+        for line in self.fh:
+            if line.startswith(b">"):
+                break
+            lines.append(line.rstrip())
+
+        return b"".join(lines)[start - 1:end]
+
+    def close(self):
+        self.fh.close()
+
+
+def benchmark_fetch(filenames, number, length=1000):
+    """
+    time the fetch of number random regions (like the genes) from fasta files,
+    the index is built before (genome.fai), the regions are sorted like a gff
+    :param filenames:
+    :param number:
+    :param length: the length of regions
+    :return: [(filename, reader, seconds, regions/s), ...]
+    """
+    r = []
+
+    print("%-30s\t%-22s\t%10s\t%12s\t%8s\t%10s\t%8s" % (
+        "#file", "index", "regions", "bases", "seconds", "regions/s", "MB/s"))
+
+    for filename in filenames:
+        index = load_index(filename)
+        regions = []
+
+        for i in range(number):
+            seqid = random.choice(list(index.keys()))
+            start = random.randint(1, max(index[seqid][0] - length, 1))
+            regions.append((seqid, start, start + length - 1))
+
+        regions.sort(key=lambda x: list(index.keys()).index(x[0]))
+
+        for name, reader in [("FastaIndex(mmap)", FastaIndex), ("record index", RecordIndex)]:
+            start = time.time()
+            fasta = reader(filename)
+            bases = sum(len(fasta.fetch(*i)) for i in regions)
+            fasta.close()
+            seconds = time.time() - start
+
+            print("%-30s\t%-22s\t%10s\t%12s\t%8.2f\t%10.0f\t%8.1f" % (
+                filename.split("/")[-1], name, len(regions), bases, seconds, len(regions) / seconds,
+                bases / 1e6 / seconds))
+            r.append((filename, name, seconds, len(regions) / seconds))
+
+    return r
+
+
+def benchmark_args(parser):
+
+    parser.add_argument("input", metavar='FILEs', nargs="+", help="files, '.gz' is accepted")
+    parser.add_argument("-r", "--repeat", metavar="INT", type=int, default=3,
+                        help="runs of each reader, the best is shown (default: 3)")
+    parser.add_argument("--fetch", metavar="INT", type=int, default=0,
+                        help="time the fetch of INT random regions of 1 kb from fasta files instead")
+
+    return parser
+
+
+def main():
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.WARNING,
+        format="[%(levelname)s] %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description="""
+Compare the speed (MB/s of uncompressed data) of sequence readers
+
+version: %s
+contact: %s <%s>\
+""" % (__version__, " ".join(__author__), __email__))
+
+    args = benchmark_args(parser).parse_args()
+    filenames = [check_paths(i) for i in args.input]
+
+    if args.fetch:
+        benchmark_fetch(filenames, args.fetch)
+    else:
+        benchmark(filenames, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
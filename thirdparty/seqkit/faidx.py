@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Random access to the sequences of FASTA file by the index of samtools faidx
+(.fai), the regions are read from the file mapped by mmap, so the contigs are
+never loaded whole. The files can not be indexed (gzipped, or the lines of a
+sequence have different lengths) are loaded in memory, see open_index.
+
+The .fai has one line for each sequence:
+NAME    LENGTH    OFFSET    LINEBASES    LINEWIDTH
+"""
+
+import os
+import mmap
+import logging
+from collections import OrderedDict
+
+from .FastaReader import read_fasta
+
+
+LOG = logging.getLogger(__name__)
+
+
+def build_index(filename):
+    """
+    index the sequences of fasta file like "samtools faidx", the lines of a
+    sequence must have the same length except the last one
+    :param filename:
+    :return: OrderedDict {name: (length, offset, linebases, linewidth)}
+    """
+    r = OrderedDict()
+    name = None
+    length = offset = linebases = linewidth = 0
+    short = False
+
+    def add():
+        if name in r:
+            raise ValueError("Duplicate sequence %r in %r" % (name, filename))
+        r[name] = (length, offset, linebases, linewidth)
+
+    with open(filename, "rb") as fh:
+        pos = 0
+
+        for line in fh:
+            size = len(line)
+            pos += size
+
+            if line.startswith(b">"):
+                if name is not None:
+                    add()
+                name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ""
+                length = linebases = linewidth = 0
+                offset = pos
+                short = False
+                continue
+
+            bases = len(line.rstrip(b"\r\n"))
+
+            if name is None:
+                if line.strip():
+                    raise ValueError("String not recognized as a valid FASTA record in %r" % filename)
+                continue
+
+            if not bases:
+                short = True
+                continue
+
+            # the lines before must be full
+            if short or (linebases and bases > linebases):
+                raise ValueError("Different line length in sequence %r of %r" % (name, filename))
+
+            if not linebases:
+                linebases, linewidth = bases, size
+            elif bases < linebases or size != linewidth:
+                short = True
+
+            length += bases
+
+        if name is not None:
+            add()
+
+    return r
+
+
+def write_index(index, filename):
+    """
+    write the index to filename (.fai), it is replaced at once so it can
+    be read by other processes while it is written
+    :param index: see build_index
+    :param filename:
+    :return: filename
+    """
+    temp = "%s.%s.tmp" % (filename, os.getpid())
+
+    with open(temp, "w") as fh:
+        for name, (length, offset, linebases, linewidth) in index.items():
+            fh.write("%s\t%s\t%s\t%s\t%s\n" % (name, length, offset, linebases, linewidth))
+
+    os.replace(temp, filename)
+
+    return filename
+
+
+def read_index(filename):
+    """
+    read the index (.fai)
+    :param filename:
+    :return: see build_index
+    """
+    r = OrderedDict()
+
+    with open(filename) as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+
+            if not line:
+                continue
+
+            name, length, offset, linebases, linewidth = line.split("\t")[:5]
+            r[name] = (int(length), int(offset), int(linebases), int(linewidth))
+
+    return r
+
+
+def load_index(filename):
+    """
+    the index of fasta file, filename.fai is built if it does not exist or
+    is older than the fasta file, it is kept in memory if the directory is
+    not writable
+    :param filename:
+    :return: see build_index
+    """
+    fai = filename + ".fai"
+
+    if os.path.exists(fai) and os.path.getmtime(fai) >= os.path.getmtime(filename):
+        return read_index(fai)
+
+    LOG.info("Index fasta sequences of %r" % filename)
+    r = build_index(filename)
+
+    try:
+        write_index(r, fai)
+    except (IOError, OSError) as e:
+        LOG.warning("The index of %r is not saved: %s" % (filename, e))
+
+    return r
+
+
+class FastaIndex(object):
+    """
+    fetch the regions of sequences in an indexed fasta file
+    """
+
+    def __init__(self, filename):
+
+        if filename.endswith(".gz"):
+            raise ValueError("%r is compressed, can not be read by index" % filename)
+
+        self.filename = os.path.abspath(filename)
+        self.index = load_index(self.filename)
+        self.fh = open(self.filename, "rb")
+
+        if os.path.getsize(self.filename):
+            self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = b""
+
+    def offset(self, seqid, position):
+        """
+        the offset in file of base at position (0-based) of sequence
+        """
+        length, offset, linebases, linewidth = self.index[seqid]
+
+        return offset + position // linebases * linewidth + position % linebases
+
+    def fetch(self, seqid, start=1, end=None):
+        """
+        fetch the region start..end (1-based, included) of sequence, like
+        "samtools faidx seqid:start-end", the region is cut to the sequence
+        :param seqid:
+        :param start:
+        :param end: the end of sequence if None
+        :return: bytes
+        """
+        length = self.index[seqid][0]
+
+        start = max(start, 1) - 1
+        end = length if end is None else min(end, length)
+
+        if start >= end:
+            return b""
+
+        return self.mm[self.offset(seqid, start): self.offset(seqid, end - 1) + 1].translate(None, b"\r\n")
+
+    def length(self, seqid):
+
+        return self.index[seqid][0]
+
+    def keys(self):
+
+        return list(self.index.keys())
+
+    def close(self):
+
+        if self.mm:
+            self.mm.close()
+        self.fh.close()
+
+    def __contains__(self, seqid):
+        return seqid in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FastaMemory(FastaIndex):
+    """
+    fetch the regions of sequences loaded in memory, for the fasta files can
+    not be indexed
+    """
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.seqs = OrderedDict()
+
+        for record in read_fasta(self.filename):
+            if record.id in self.seqs:
+                raise ValueError("Duplicate sequence %r in %r" % (record.id, filename))
+            self.seqs[record.id] = record.raw_seq
+
+        self.index = OrderedDict((i, (len(j), 0, 0, 0)) for i, j in self.seqs.items())
+
+    def fetch(self, seqid, start=1, end=None):
+        """
+        see FastaIndex.fetch
+        """
+        length = self.index[seqid][0]
+
+        start = max(start, 1) - 1
+        end = length if end is None else min(end, length)
+
+        if start >= end:
+            return b""
+
+        return self.seqs[seqid][start:end]
+
+    def close(self):
+
+        self.seqs = OrderedDict()
+
+
+def open_index(filename):
+    """
+    the FastaIndex of fasta file, or its sequences loaded in memory if it can not
+    be indexed, like Bio.SeqIO.index the lines of sequences can have any length
+    :param filename:
+    :return: FastaIndex or FastaMemory object
+    """
+    try:
+        return FastaIndex(filename)
+    except ValueError as e:
+        LOG.warning("%s, the sequences are loaded in memory" % e)
+
+    return FastaMemory(filename)
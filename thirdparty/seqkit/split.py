@@ -10,7 +10,7 @@ from multiprocessing import Pool
 
 from .common import fofn2list, mkdir, touch, get_seq_format
 from .FastaReader import open_fasta
-from .FastqReader import open_fastq
+from .FastqReader import read_fastq_records
 from .common import __author__, __version__, __email__
 
 
@@ -104,7 +104,7 @@ def split_file(filename, index, mode, number, out_dir="split"):
         else:
             prefix = "%s_{num}.fastq" % prefix
 
-        r = split_record(open_fastq(filename), mode=mode, number=number,
+        r = split_record(read_fastq_records(filename), mode=mode, number=number,
                          out_fmt=prefix, out_bed=False, out_dir=out_dir)
     else:
         LOG.info("??? seq format")  # will raise exception in get_seq_format
@@ -129,8 +129,8 @@ def seq_split(filenames, mode, num, output_dir, concurrent=1):
     split_list = os.path.join(output_dir, "split_list")
     done = os.path.join(output_dir, "split_done")
 
-    # avoid rerun
-    if os.path.exists(done):
+    # avoid rerun, the files split may be removed as temporary files after use
+    if os.path.exists(done) and all(os.path.exists(i) for i in fofn2list(split_list)):
         LOG.info("%r exists, pass this step; if you want to rerun, delete the file" % done)
         return fofn2list(split_list)
 
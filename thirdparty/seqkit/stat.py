@@ -5,8 +5,8 @@ import argparse
 import logging
 from multiprocessing import Pool
 
-from .FastqReader import open_fastq
-from .FastaReader import open_fasta
+from .FastqReader import read_fastq
+from .FastaReader import read_fasta
 from .common import __author__, __version__, __email__
 from .common import get_seq_format
 
@@ -27,17 +27,15 @@ def get_length(filename, index, min_len):
     prefix, fmt = get_seq_format(filename)
 
     if fmt == "fasta":
-        records = open_fasta(filename)
+        for record in read_fasta(filename):
+            length = len(record)
+            if length >= min_len:
+                r.append(length)
     elif fmt == "fastq":
-        records = open_fastq(filename)
+        for batch in read_fastq(filename):
+            r += [i for i in batch.lengths() if i >= min_len]
     else:
         LOG.info("%r is not a valid seq format!" % filename)
-        records = []
-
-    for record in records:
-        length = len(record)
-        if length >= min_len:
-            r.append(length)
 
     return r
 